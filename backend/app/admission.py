@@ -0,0 +1,251 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter as Tally, deque
+from contextlib import asynccontextmanager
+
+from app.deadline import remaining, within
+from app.llm import llm_client
+from app.metrics import Counter, Gauge, Histogram, record_timing
+
+
+# ============================
+# Config
+# ============================
+# generations admitted at once; 0 follows the LLM slots of the nodes in rotation
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "0"))
+# requests waiting for a slot before new ones are refused with 429
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "32"))
+# per API key: generations running at once and requests waiting; 0 = no quota
+ADMISSION_KEY_CONCURRENCY = int(os.getenv("ADMISSION_KEY_CONCURRENCY", "0"))
+ADMISSION_KEY_QUEUE = int(os.getenv("ADMISSION_KEY_QUEUE", "0"))
+# slots batch traffic leaves free so an interactive request can start at once
+ADMISSION_INTERACTIVE_RESERVE = int(os.getenv("ADMISSION_INTERACTIVE_RESERVE", "1"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# served in this order
+LANES = (INTERACTIVE, BATCH)
+
+
+class Overloaded(Exception):
+    """Refused before reaching the LLM; retry after retry_after seconds."""
+
+    check = "overloaded"
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ============================
+# Metrics
+# ============================
+ADMISSION_WAIT_SECONDS = Histogram(
+    "sqlgen_admission_wait_seconds",
+    "Time a generation waited for an admission slot, by lane.",
+    ("lane",),
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "sqlgen_admission_queue_depth",
+    "Requests waiting for an admission slot, by lane.",
+    ("lane",),
+)
+ADMISSION_REJECTED = Counter(
+    "sqlgen_admission_rejected_total",
+    "Requests refused with 429, by lane and reason.",
+    ("lane", "reason"),
+)
+
+
+# ============================
+# Admission controller
+# ============================
+class _Waiter:
+    __slots__ = ("key", "lane", "future", "enqueued")
+
+    def __init__(self, key: str, lane: str):
+        self.key = key
+        self.lane = lane
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    """Bounded queue in front of the generation pipeline.
+
+    At most `concurrency` generations run at once; the rest wait in
+    their lane, interactive before batch, first come first served
+    within a lane. A request that finds the queue full, its API key
+    over quota, or no chance of starting before its deadline is refused
+    with a Retry-After from the measured service rate instead of piling
+    up until it times out.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = ADMISSION_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE,
+        key_concurrency: int = ADMISSION_KEY_CONCURRENCY,
+        key_queue: int = ADMISSION_KEY_QUEUE,
+        reserve: int = ADMISSION_INTERACTIVE_RESERVE,
+    ):
+        self._concurrency = concurrency
+        self.queue_size = queue_size
+        self.key_concurrency = key_concurrency
+        self.key_queue = key_queue
+        self.reserve = reserve
+        self._queues: dict[str, deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._running = 0
+        self._running_by_key: Tally[str] = Tally()
+        self._waiting_by_key: Tally[str] = Tally()
+        self.admitted = 0
+        self.rejected: Tally[str] = Tally()
+        # moving averages: slot hold time, and queue wait per lane
+        self._service_seconds: float | None = None
+        self._wait_seconds: dict[str, float | None] = {lane: None for lane in LANES}
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency or max(1, llm_client.capacity)
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _limit(self, lane: str) -> int:
+        if lane == INTERACTIVE:
+            return self.concurrency
+        return max(1, self.concurrency - self.reserve)
+
+    def _can_start(self, key: str, lane: str) -> bool:
+        if self._running >= self._limit(lane):
+            return False
+        return not self.key_concurrency or self._running_by_key[key] < self.key_concurrency
+
+    def _ahead(self, lane: str) -> int:
+        # batch waits behind every queued request, interactive only behind its own lane
+        return len(self._queues[INTERACTIVE]) if lane == INTERACTIVE else self.waiting
+
+    @property
+    def service_seconds(self) -> float:
+        """Typical time a generation holds its slot."""
+        return self._service_seconds or llm_client.expected_seconds or 1.0
+
+    def expected_wait(self, ahead: int) -> float:
+        """Seconds until a request with `ahead` requests queued before it gets a slot."""
+        if not ahead and self._running < self.concurrency:
+            return 0.0
+        return (ahead + 1) * self.service_seconds / self.concurrency
+
+    def _refused(self, lane: str, reason: str, message: str) -> Overloaded:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.inc(lane=lane, reason=reason)
+        retry_after = max(1, math.ceil(self.expected_wait(self._ahead(lane))))
+        return Overloaded(f"{message}; retry in {retry_after}s", retry_after)
+
+    def check(self, key: str, lane: str = INTERACTIVE) -> None:
+        """Raise Overloaded when a new request would be refused right now."""
+        if self.waiting >= self.queue_size:
+            raise self._refused(lane, "queue_full", f"Server busy: {self.waiting} requests queued")
+        if self.key_queue and self._waiting_by_key[key] >= self.key_queue:
+            raise self._refused(lane, "key_quota", f"Too many queued requests for this API key ({self.key_queue})")
+        # queued work that would time out anyway is not worth the LLM's time
+        left = remaining()
+        wait = self.expected_wait(self._ahead(lane))
+        if left is not None and wait and wait + self.service_seconds > left:
+            raise self._refused(lane, "deadline", "Server busy: the request could not finish before its deadline")
+
+    @asynccontextmanager
+    async def slot(self, key: str, lane: str = INTERACTIVE):
+        """Hold one generation slot, waiting in the lane's queue for it.
+
+        Raises Overloaded when refused, DeadlineExceeded when the request
+        deadline passes in the queue.
+        """
+        self.check(key, lane)
+        waiter = _Waiter(key, lane)
+        self._queues[lane].append(waiter)
+        self._waiting_by_key[key] += 1
+        self._dispatch()
+        try:
+            await within("admission", waiter.future)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # started just as the caller gave up
+                self._release(key, None)
+            else:
+                self._queues[lane].remove(waiter)
+                self._unwait(key)
+                self._publish()
+            raise
+
+        started = time.monotonic()
+        waited = started - waiter.enqueued
+        ADMISSION_WAIT_SECONDS.observe(waited, lane=lane)
+        record_timing("admission", waited)
+        self._wait_seconds[lane] = _average(self._wait_seconds[lane], waited)
+        try:
+            yield
+        finally:
+            self._release(key, time.monotonic() - started)
+
+    def _dispatch(self) -> None:
+        for lane in LANES:
+            queue = self._queues[lane]
+            for waiter in list(queue):
+                if self._running >= self.concurrency:
+                    break
+                # cancelled: its owner removes it once it runs again
+                if waiter.future.cancelled():
+                    continue
+                if self._can_start(waiter.key, lane):
+                    queue.remove(waiter)
+                    self._unwait(waiter.key)
+                    self._running += 1
+                    self._running_by_key[waiter.key] += 1
+                    self.admitted += 1
+                    waiter.future.set_result(None)
+        self._publish()
+
+    def _unwait(self, key: str) -> None:
+        self._waiting_by_key[key] -= 1
+        if not self._waiting_by_key[key]:
+            del self._waiting_by_key[key]
+
+    def _release(self, key: str, seconds: float | None) -> None:
+        self._running -= 1
+        self._running_by_key[key] -= 1
+        if not self._running_by_key[key]:
+            del self._running_by_key[key]
+        if seconds is not None:
+            self._service_seconds = _average(self._service_seconds, seconds)
+        self._dispatch()
+
+    def _publish(self) -> None:
+        for lane, queue in self._queues.items():
+            ADMISSION_QUEUE_DEPTH.set(len(queue), lane=lane)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "queue_size": self.queue_size,
+            "waiting": {lane: len(q) for lane, q in self._queues.items()},
+            "api_keys": len(self._running_by_key.keys() | self._waiting_by_key.keys()),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_wait_seconds": dict(self._wait_seconds),
+            "avg_service_seconds": self._service_seconds,
+            "expected_wait_seconds": {lane: self.expected_wait(self._ahead(lane)) for lane in LANES},
+        }
+
+
+def _average(current: float | None, value: float) -> float:
+    return value if current is None else current + 0.2 * (value - current)
+
+
+admission = AdmissionController()
+
+Gauge("sqlgen_admission_running", "Generations holding an admission slot.", callback=lambda: admission._running)
@@ -0,0 +1,391 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.errors import ParseError
+from sqlglot.tokens import TokenType
+
+from app.intent import Pattern
+
+
+DISALLOWED = frozenset({
+    "delete", "update", "insert",
+    "drop", "truncate", "alter", "create"
+})
+
+# map request database names to sqlglot dialects
+SQLGLOT_DIALECTS = {
+    "mysql": "mysql",
+    "postgresql": "postgres",
+    "sqlserver": "tsql",
+    "sqlite": "sqlite",
+}
+
+
+def sqlglot_dialect(database: str | None) -> str | None:
+    return SQLGLOT_DIALECTS.get((database or "").lower())
+
+
+# ============================
+# Analysis result
+# ============================
+@dataclass(frozen=True)
+class ScopeColumns:
+    """Unqualified columns of one SELECT and the sources they could come from."""
+    columns: tuple[str, ...]
+    tables: tuple[str, ...]
+    # FROM/JOIN entries that are subqueries, CTEs or table functions
+    derived: int
+
+
+@dataclass(frozen=True)
+class SQLAnalysis:
+    statement_type: str | None = None
+    statement_count: int = 0
+    destructive: tuple[str, ...] = ()
+    parse_error: str | None = None
+    # syntax sqlglot accepts but the target database does not
+    dialect_issues: tuple[str, ...] = ()
+
+    tables: tuple[str, ...] = ()
+    aliases: frozenset[str] = frozenset()
+    # table alias -> base table, e.g. ("u", "users")
+    alias_tables: tuple[tuple[str, str], ...] = ()
+    projection_aliases: frozenset[str] = frozenset()
+    qualified: tuple[tuple[str, str], ...] = ()
+    scopes: tuple[ScopeColumns, ...] = ()
+    has_subquery: bool = False
+
+    window_functions: frozenset[str] = frozenset()
+    partition_by: bool = False
+    order_by: bool = False
+    joins: tuple[str, ...] = ()
+    limit: bool = False
+    not_in: bool = False
+    with_clause: bool = False
+    count_distinct: bool = False
+    coalesce: bool = False
+
+
+@dataclass(frozen=True)
+class Finding:
+    # "statement" | "schema" | "pattern"
+    check: str
+    code: str
+    message: str
+    details: tuple[str, ...] = field(default=())
+
+
+# ============================
+# Single pass over tokens + AST
+# ============================
+def _error_text(e: Exception) -> str:
+    # ParseError's str() embeds the highlighted SQL with ANSI codes
+    if isinstance(e, ParseError) and e.errors:
+        err = e.errors[0]
+        return f"{err.get('description')} (line {err.get('line')}, col {err.get('col')})"
+    return str(e)
+
+
+def _sources(select: exp.Select) -> list[exp.Expression]:
+    sources = []
+    from_ = select.args.get("from_") or select.args.get("from")
+    if from_ is not None and from_.this is not None:
+        sources.append(from_.this)
+    for j in select.args.get("joins") or []:
+        sources.append(j.this)
+    return sources
+
+
+@lru_cache(maxsize=512)
+def analyze_sql(sql: str, dialect: str | None = None) -> SQLAnalysis:
+    """Tokenize and parse `sql` once and collect every fact the checks need.
+
+    Results are memoized, so the statement, schema and pattern checks
+    share one parse of the same SQL.
+    """
+    d = Dialect.get_or_raise(dialect)
+    text = sql or ""
+
+    try:
+        tokens = d.tokenize(text)
+    except Exception as e:
+        return SQLAnalysis(parse_error=_error_text(e))
+
+    # ---- statement level (tokens) ----
+    statement_type = tokens[0].text.lower() if tokens else None
+    statement_count = 0
+    pending = False
+    destructive = []
+    for t in tokens:
+        if t.token_type == TokenType.SEMICOLON:
+            statement_count += pending
+            pending = False
+            continue
+        pending = True
+        if t.token_type not in (TokenType.STRING, TokenType.IDENTIFIER) and t.text.lower() in DISALLOWED:
+            destructive.append(t.text.lower())
+    statement_count += pending
+
+    dialect_issues = []
+    if dialect == "tsql" and any(t.token_type == TokenType.LIMIT for t in tokens):
+        dialect_issues.append("SQL Server does not support LIMIT; use TOP n.")
+
+    facts = dict(
+        statement_type=statement_type,
+        statement_count=statement_count,
+        destructive=tuple(destructive),
+        dialect_issues=tuple(dialect_issues),
+    )
+
+    try:
+        trees = [t for t in d.parser().parse(tokens, text) if t is not None]
+    except Exception as e:
+        return SQLAnalysis(parse_error=_error_text(e), **facts)
+    if not trees:
+        return SQLAnalysis(**facts)
+
+    # ---- everything else (AST) ----
+    tree = trees[0]
+    cte_names = {c.alias.lower() for c in tree.find_all(exp.CTE) if c.alias}
+    aliases = set(cte_names)
+    alias_tables = []
+    tables = []
+    for t in tree.find_all(exp.Table):
+        name = t.name.lower()
+        if t.alias:
+            aliases.add(t.alias.lower())
+            if name not in cte_names:
+                alias_tables.append((t.alias.lower(), name))
+        if name and name not in cte_names:
+            tables.append(name)
+    for sq in tree.find_all(exp.Subquery):
+        if sq.alias:
+            aliases.add(sq.alias.lower())
+
+    projection_aliases = frozenset(a.alias.lower() for a in tree.find_all(exp.Alias) if a.alias)
+
+    qualified = []
+    scope_columns: dict[int, list[str]] = {}
+    scope_nodes: dict[int, exp.Select] = {}
+    for c in tree.find_all(exp.Column):
+        if isinstance(c.this, exp.Star):
+            continue
+        name = c.name.lower()
+        if c.table:
+            qualified.append((c.table.lower(), name))
+            continue
+        if name in projection_aliases:
+            continue
+        select = c.find_ancestor(exp.Select)
+        if select is None:
+            continue
+        scope_columns.setdefault(id(select), []).append(name)
+        scope_nodes[id(select)] = select
+
+    scopes = []
+    for key, columns in scope_columns.items():
+        base, derived = [], 0
+        for src in _sources(scope_nodes[key]):
+            if isinstance(src, exp.Table) and src.name.lower() not in cte_names:
+                base.append(src.name.lower())
+            else:
+                derived += 1
+        scopes.append(ScopeColumns(tuple(columns), tuple(base), derived))
+
+    window_functions = set()
+    partition_by = False
+    for w in tree.find_all(exp.Window):
+        if w.this is not None:
+            window_functions.add(w.this.key)
+        partition_by = partition_by or bool(w.args.get("partition_by"))
+
+    joins = []
+    for j in tree.find_all(exp.Join):
+        joins.append((j.side or j.kind or "inner").lower())
+
+    return SQLAnalysis(
+        tables=tuple(tables),
+        aliases=frozenset(aliases),
+        alias_tables=tuple(alias_tables),
+        projection_aliases=projection_aliases,
+        qualified=tuple(qualified),
+        scopes=tuple(scopes),
+        has_subquery=tree.find(exp.Subquery) is not None or bool(cte_names),
+        window_functions=frozenset(window_functions),
+        partition_by=partition_by,
+        order_by=tree.find(exp.Order) is not None,
+        joins=tuple(joins),
+        limit=tree.find(exp.Limit, exp.Fetch) is not None,
+        not_in=any(isinstance(n.this, exp.In) for n in tree.find_all(exp.Not)),
+        with_clause=tree.find(exp.With) is not None,
+        count_distinct=any(isinstance(c.this, exp.Distinct) for c in tree.find_all(exp.Count)),
+        coalesce=tree.find(exp.Coalesce) is not None,
+        **facts,
+    )
+
+
+# ============================
+# Checks
+# ============================
+def check_statement(a: SQLAnalysis) -> list[Finding]:
+    if a.statement_type is None:
+        if a.parse_error:
+            return [Finding("statement", "syntax", f"Invalid SQL syntax: {a.parse_error}")]
+        return [Finding("statement", "empty", "Empty SQL")]
+    if a.statement_type != "select":
+        return [Finding("statement", "not_select", "Only SELECT statements allowed")]
+    if a.destructive:
+        return [Finding("statement", "destructive", "Destructive SQL not allowed", a.destructive)]
+    if a.statement_count > 1:
+        return [Finding("statement", "multiple_statements", "Multiple statements detected")]
+    # a single SELECT sqlglot cannot parse (a vendor extension) is let through:
+    # the token checks above still ran, and the database has the last word
+    if a.dialect_issues:
+        return [Finding("statement", "dialect", " ".join(a.dialect_issues))]
+    return []
+
+
+def check_references(
+    a: SQLAnalysis,
+    tables: dict[str, set[str]],
+    ambiguous: frozenset[str] | None = None,
+) -> list[Finding]:
+    if not tables or a.parse_error:
+        return []
+    findings: list[Finding] = []
+
+    unknown_tables = sorted({t for t in a.tables if t not in tables and t not in a.aliases})
+    if unknown_tables:
+        findings.append(Finding(
+            "schema", "unknown_table",
+            f"Unknown table(s) referenced: {', '.join(unknown_tables)}",
+            tuple(unknown_tables),
+        ))
+
+    alias_map: dict[str, set[str]] = {}
+    for alias, base in a.alias_tables:
+        alias_map.setdefault(alias, set()).add(base)
+
+    for tbl, col in a.qualified:
+        if tbl in alias_map:
+            bases = [tables[b] for b in alias_map[tbl] if b in tables]
+            if bases and not any(col in cols for cols in bases):
+                findings.append(Finding(
+                    "schema", "unknown_column",
+                    f"Unknown column '{col}' in table '{tbl}'", (tbl, col),
+                ))
+            continue
+        if tbl in a.aliases:
+            continue
+        if tbl not in tables:
+            findings.append(Finding(
+                "schema", "unknown_qualifier",
+                f"Unknown table in column reference: {tbl}.{col}", (tbl, col),
+            ))
+        elif col not in tables[tbl]:
+            findings.append(Finding(
+                "schema", "unknown_column",
+                f"Unknown column '{col}' in table '{tbl}'", (tbl, col),
+            ))
+
+    if ambiguous is None:
+        counts: dict[str, int] = {}
+        for cols in tables.values():
+            for c in cols:
+                counts[c] = counts.get(c, 0) + 1
+        ambiguous = frozenset(c for c, n in counts.items() if n > 1)
+
+    flagged: set[str] = set()
+    unknown_bare: set[str] = set()
+    for scope in a.scopes:
+        if len(scope.tables) + scope.derived > 1:
+            candidates = set(ambiguous)
+            # in a self-join every column of the repeated table is ambiguous
+            for t in {t for t in scope.tables if scope.tables.count(t) > 1}:
+                candidates |= tables.get(t, set())
+            flagged |= {c for c in scope.columns if c in candidates}
+        elif len(scope.tables) == 1 and not a.has_subquery:
+            known = tables.get(scope.tables[0])
+            if known is not None:
+                unknown_bare |= {c for c in scope.columns if c not in known}
+
+    for c in sorted(flagged):
+        findings.append(Finding(
+            "schema", "ambiguous_column",
+            f"Ambiguous unqualified column '{c}' in multi-table query", (c,),
+        ))
+    if unknown_bare:
+        findings.append(Finding(
+            "schema", "unknown_column",
+            "Unknown column(s) in single-table query: " + ", ".join(sorted(unknown_bare)),
+            tuple(sorted(unknown_bare)),
+        ))
+
+    return findings
+
+
+def check_patterns(a: SQLAnalysis, patterns: set[Pattern]) -> list[Finding]:
+    findings: list[Finding] = []
+
+    def fail(pattern: str, message: str):
+        findings.append(Finding("pattern", pattern, message))
+
+    # ---- GLOBAL SAFETY ----
+    if a.not_in:
+        fail("NOT_IN", "NOT IN is forbidden (NULL semantics).")
+
+    # ---- TOP PER GROUP ----
+    if Pattern.TOP_PER_GROUP in patterns:
+        if not ({"rank", "denserank"} & a.window_functions):
+            fail(Pattern.TOP_PER_GROUP.value, "TOP_PER_GROUP: DENSE_RANK() or RANK() required.")
+        if not a.partition_by:
+            fail(Pattern.TOP_PER_GROUP.value, "TOP_PER_GROUP: PARTITION BY required.")
+        if not a.order_by:
+            fail(Pattern.TOP_PER_GROUP.value, "TOP_PER_GROUP: ORDER BY required.")
+
+    # ---- ALL TIES REQUIRED ----
+    if Pattern.REQUIRE_ALL_TIES in patterns and a.limit:
+        fail(
+            Pattern.REQUIRE_ALL_TIES.value,
+            "REQUIRE_ALL_TIES: LIMIT / FETCH FIRST is forbidden. "
+            "All ties must be returned."
+        )
+
+    # ---- DISTINCT DATE ----
+    if Pattern.DISTINCT_DATE in patterns and not a.count_distinct:
+        fail(Pattern.DISTINCT_DATE.value, "DISTINCT_DATE: COUNT(DISTINCT date_column) is required.")
+
+    # ---- ZERO ROW / ALL USERS ----
+    if Pattern.ZERO_ROW in patterns or Pattern.ALL_USERS in patterns:
+        if "left" not in a.joins:
+            fail(Pattern.ZERO_ROW.value, "ZERO_ROW / ALL_USERS: LEFT JOIN is required.")
+        if not a.coalesce:
+            fail(Pattern.ZERO_ROW.value, "ZERO_ROW / ALL_USERS: COALESCE is required.")
+
+    # ---- SIMPLE SELECT ----
+    if Pattern.SIMPLE_SELECT in patterns and a.with_clause:
+        fail(Pattern.SIMPLE_SELECT.value, "SIMPLE_SELECT: WITH clause is not allowed.")
+
+    return findings
+
+
+def validate(
+    sql: str,
+    tables: dict[str, set[str]] | None = None,
+    ambiguous: frozenset[str] | None = None,
+    patterns: set[Pattern] | None = None,
+    dialect: str | None = None,
+) -> list[Finding]:
+    """Run every check over one analysis of `sql` and return all findings."""
+    a = analyze_sql(sql.strip(), dialect)
+    findings = check_statement(a)
+    if findings:
+        return findings
+    if tables:
+        findings += check_references(a, tables, ambiguous)
+    if patterns is not None:
+        findings += check_patterns(a, patterns)
+    return findings
+
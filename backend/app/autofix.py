@@ -0,0 +1,196 @@
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+
+from app.analysis import analyze_sql
+from app.intent import Pattern
+from app.llm import strip_markdown
+from app.requirements import REQUIREMENTS
+
+
+# check_patterns rejects NOT IN whatever the patterns are
+GLOBAL_FORBIDDEN = {"not in"}
+
+
+# ============================
+# Transforms (mutate the tree, return True when they changed it)
+# ============================
+def _single_table(select: exp.Select) -> exp.Table | None:
+    from_ = select.args.get("from_") or select.args.get("from")
+    if from_ is None or select.args.get("joins") or not isinstance(from_.this, exp.Table):
+        return None
+    return from_.this
+
+
+def _source_names(select: exp.Select) -> set[str]:
+    names = set()
+    for t in select.find_all(exp.Table):
+        names.add(t.name.lower())
+        if t.alias:
+            names.add(t.alias.lower())
+    return names
+
+
+def _qualified(column: exp.Expression, select: exp.Select) -> exp.Column | None:
+    """The column with a table qualifier, or None when that is not certain."""
+    if not isinstance(column, exp.Column) or isinstance(column.this, exp.Star):
+        return None
+    if column.table:
+        return column
+    table = _single_table(select)
+    if table is None:
+        return None
+    return exp.column(column.name, table=table.alias_or_name, quoted=column.this.quoted)
+
+
+def not_in_to_not_exists(tree: exp.Expression) -> bool:
+    """x NOT IN (SELECT y FROM t WHERE ...) -> NOT EXISTS (SELECT 1 FROM t WHERE ... AND y = x).
+
+    Only single-column subqueries without grouping or limits, where both
+    sides can be qualified unambiguously. A list of non-NULL literals
+    becomes x <> a AND x <> b, which behaves the same.
+    """
+    changed = False
+    for node in list(tree.find_all(exp.Not)):
+        in_ = node.this
+        if not isinstance(in_, exp.In):
+            continue
+        if in_.args.get("query") is None:
+            values = in_.expressions
+            if values and all(isinstance(v, exp.Literal) for v in values):
+                cond = exp.and_(*(exp.NEQ(this=in_.this.copy(), expression=v.copy()) for v in values))
+                node.replace(exp.Paren(this=cond) if len(values) > 1 else cond)
+                changed = True
+            continue
+        inner = in_.args["query"]
+        inner = inner.this if isinstance(inner, exp.Subquery) else inner
+        if not isinstance(inner, exp.Select) or len(inner.expressions) != 1:
+            continue
+        if any(inner.args.get(k) for k in ("group", "having", "limit", "distinct", "with_", "with")):
+            continue
+
+        projection = inner.expressions[0]
+        projection = projection.this if isinstance(projection, exp.Alias) else projection
+        outer_select = in_.find_ancestor(exp.Select)
+        if outer_select is None or projection.find(exp.AggFunc):
+            continue
+        inner_col = _qualified(projection, inner)
+        outer_col = _qualified(in_.this, outer_select)
+        if inner_col is None or outer_col is None:
+            continue
+        # the outer qualifier must not be shadowed inside the subquery
+        if outer_col.table.lower() in _source_names(inner):
+            continue
+
+        exists = inner.copy()
+        exists.set("expressions", [exp.Literal.number(1)])
+        exists.where(exp.EQ(this=inner_col.copy(), expression=outer_col.copy()), copy=False)
+        node.replace(exp.Not(this=exp.Exists(this=exists)))
+        changed = True
+    return changed
+
+
+def drop_limit(tree: exp.Expression) -> bool:
+    """Drop the outermost LIMIT/FETCH/TOP; one in a subquery or CTE is part of the answer."""
+    changed = False
+    for key in ("limit", "fetch"):
+        node = tree.args.get(key)
+        if node is not None:
+            node.pop()
+            changed = True
+    return changed
+
+
+def inline_ctes(tree: exp.Expression) -> bool:
+    """Replace references to non-recursive top-level CTEs with subqueries."""
+    with_ = tree.find(exp.With)
+    if with_ is None or with_.parent is not tree or with_.args.get("recursive"):
+        return False
+
+    for cte in with_.expressions:
+        name = cte.alias_or_name.lower()
+        for table in list(tree.find_all(exp.Table)):
+            if table.name.lower() == name and not table.db:
+                alias = exp.TableAlias(this=exp.to_identifier(table.alias or table.name))
+                table.replace(exp.Subquery(this=cte.this.copy(), alias=alias))
+    with_.pop()
+    return True
+
+
+def _in_projection(node: exp.Expression) -> bool:
+    while node.parent is not None and not isinstance(node.parent, exp.Select):
+        node = node.parent
+    return node.parent is not None and node.arg_key == "expressions"
+
+
+def coalesce_aggregates(tree: exp.Expression) -> bool:
+    """SUM/COUNT in the SELECT list of a LEFT JOIN query -> COALESCE(..., 0)."""
+    if not any((j.side or "").lower() == "left" for j in tree.find_all(exp.Join)):
+        return False
+    changed = False
+    for agg in list(tree.find_all(exp.Sum, exp.Count)):
+        if isinstance(agg.parent, (exp.Coalesce, exp.Window)) or not _in_projection(agg):
+            continue
+        agg.replace(exp.Coalesce(this=agg.copy(), expressions=[exp.Literal.number(0)]))
+        changed = True
+    return changed
+
+
+# REQUIREMENTS entries -> the transform that satisfies them
+FORBIDDEN_FIXES = {
+    "not in": not_in_to_not_exists,
+    "limit": drop_limit,
+    "fetch first": drop_limit,
+    "with ": inline_ctes,
+}
+MUST_USE_FIXES = {
+    "coalesce": coalesce_aggregates,
+}
+
+
+# ============================
+# Entry point
+# ============================
+def auto_repair(sql: str, patterns: set[Pattern], dialect: str | None = None) -> tuple[str, list[str]] | None:
+    """Apply every mechanical fix the requirements call for.
+
+    Returns (sql, names of the fixes applied), or None when nothing
+    applied. The caller still has to re-validate the result.
+    """
+    fixes = []
+    text = strip_markdown(sql)
+    if text != sql.strip():
+        fixes.append("strip_markdown")
+
+    forbidden = set(GLOBAL_FORBIDDEN)
+    must_use = set()
+    for p in patterns:
+        r = REQUIREMENTS.get(p)
+        if r:
+            forbidden |= r.forbidden
+            must_use |= r.must_use
+
+    try:
+        tree = Dialect.get_or_raise(dialect).parse(text)[0]
+    except Exception:
+        tree = None
+    if tree is None:
+        return (text, fixes) if fixes else None
+
+    transforms = [FORBIDDEN_FIXES[k] for k in sorted(forbidden) if k in FORBIDDEN_FIXES]
+    transforms += [MUST_USE_FIXES[k] for k in sorted(must_use) if k in MUST_USE_FIXES]
+
+    rewritten = False
+    # "limit" and "fetch first" share a transform; run each once
+    for fix in dict.fromkeys(transforms):
+        if fix(tree):
+            fixes.append(fix.__name__)
+            rewritten = True
+
+    # re-rendering in the target dialect turns LIMIT into TOP for sqlserver
+    if analyze_sql(text, dialect).dialect_issues:
+        fixes.append("dialect")
+        rewritten = True
+
+    if rewritten:
+        text = tree.sql(dialect=dialect)
+    return (text, fixes) if fixes else None
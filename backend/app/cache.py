@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.store import SQLiteStore
+
+
+# ============================
+# Config
+# ============================
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1024"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", str(24 * 3600)))
+# on-disk store so hits survive restarts; empty disables it
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH", "")
+
+
+# ============================
+# Key
+# ============================
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def cache_key(schema: str, criteria: str, database: str, language: str, model: str, options: dict) -> str:
+    parts = {
+        "schema": _normalize(schema),
+        "criteria": _normalize(criteria).lower(),
+        "database": database.lower(),
+        "language": language.lower(),
+        "model": model,
+        "options": options,
+    }
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# ============================
+# Cache
+# ============================
+class SQLCache:
+    """LRU + TTL cache of validated SQL, optionally backed by SQLite.
+
+    The disk tier is read in the threadpool and written by the store's
+    background thread, so neither runs on the event loop.
+    """
+
+    def __init__(self, max_size: int = SQL_CACHE_SIZE, ttl: float = SQL_CACHE_TTL, path: str = SQL_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._store: SQLiteStore | None = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            self._store = SQLiteStore(
+                path,
+                "CREATE TABLE IF NOT EXISTS sql_cache ("
+                "key TEXT PRIMARY KEY, sql TEXT NOT NULL, created_at REAL NOT NULL)",
+            )
+
+    async def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        if self._store is not None:
+            rows = await run_in_threadpool(
+                self._store.read, "SELECT sql, created_at FROM sql_cache WHERE key = ?", (key,)
+            )
+            if rows and rows[0][1] + self.ttl > now:
+                sql, created_at = rows[0]
+                with self._lock:
+                    self._remember(key, sql, created_at + self.ttl)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return sql
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, sql: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, sql, now + self.ttl)
+        if self._store is not None:
+            self._store.write(
+                "INSERT OR REPLACE INTO sql_cache (key, sql, created_at) VALUES (?, ?, ?)",
+                (key, sql, now),
+            )
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+
+    def _remember(self, key: str, sql: str, expires_at: float) -> None:
+        self._entries[key] = (expires_at, sql)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "persistent": self._store is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            **({"disk": self._store.stats()} if self._store is not None else {}),
+        }
+
+
+sql_cache = SQLCache()
+
+
+# ============================
+# In-flight coalescing
+# ============================
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one generation per key at a time; identical callers share it.
+
+    The work runs in its own task, so a caller that goes away does not
+    fail the others. It is cancelled only when every caller has left.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def pending(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Return (result, shared); shared is True when another caller started the work."""
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.create_task(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+inflight = SingleFlight()
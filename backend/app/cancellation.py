@@ -0,0 +1,134 @@
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, TypeVar
+
+from starlette.requests import Request
+
+from app.metrics import Counter
+
+
+# ============================
+# Metrics
+# ============================
+CANCELLED = Counter(
+    "sqlgen_cancelled_requests_total",
+    "Requests stopped before they finished, by reason (disconnected, cancelled, superseded).",
+    ("reason",),
+)
+
+T = TypeVar("T")
+
+
+class RequestCancelled(Exception):
+    """The client went away, cancelled the request or sent a newer one with its id."""
+
+    check = "cancelled"
+
+
+# ============================
+# In-flight requests
+# ============================
+class _Handle:
+    def __init__(self, api_key: str, task: asyncio.Task):
+        self.api_key = api_key
+        self.task = task
+        self.reason: str | None = None
+
+    def cancel(self, reason: str) -> bool:
+        if self.reason is not None or self.task.done():
+            return False
+        self.reason = reason
+        CANCELLED.inc(reason=reason)
+        self.task.cancel()
+        return True
+
+
+class CancelRegistry:
+    """Requests in flight by client-chosen request id (X-Request-ID).
+
+    Each request's work runs in a task of its own, cancelled when the
+    client disconnects, cancels the id, or sends a newer request with the
+    same id. Cancelling the task closes its Ollama request and interrupts
+    its execution check.
+    """
+
+    def __init__(self):
+        self._handles: dict[str, _Handle] = {}
+
+    def _start(self, request_id: str | None, api_key: str, work: Awaitable) -> _Handle:
+        handle = _Handle(api_key, asyncio.ensure_future(work))
+        if request_id:
+            previous = self._handles.get(request_id)
+            if previous is not None and previous.api_key == api_key:
+                previous.cancel("superseded")
+            self._handles[request_id] = handle
+        return handle
+
+    def _finish(self, request_id: str | None, handle: _Handle) -> None:
+        if request_id and self._handles.get(request_id) is handle:
+            del self._handles[request_id]
+
+    @staticmethod
+    async def _watch(request: Request, handle: _Handle) -> None:
+        # the body is already read, so the next message is the disconnect
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                handle.cancel("disconnected")
+                return
+
+    async def run(self, request: Request, request_id: str | None, api_key: str, work: Awaitable[T]) -> T:
+        """Await work, raising RequestCancelled when it is cancelled on the client's behalf."""
+        handle = self._start(request_id, api_key, work)
+        watcher = asyncio.create_task(self._watch(request, handle))
+        try:
+            return await handle.task
+        except asyncio.CancelledError:
+            if handle.reason is None:
+                raise
+            raise RequestCancelled(f"Request {handle.reason}") from None
+        finally:
+            watcher.cancel()
+            self._finish(request_id, handle)
+
+    async def stream(
+        self, request: Request, request_id: str | None, api_key: str, items: AsyncIterator[T]
+    ) -> AsyncIterator[T]:
+        """Iterate items produced in a task of their own, so they stop on disconnect or cancel.
+
+        Raises RequestCancelled after the items produced so far.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce() -> None:
+            async with aclosing(items) as it:
+                async for item in it:
+                    queue.put_nowait(item)
+
+        handle = self._start(request_id, api_key, produce())
+        handle.task.add_done_callback(lambda _: queue.put_nowait(queue))
+        watcher = asyncio.create_task(self._watch(request, handle))
+        try:
+            while (item := await queue.get()) is not queue:
+                yield item
+            if handle.reason is not None:
+                raise RequestCancelled(f"Request {handle.reason}")
+            handle.task.result()
+        finally:
+            # the response was closed early: nobody reads the rest
+            handle.cancel("disconnected")
+            watcher.cancel()
+            self._finish(request_id, handle)
+
+    def cancel(self, request_id: str, api_key: str) -> bool:
+        """Cancel a request of this API key; False when none is in flight."""
+        handle = self._handles.get(request_id)
+        if handle is None or handle.api_key != api_key:
+            return False
+        return handle.cancel("cancelled")
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._handles)}
+
+
+cancellations = CancelRegistry()
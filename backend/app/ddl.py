@@ -0,0 +1,648 @@
+import itertools
+import re
+from dataclasses import dataclass, field
+from typing import Iterator
+
+
+# ============================
+# Statement splitting (streaming)
+# ============================
+# a statement end, a quoted or commented region complete within the block,
+# or the opener of one that continues past it; parens in between are
+# counted in bulk. A doubled quote ('it''s') reads as two adjacent strings,
+# which splits the same.
+_SPECIAL = re.compile(r"""
+    (?=[;'"`\[\-/$])
+    (?:(?P<semi>;)
+  | (?P<region>'[^'\\]*(?:\\.[^'\\]*)*'
+      | "[^"\\]*(?:\\.[^"\\]*)*"
+      | `[^`]*`
+      | \[[^\]]*\]
+      | --[^\n]*\n
+      | /\*(?s:.*?)\*/
+      | (?<![\w$])\$(?P<tag>(?:[A-Za-z_]\w*)?)\$(?s:.*?)\$(?P=tag)\$)
+  | (?P<open>['"`\[]|--|/\*|(?<![\w$])\$(?:[A-Za-z_]\w*)?\$))
+""", flags=re.VERBOSE)
+_CLOSERS = {"--": "\n", "/*": "*/", "[": "]"}
+# closing quote, or a backslash escaping the next character (MySQL strings)
+_QUOTE_END = {q: re.compile(rf"[{q}\\]") for q in ("'", '"')}
+# end of the data that follows COPY ... FROM stdin (pg_dump)
+_COPY_END = re.compile(r"^\\\.\r?\n?", flags=re.MULTILINE)
+_FROM_STDIN = re.compile(r"\bfrom\s+stdin\b", flags=re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Statement:
+    # source text: leading comments and the terminating ";" included
+    text: str
+    # leading keywords, e.g. "create table", "insert"; "" when only comments
+    kind: str
+
+
+class StatementSplitter:
+    """Split SQL into statements while it arrives in chunks of any size.
+
+    Only complete lines are scanned, so no quote, comment marker or
+    dollar tag is ever cut by a chunk boundary. Between lines the state
+    is just the open quote/comment and the paren depth. Every character
+    of the input ends up in exactly one Statement.
+    """
+
+    def __init__(self):
+        # pieces of the unfinished last line
+        self._line: list[str] = []
+        # scanned pieces of the current statement
+        self._stmt: list[str] = []
+        # what closes the region we are in: a quote, "\n", "*/", "$tag$" or _COPY_END
+        self._close: str | re.Pattern | None = None
+        self._depth = 0
+
+    def feed(self, text: str) -> list[Statement]:
+        nl = text.rfind("\n")
+        if nl == -1:
+            if text:
+                self._line.append(text)
+            return []
+        self._line.append(text[:nl + 1])
+        block = "".join(self._line)
+        self._line = [text[nl + 1:]] if nl + 1 < len(text) else []
+        return self._scan(block)
+
+    def close(self) -> list[Statement]:
+        out = self._scan("".join(self._line))
+        self._line = []
+        tail = "".join(self._stmt)
+        if tail:
+            out.append(Statement(tail, "data" if self._close is _COPY_END else statement_kind(tail)))
+        self._stmt = []
+        self._close = None
+        self._depth = 0
+        return out
+
+    def _emit(self, out: list[Statement], kind: str | None = None) -> None:
+        text = "".join(self._stmt)
+        self._stmt = []
+        self._depth = 0
+        stmt = Statement(text, kind if kind is not None else statement_kind(text))
+        out.append(stmt)
+        if stmt.kind == "copy" and _FROM_STDIN.search(text):
+            self._close = _COPY_END
+
+    def _scan(self, block: str) -> list[Statement]:
+        out: list[Statement] = []
+        n = len(block)
+        start = i = 0
+        while i < n:
+            close = self._close
+            if close is None:
+                depth = self._depth
+                for m in _SPECIAL.finditer(block, i):
+                    j = m.start()
+                    depth += block.count("(", i, j) - block.count(")", i, j)
+                    i = m.end()
+                    kind = m.lastgroup
+                    if kind == "region":
+                        continue
+                    if kind == "semi":
+                        if depth <= 0:
+                            self._stmt.append(block[start:i])
+                            start = i
+                            self._emit(out)
+                            depth = 0
+                            if self._close is not None:
+                                break
+                        continue
+                    # quotes and dollar tags close themselves
+                    tok = m.group()
+                    self._close = _CLOSERS.get(tok, tok)
+                    break
+                else:
+                    depth += block.count("(", i, n) - block.count(")", i, n)
+                    i = n
+                self._depth = depth
+            elif close is _COPY_END:
+                m = _COPY_END.search(block, i)
+                if m is None:
+                    break
+                i = m.end()
+                self._stmt.append(block[start:i])
+                start = i
+                self._close = None
+                self._emit(out, "data")
+            elif close in _QUOTE_END:
+                m = _QUOTE_END[close].search(block, i)
+                if m is None:
+                    break
+                j = m.start()
+                if block[j] == "\\":
+                    i = j + 2
+                else:
+                    i = j + 1
+                    self._close = None
+            else:
+                j = block.find(close, i)
+                if j == -1:
+                    break
+                i = j + len(close)
+                self._close = None
+        if start < n:
+            self._stmt.append(block[start:])
+        return out
+
+
+def split_statements(text: str) -> list[Statement]:
+    splitter = StatementSplitter()
+    return splitter.feed(text) + splitter.close()
+
+
+# ============================
+# Tokens
+# ============================
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*(?s:.*?)(?:\*/|\Z))
+  | (?P<string>[EeNn]?'(?:[^'\\]|\\.|'')*'?)
+  | (?P<dollar>(?<![\w$])\$(?P<tag>(?:[A-Za-z_]\w*)?)\$(?s:.*?)(?:\$(?P=tag)\$|\Z))
+  | "(?P<dq>(?:[^"]|"")*)"?
+  | `(?P<bq>(?:[^`]|``)*)`?
+  | \[(?P<bk>[^\]]*)\]?
+  | (?P<word>[^\W\d][\w$]*)
+  | (?P<number>\d[\w.]*)
+  | (?P<op>::|.)
+""", flags=re.VERBOSE)
+
+# (type, value): type is "word", "name" (quoted identifier), "string", "number" or "op"
+Token = tuple[str, str]
+
+
+def _token(m: re.Match) -> Token | None:
+    kind = m.lastgroup
+    if kind in ("space", "comment"):
+        return None
+    if kind == "dollar":
+        return "string", m.group()
+    if kind == "dq":
+        return "name", m.group("dq").replace('""', '"')
+    if kind == "bq":
+        return "name", m.group("bq").replace("``", "`")
+    if kind == "bk":
+        return "name", m.group("bk")
+    return kind, m.group()
+
+
+def tokens(text: str) -> Iterator[Token]:
+    for m in _TOKEN.finditer(text):
+        tok = _token(m)
+        if tok is not None:
+            yield tok
+
+
+_LEAD = re.compile(r"(?:\s+|--[^\n]*|/\*(?s:.*?)(?:\*/|\Z))*")
+_FIRST_WORD = re.compile(r"[A-Za-z_]+")
+# object type after CREATE/ALTER/DROP, past modifiers such as OR REPLACE,
+# UNIQUE or DEFINER=...
+_OBJECT = re.compile(
+    r"\b(table|index|view|trigger|sequence|function|procedure|type|schema|extension|database|domain)\b",
+    flags=re.IGNORECASE,
+)
+
+
+def statement_kind(text: str) -> str:
+    m = _FIRST_WORD.match(text, _LEAD.match(text).end())
+    if m is None:
+        return ""
+    word = m.group().lower()
+    if word in ("create", "alter", "drop"):
+        obj = _OBJECT.search(text, m.end(), m.end() + 200)
+        if obj is not None:
+            return f"{word} {obj.group(1).lower()}"
+    return word
+
+
+# ============================
+# Schema objects
+# ============================
+@dataclass(frozen=True)
+class ForeignKey:
+    columns: tuple[str, ...]
+    table: str
+    ref_columns: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Index:
+    name: str | None
+    columns: tuple[str, ...]
+    unique: bool = False
+
+
+@dataclass
+class Table:
+    name: str
+    # the CREATE TABLE statement with the comments directly above it
+    ddl: str
+    columns: list[str] = field(default_factory=list)
+    primary_key: tuple[str, ...] = ()
+    foreign_keys: list[ForeignKey] = field(default_factory=list)
+    indexes: list[Index] = field(default_factory=list)
+
+
+def _is(tok: Token, *words: str) -> bool:
+    return tok[0] == "word" and tok[1].upper() in words
+
+
+def _name(toks: list[Token], i: int) -> tuple[str | None, int]:
+    """The possibly schema-qualified name at toks[i] (last part) and the index after it."""
+    if i >= len(toks) or toks[i][0] not in ("word", "name"):
+        return None, i
+    name = toks[i][1]
+    i += 1
+    while i + 1 < len(toks) and toks[i] == ("op", ".") and toks[i + 1][0] in ("word", "name"):
+        name = toks[i + 1][1]
+        i += 2
+    return name, i
+
+
+def _split(toks: list[Token]) -> list[list[Token]]:
+    """Split at commas outside parentheses."""
+    parts: list[list[Token]] = [[]]
+    depth = 0
+    for t in toks:
+        if t == ("op", "("):
+            depth += 1
+        elif t == ("op", ")"):
+            depth -= 1
+        elif t == ("op", ",") and depth == 0:
+            parts.append([])
+            continue
+        parts[-1].append(t)
+    return [p for p in parts if p]
+
+
+def _group(toks: list[Token], i: int) -> tuple[list[list[Token]], int]:
+    """Elements of the parenthesized group opening at toks[i], and the index after it."""
+    depth = 0
+    for j in range(i, len(toks)):
+        if toks[j] == ("op", "("):
+            depth += 1
+        elif toks[j] == ("op", ")"):
+            depth -= 1
+            if depth == 0:
+                return _split(toks[i + 1:j]), j + 1
+    return _split(toks[i + 1:]), len(toks)
+
+
+def _columns(elements: list[list[Token]]) -> tuple[str, ...]:
+    # expressions (e.g. lower(name)) have no single column; a MySQL
+    # prefix length (name(10)) does
+    return tuple(
+        e[0][1] for e in elements
+        if e[0][0] in ("word", "name")
+        and (len(e) < 3 or e[1] != ("op", "(") or e[2][0] == "number")
+    )
+
+
+def _find(toks: list[Token], i: int, *words: str) -> int:
+    for j in range(i, len(toks)):
+        if _is(toks[j], *words):
+            return j
+    return -1
+
+
+def _find_op(toks: list[Token], i: int, op: str) -> int:
+    for j in range(i, len(toks)):
+        if toks[j] == ("op", op):
+            return j
+    return -1
+
+
+def _references(toks: list[Token], i: int, columns: tuple[str, ...]) -> ForeignKey | None:
+    """REFERENCES table [(cols)] starting at toks[i]."""
+    table, j = _name(toks, i + 1)
+    if table is None:
+        return None
+    ref_columns = ()
+    if j < len(toks) and toks[j] == ("op", "("):
+        ref_columns = _columns(_group(toks, j)[0])
+    return ForeignKey(columns, table, ref_columns)
+
+
+def _index_element(el: list[Token]) -> Index | None:
+    """UNIQUE [KEY|INDEX] [name] (cols) / KEY|INDEX name (cols), or None for a column."""
+    p = _find_op(el, 0, "(")
+    if p == -1:
+        return None
+    between = [t for t in el[1:p] if not _is(t, "KEY", "INDEX")]
+    elements = _group(el, p)[0]
+    # `key VARCHAR(10)` is a column: its group holds no column names
+    if len(between) > 1 or not any(e[0][0] in ("word", "name") for e in elements):
+        return None
+    name = between[0][1] if between and between[0][0] in ("word", "name") else None
+    return Index(name, _columns(elements), unique=_is(el[0], "UNIQUE"))
+
+
+def _table_element(table: Table, el: list[Token]) -> None:
+    if _is(el[0], "CONSTRAINT"):
+        el = el[2:]
+        if not el:
+            return
+    head = el[0]
+    if _is(head, "PRIMARY"):
+        p = _find_op(el, 0, "(")
+        if p != -1:
+            table.primary_key = _columns(_group(el, p)[0])
+        return
+    if _is(head, "FOREIGN"):
+        p = _find_op(el, 0, "(")
+        r = _find(el, 0, "REFERENCES")
+        if p != -1 and r != -1:
+            fk = _references(el, r, _columns(_group(el, p)[0]))
+            if fk is not None:
+                table.foreign_keys.append(fk)
+        return
+    if _is(head, "CHECK", "EXCLUDE", "PERIOD", "LIKE"):
+        return
+    if _is(head, "UNIQUE", "KEY", "INDEX", "FULLTEXT", "SPATIAL"):
+        index = _index_element(el)
+        if index is not None:
+            table.indexes.append(index)
+            return
+        if _is(head, "UNIQUE", "FULLTEXT", "SPATIAL"):
+            return
+
+    # a column definition
+    if head[0] not in ("word", "name"):
+        return
+    column = head[1]
+    table.columns.append(column)
+    r = _find(el, 1, "REFERENCES")
+    if r != -1:
+        fk = _references(el, r, (column,))
+        if fk is not None:
+            table.foreign_keys.append(fk)
+    k = _find(el, 1, "PRIMARY")
+    if k != -1 and k + 1 < len(el) and _is(el[k + 1], "KEY"):
+        table.primary_key = (column,)
+
+
+# ---- fast path for CREATE TABLE bodies: most elements are plain columns ----
+_GROUP_SPECIAL = re.compile(r"""[(),'"`\[]|--|/\*|(?<![\w$])\$(?:[A-Za-z_]\w*)?\$""")
+# columns declaring these need the full tokenizer; searching lower-cased
+# text is much faster than IGNORECASE, but only safe when lower() keeps
+# every position (ASCII)
+_COLUMN_CONSTRAINT = re.compile(r"references|primary")
+_COLUMN_CONSTRAINT_ANY_CASE = re.compile(r"references|primary", flags=re.IGNORECASE)
+# element heads that need the full tokenizer (KEY/INDEX may still be columns)
+_CONSTRAINT_HEADS = {
+    "constraint", "primary", "foreign", "unique", "check", "exclude",
+    "period", "like", "key", "index", "fulltext", "spatial",
+}
+
+
+def _skip(text: str, i: int, opener: str) -> int:
+    """Index after the quoted or commented region opened by `opener` (ending at i)."""
+    if opener in _QUOTE_END:
+        pattern = _QUOTE_END[opener]
+        while True:
+            m = pattern.search(text, i)
+            if m is None:
+                return len(text)
+            j = m.start()
+            if text[j] == "\\" or text.startswith(opener, j + 1):
+                i = j + 2
+                continue
+            return j + 1
+    # a dollar quote ($$ or $tag$) closes with the same tag
+    close = {"`": "`", "[": "]", "--": "\n", "/*": "*/"}.get(opener, opener)
+    j = text.find(close, i)
+    return len(text) if j == -1 else j + len(close)
+
+
+_dollar_tags = itertools.count()
+
+
+def _quoted() -> str:
+    # each copy names its own dollar tag group: a pattern cannot repeat a name.
+    # A "$" opening no dollar quote (a$b, $1) is plain text; an unterminated
+    # quote matches nothing, leaving it to the scanner
+    tag = f"tag{next(_dollar_tags)}"
+    return (
+        r"""'[^'\\]*(?:\\.[^'\\]*)*'|"[^"]*"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*(?s:.*?)\*/"""
+        rf"""|(?<![\w$])\$(?P<{tag}>(?:[A-Za-z_]\w*)?)\$(?s:.*?)\$(?P={tag})\$"""
+        r"""|(?<=[\w$])\$|\$(?!(?:[A-Za-z_]\w*)?\$)|-(?!-)|/(?!\*)"""
+    )
+
+
+def _nested(levels: int) -> str:
+    # maximal runs between quotes/groups, so a failed match backtracks linearly
+    run = r"""(?:[^()'"`\[\-/$]+)?"""
+    group = rf"\({run}(?:(?:{_quoted()}){run})*\)"
+    for _ in range(levels - 1):
+        group = rf"\({run}(?:(?:{_quoted()}|{group}){run})*\)"
+    return group
+
+
+_RUN = r"""(?:[^(),'"`\[\-/$]+)?"""
+# one element and its separator; covers parens nested three deep, e.g.
+# CHECK ((balance > (0)::numeric)). The lookahead picks up a plain or
+# double-quoted first identifier, so most columns need no second match.
+_ELEMENT = re.compile(
+    r"""(?:(?=\s*(?:"(?P<dq>[^"]*)"(?!")|(?P<word>[^\W\d][\w$]*)))|)"""
+    rf"{_RUN}(?:(?:{_quoted()}|{_nested(3)}){_RUN})*(?P<sep>[,)])"
+)
+
+
+def _scan_elements(text: str, i: int) -> list[tuple[int, int]]:
+    """Element spans from text[i] to the close of the group, at any nesting depth."""
+    parts = []
+    depth = 1
+    start = i
+    while True:
+        m = _GROUP_SPECIAL.search(text, i)
+        if m is None:
+            break
+        tok = m.group()
+        i = m.end()
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+            if depth == 0:
+                parts.append((start, m.start()))
+                return parts
+        elif tok == ",":
+            if depth == 1:
+                parts.append((start, m.start()))
+                start = i
+        else:
+            i = _skip(text, i, tok)
+    parts.append((start, len(text)))
+    return parts
+
+
+def _tokenized_element(table: Table, text: str) -> None:
+    el = list(tokens(text))
+    if el:
+        _table_element(table, el)
+
+
+def _table_elements(table: Table, text: str, paren: int) -> None:
+    """Columns and constraints of the CREATE TABLE column list opening at text[paren].
+
+    Plain columns are taken from the element regex alone; anything else
+    goes through the tokenizer.
+    """
+    # REFERENCES/PRIMARY positions for the whole list, with a sentinel
+    if text.isascii():
+        found = _COLUMN_CONSTRAINT.finditer(text.lower(), paren)
+    else:
+        found = _COLUMN_CONSTRAINT_ANY_CASE.finditer(text, paren)
+    marks = [m.start() for m in found]
+    marks.append(len(text))
+    k = 0
+    start = paren + 1
+    while True:
+        m = _ELEMENT.match(text, start)
+        if m is None:
+            # deeper nesting or an unterminated quote
+            for i, j in _scan_elements(text, start):
+                _tokenized_element(table, text[i:j])
+            return
+        word, dq, sep = m.group("word", "dq", "sep")
+        end = m.end() - 1
+        while marks[k] < start:
+            k += 1
+        if word is not None and word.lower() not in _CONSTRAINT_HEADS and marks[k] >= end:
+            table.columns.append(word)
+        elif dq is not None and marks[k] >= end:
+            table.columns.append(dq)
+        else:
+            _tokenized_element(table, text[start:end])
+        start = end + 1
+        if sep == ")":
+            return
+
+
+def _after(toks: list[Token], word: str) -> int:
+    """Index after `word` and an optional IF [NOT] EXISTS / ONLY."""
+    i = _find(toks, 0, word)
+    if i == -1:
+        return len(toks)
+    i += 1
+    while i < len(toks) and _is(toks[i], "IF", "NOT", "EXISTS", "ONLY"):
+        i += 1
+    return i
+
+
+def _own_text(text: str) -> str:
+    # a comment on the previous statement's line belongs to that statement
+    nl = text.find("\n")
+    if nl != -1 and text[:nl].strip().startswith("--"):
+        text = text[nl + 1:]
+    return text.strip()
+
+
+# ============================
+# Parser
+# ============================
+@dataclass
+class ParsedSchema:
+    text: str
+    # lower-cased table name -> Table, in DDL order
+    tables: dict[str, Table]
+
+
+class DDLParser:
+    """Single-pass schema parser for hand-written DDL and pg_dump/mysqldump output.
+
+    feed() accepts chunks of any size; only CREATE TABLE, CREATE INDEX
+    and ALTER TABLE statements are tokenized, everything else is just
+    split off. Schema-qualified names keep their last part.
+    """
+
+    def __init__(self):
+        self._splitter = StatementSplitter()
+        self._parts: list[str] = []
+        self.tables: dict[str, Table] = {}
+
+    def feed(self, text: str) -> None:
+        for stmt in self._splitter.feed(text):
+            self._add(stmt)
+
+    def close(self) -> ParsedSchema:
+        for stmt in self._splitter.close():
+            self._add(stmt)
+        text = "".join(self._parts)
+        self._parts = []
+        return ParsedSchema(text, self.tables)
+
+    def _add(self, stmt: Statement) -> None:
+        self._parts.append(stmt.text)
+        if stmt.kind == "create table":
+            self._create_table(stmt)
+        elif stmt.kind == "create index":
+            self._create_index(list(tokens(stmt.text)))
+        elif stmt.kind == "alter table":
+            self._alter_table(list(tokens(stmt.text)))
+
+    def _create_table(self, stmt: Statement) -> None:
+        # tokenize only the head, up to the opening paren
+        toks: list[Token] = []
+        paren = -1
+        for m in _TOKEN.finditer(stmt.text):
+            tok = _token(m)
+            if tok == ("op", "("):
+                paren = m.start()
+                break
+            if tok is not None:
+                toks.append(tok)
+            if len(toks) > 16:
+                break
+        name, i = _name(toks, _after(toks, "TABLE"))
+        # CREATE TABLE ... AS SELECT / LIKE / PARTITION OF: columns unknown
+        if name is None or paren == -1 or i != len(toks):
+            return
+        table = Table(name, _own_text(stmt.text))
+        _table_elements(table, stmt.text, paren)
+        self.tables.pop(name.lower(), None)
+        self.tables[name.lower()] = table
+
+    def _create_index(self, toks: list[Token]) -> None:
+        on = _find(toks, 0, "ON")
+        if on == -1:
+            return
+        names = [t for t in toks[_after(toks, "INDEX"):on] if not _is(t, "CONCURRENTLY")]
+        i = on + 1
+        if i < len(toks) and _is(toks[i], "ONLY"):
+            i += 1
+        table, i = _name(toks, i)
+        p = _find_op(toks, i, "(")
+        target = self.tables.get((table or "").lower())
+        if target is None or p == -1:
+            return
+        index_name = names[-1][1] if names and names[-1][0] in ("word", "name") else None
+        unique = any(_is(t, "UNIQUE") for t in toks[:on])
+        target.indexes.append(Index(index_name, _columns(_group(toks, p)[0]), unique))
+
+    def _alter_table(self, toks: list[Token]) -> None:
+        name, i = _name(toks, _after(toks, "TABLE"))
+        table = self.tables.get((name or "").lower())
+        if table is None:
+            return
+        for action in _split(toks[i:]):
+            add = _find(action, 0, "ADD")
+            if add == -1:
+                continue
+            el = action[add + 1:]
+            if el and _is(el[0], "COLUMN"):
+                el = el[1:]
+            while el and _is(el[0], "IF", "NOT", "EXISTS"):
+                el = el[1:]
+            if el:
+                _table_element(table, el)
+
+
+def parse_ddl(text: str) -> ParsedSchema:
+    parser = DDLParser()
+    parser.feed(text or "")
+    return parser.close()
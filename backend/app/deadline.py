@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, TypeVar
+
+
+# ============================
+# Config
+# ============================
+# end-to-end seconds per generation: prompt, first attempt, repair and
+# execution all draw from it; 0 disables the deadline
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time; never repaired, reported as is."""
+
+    check = "deadline"
+
+
+# ============================
+# Request deadline
+# ============================
+# monotonic time by which the current request must be done
+_deadline: ContextVar[float | None] = ContextVar("sqlgen_deadline", default=None)
+
+T = TypeVar("T")
+
+
+@contextmanager
+def deadline(seconds: float = REQUEST_DEADLINE):
+    """Run the block under a deadline; a nested one can only shorten it.
+
+    Tasks and threads started inside inherit it through the context.
+    """
+    if seconds <= 0:
+        yield
+        return
+    end = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(end if current is None else min(current, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left, or None without a deadline."""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def budget(stage: str, limit: float | None = None) -> float | None:
+    """Seconds the stage may take: its own limit capped by what is left.
+
+    Raises DeadlineExceeded when nothing is left.
+    """
+    left = remaining()
+    if left is None:
+        return limit
+    if left <= 0:
+        raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
+    return left if limit is None else min(limit, left)
+
+
+async def within(stage: str, awaitable: Awaitable[T]) -> T:
+    """Await under the remaining budget; cancelled (closing any LLM request) when it runs out."""
+    try:
+        seconds = budget(stage)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    if seconds is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Request deadline exceeded during {stage}") from None
+
+
+async def iterate(stage: str, items: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Async-iterate under the remaining budget, e.g. over streamed tokens."""
+    while True:
+        try:
+            item = await within(stage, items.__anext__())
+        except StopAsyncIteration:
+            return
+        yield item
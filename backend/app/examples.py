@@ -0,0 +1,320 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.intent import Pattern
+from app.store import SQLiteStore
+
+
+# ============================
+# Config
+# ============================
+# on-disk store so examples survive restarts; empty keeps them in memory only
+EXAMPLES_PATH = os.getenv("EXAMPLES_PATH", "")
+# validated examples injected into each prompt
+EXAMPLES_FEW_SHOT = int(os.getenv("EXAMPLES_FEW_SHOT", "3"))
+# least similarity for an example to be worth showing the model
+EXAMPLES_MIN_SIMILARITY = float(os.getenv("EXAMPLES_MIN_SIMILARITY", "0.3"))
+# similarity from which a stored answer is reused without the LLM (above 1 disables);
+# paraphrases with a different meaning ("highest"/"lowest") score about 0.8
+EXAMPLES_REUSE_THRESHOLD = float(os.getenv("EXAMPLES_REUSE_THRESHOLD", "0.9"))
+EXAMPLES_MAX_PER_SCHEMA = int(os.getenv("EXAMPLES_MAX_PER_SCHEMA", "500"))
+# schemas whose index is kept in memory
+EXAMPLES_MAX_SCHEMAS = int(os.getenv("EXAMPLES_MAX_SCHEMAS", "64"))
+
+NGRAM = 3
+# 32 bands of 2 rows: pairs from about 0.2 Jaccard up are likely to share a bucket
+BANDS = 32
+ROWS = 2
+
+
+# ============================
+# MinHash
+# ============================
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(BANDS * ROWS)]
+
+
+def _normalize(text: str) -> str:
+    # punctuation and case do not change the question
+    return re.sub(r"[\W_]+", " ", text or "").strip().lower()
+
+
+def shingles(text: str) -> frozenset[int]:
+    """Hashed character n-grams; characters rather than words so it works for Japanese too."""
+    text = f" {_normalize(text)} "
+    return frozenset(
+        zlib.crc32(text[i:i + NGRAM].encode("utf-8"))
+        for i in range(max(1, len(text) - NGRAM + 1))
+    )
+
+
+def signature(grams: frozenset[int]) -> tuple[int, ...]:
+    return tuple(min((a * h + b) % _PRIME for h in grams) for a, b in _PERMUTATIONS)
+
+
+def bands(sig: tuple[int, ...]) -> list[tuple[int, ...]]:
+    return [(b, *sig[b * ROWS:(b + 1) * ROWS]) for b in range(BANDS)]
+
+
+def jaccard(a: frozenset[int], b: frozenset[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# ============================
+# Index
+# ============================
+@dataclass(frozen=True)
+class Example:
+    criteria: str
+    patterns: frozenset[Pattern]
+    database: str
+    sql: str
+
+
+@dataclass(frozen=True)
+class _Entry:
+    example: Example
+    grams: frozenset[int]
+    bands: tuple[tuple[int, ...], ...]
+
+
+class _SchemaIndex:
+    """Examples of one schema with their MinHash LSH buckets."""
+
+    def __init__(self):
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        # (database, normalized criteria) -> id: one example per question
+        self._ids: dict[tuple[str, str], int] = {}
+        self._buckets: dict[tuple[int, ...], set[int]] = {}
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, example: Example) -> None:
+        self.remove(example)
+        grams = shingles(example.criteria)
+        entry = _Entry(example, grams, tuple(bands(signature(grams))))
+        i = self._next
+        self._next += 1
+        self._entries[i] = entry
+        self._ids[(example.database, _normalize(example.criteria))] = i
+        for band in entry.bands:
+            self._buckets.setdefault(band, set()).add(i)
+        while len(self._entries) > EXAMPLES_MAX_PER_SCHEMA:
+            self.remove(next(iter(self._entries.values())).example)
+
+    def remove(self, example: Example) -> None:
+        i = self._ids.pop((example.database, _normalize(example.criteria)), None)
+        if i is None:
+            return
+        entry = self._entries.pop(i)
+        for band in entry.bands:
+            ids = self._buckets.get(band)
+            if ids is not None:
+                ids.discard(i)
+                if not ids:
+                    del self._buckets[band]
+
+    def search(self, criteria: str, database: str, k: int) -> list[tuple[float, Example]]:
+        grams = shingles(criteria)
+        candidates = set()
+        for band in bands(signature(grams)):
+            candidates |= self._buckets.get(band, set())
+        scored = []
+        for i in candidates:
+            entry = self._entries[i]
+            if entry.example.database == database:
+                scored.append((jaccard(grams, entry.grams), entry.example))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return scored[:k]
+
+
+# ============================
+# Store
+# ============================
+_PATTERNS = {p.value: p for p in Pattern}
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# words that never change what a question asks for; any other differing word
+# ("ascending"/"descending", "last"/"this month") blocks reuse
+_STOPWORDS = frozenset("""
+    a an the of for to in on at by from with me us please show list give get find display return
+    what which who whose is are was were all every each their its there that those these
+""".split())
+
+
+def _content_words(text: str) -> frozenset[str]:
+    return frozenset(_normalize(text).split()) - _STOPWORDS
+
+
+class ExampleStore:
+    """Validated (question, SQL) pairs per schema, for few-shot prompts and near-duplicate reuse.
+
+    Similarity is the Jaccard index of character trigrams; MinHash LSH
+    buckets narrow each lookup to the likely matches. Optionally backed
+    by SQLite, loaded per schema on first use in the threadpool and
+    written by the store's background thread.
+    """
+
+    def __init__(self, path: str = EXAMPLES_PATH, max_schemas: int = EXAMPLES_MAX_SCHEMAS):
+        self.max_schemas = max_schemas
+        self._indexes: OrderedDict[str, _SchemaIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self._store: SQLiteStore | None = None
+        self.lookups = 0
+        self.reuses = 0
+        # few-shot or not -> [passed, attempts]
+        self._first_attempts = {True: [0, 0], False: [0, 0]}
+
+        if path:
+            self._store = SQLiteStore(
+                path,
+                "CREATE TABLE IF NOT EXISTS examples ("
+                "schema_hash TEXT NOT NULL, database TEXT NOT NULL, question TEXT NOT NULL, "
+                "criteria TEXT NOT NULL, patterns TEXT NOT NULL, sql TEXT NOT NULL, "
+                "created_at REAL NOT NULL, PRIMARY KEY (schema_hash, database, question))",
+            )
+
+    def _loaded(self, schema_hash: str) -> _SchemaIndex | None:
+        index = self._indexes.get(schema_hash)
+        if index is not None:
+            self._indexes.move_to_end(schema_hash)
+        return index
+
+    def _load_rows(self, schema_hash: str) -> list[tuple]:
+        if self._store is None:
+            return []
+        return self._store.read(
+            "SELECT criteria, patterns, database, sql FROM examples "
+            "WHERE schema_hash = ? ORDER BY created_at DESC LIMIT ?",
+            (schema_hash, EXAMPLES_MAX_PER_SCHEMA),
+        )
+
+    async def _index(self, schema_hash: str) -> _SchemaIndex:
+        with self._lock:
+            index = self._loaded(schema_hash)
+        if index is not None:
+            return index
+
+        rows = await run_in_threadpool(self._load_rows, schema_hash) if self._store is not None else []
+        with self._lock:
+            # loaded by a concurrent lookup meanwhile
+            index = self._loaded(schema_hash)
+            if index is not None:
+                return index
+            index = self._indexes[schema_hash] = _SchemaIndex()
+            for criteria, patterns, database, sql in reversed(rows):
+                # Patterns since renamed are dropped
+                names = frozenset(_PATTERNS[p] for p in json.loads(patterns) if p in _PATTERNS)
+                index.add(Example(criteria, names, database, sql))
+            while len(self._indexes) > self.max_schemas:
+                self._indexes.popitem(last=False)
+            return index
+
+    def add(self, schema_hash: str, criteria: str, patterns: set[Pattern], database: str, sql: str) -> None:
+        example = Example(criteria, frozenset(patterns), database.lower(), sql)
+        with self._lock:
+            index = self._loaded(schema_hash)
+            if index is None and self._store is None:
+                index = self._indexes[schema_hash] = _SchemaIndex()
+                while len(self._indexes) > self.max_schemas:
+                    self._indexes.popitem(last=False)
+            # otherwise the schema loads it from the store on its next lookup; generation
+            # searches the schema first, so it is only missing once evicted meanwhile
+            if index is not None:
+                index.add(example)
+        if self._store is not None:
+            self._store.write(
+                "INSERT OR REPLACE INTO examples "
+                "(schema_hash, database, question, criteria, patterns, sql, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    schema_hash, example.database, _normalize(criteria), criteria,
+                    json.dumps(sorted(p.value for p in patterns)), sql, time.time(),
+                ),
+            )
+
+    def discard(self, schema_hash: str, example: Example) -> None:
+        """Forget an example that no longer passes the checks."""
+        with self._lock:
+            index = self._loaded(schema_hash)
+            if index is not None:
+                index.remove(example)
+        if self._store is not None:
+            self._store.write(
+                "DELETE FROM examples WHERE schema_hash = ? AND database = ? AND question = ?",
+                (schema_hash, example.database, _normalize(example.criteria)),
+            )
+
+    async def search(
+        self, schema_hash: str, criteria: str, database: str, k: int = EXAMPLES_FEW_SHOT
+    ) -> list[tuple[float, Example]]:
+        """(similarity, example) for the most similar questions asked against the schema, best first."""
+        index = await self._index(schema_hash)
+        with self._lock:
+            self.lookups += 1
+            return index.search(criteria, database.lower(), max(k, 1))
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+
+    @staticmethod
+    def near_duplicate(
+        similar: list[tuple[float, Example]], criteria: str, patterns: set[Pattern]
+    ) -> tuple[float, Example] | None:
+        """The best match when it is close enough, and for the same Patterns, to reuse its SQL."""
+        if not similar:
+            return None
+        similarity, example = similar[0]
+        if similarity < EXAMPLES_REUSE_THRESHOLD or example.patterns != frozenset(patterns):
+            return None
+        # "top 5" and "top 10" are near-identical text
+        if _NUMBER.findall(example.criteria) != _NUMBER.findall(criteria):
+            return None
+        # so are "ascending" and "descending" in a long question
+        if _content_words(example.criteria) != _content_words(criteria):
+            return None
+        return similar[0]
+
+    @staticmethod
+    def few_shot(similar: list[tuple[float, Example]], k: int = EXAMPLES_FEW_SHOT) -> list[Example]:
+        return [e for s, e in similar[:k] if s >= EXAMPLES_MIN_SIMILARITY]
+
+    def record_reuse(self) -> None:
+        self.reuses += 1
+
+    def record_first_attempt(self, few_shot: bool, passed: bool) -> None:
+        counts = self._first_attempts[few_shot]
+        counts[0] += passed
+        counts[1] += 1
+
+    def stats(self) -> dict:
+        def rate(few_shot: bool) -> dict:
+            passed, attempts = self._first_attempts[few_shot]
+            return {"attempts": attempts, "passed": passed, "pass_rate": passed / attempts if attempts else 0.0}
+
+        return {
+            "schemas": len(self._indexes),
+            "examples": sum(len(i) for i in self._indexes.values()),
+            "persistent": self._store is not None,
+            "lookups": self.lookups,
+            "reuses": self.reuses,
+            "first_attempt": {"zero_shot": rate(False), "few_shot": rate(True)},
+            **({"disk": self._store.stats()} if self._store is not None else {}),
+        }
+
+
+example_store = ExampleStore()
@@ -1,20 +1,417 @@
+import hashlib
+import multiprocessing
+import os
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-def execute_sql(schema: str, sql: str):
-    conn = sqlite3.connect(":memory:")
-    cur = conn.cursor()
+from app.ddl import split_statements
+
+
+# ============================
+# Config
+# ============================
+# per-query limits
+EXEC_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "2"))
+EXEC_MAX_ROWS = int(os.getenv("EXEC_MAX_ROWS", "100000"))
+# SQLite heap limit applied inside worker processes
+EXEC_MAX_MEMORY = int(os.getenv("EXEC_MAX_MEMORY", str(256 * 1024 * 1024)))
+
+EXEC_POOL_MAX_TEMPLATES = int(os.getenv("EXEC_POOL_MAX_TEMPLATES", "64"))
+# templates share the worker's heap limit with the queries; half leaves them room
+EXEC_POOL_MAX_BYTES = int(os.getenv("EXEC_POOL_MAX_BYTES", str(EXEC_MAX_MEMORY // 2)))
+# worker processes for query execution; 0 runs queries in-process
+EXEC_WORKERS = int(os.getenv("EXEC_WORKERS", "2"))
+
+# VM instructions between deadline checks
+_PROGRESS_STEPS = 1000
+# seconds between checks for an interrupt while waiting on a worker process
+_INTERRUPT_POLL = 0.05
+# worker queries that can be interrupted at once; further ones run to their timeout
+_INTERRUPT_SLOTS = 256
+
+# statements replayed into a template; dump noise (SET, COMMENT ON,
+# GRANT, CREATE SEQUENCE, ...) is skipped
+_TEMPLATE_KINDS = {"create table", "create index", "create view", "create trigger", "insert"}
+
+
+# ============================
+# Errors
+# ============================
+class ExecutionError(Exception):
+    """Execution stopped by a limit; the message is written for the repair prompt."""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+
+# ============================
+# Interrupts
+# ============================
+# set once the request the query runs for is cancelled; the query stops
+# at its next progress check
+_interrupt: ContextVar[threading.Event | None] = ContextVar("sqlgen_interrupt", default=None)
+
+
+@contextmanager
+def interrupt_on(event: threading.Event):
+    """Queries started in this context (threads included) stop once event is set."""
+    token = _interrupt.set(event)
+    try:
+        yield
+    finally:
+        _interrupt.reset(token)
+
+
+def _interrupted() -> ExecutionError:
+    return ExecutionError("cancelled", "Query cancelled.")
 
+
+# one byte per interruptible worker query, shared with the worker processes
+_flags = None
+_free_slots: list[int] = []
+_slots_lock = threading.Lock()
+
+
+def _acquire_slot() -> int | None:
+    with _slots_lock:
+        return _free_slots.pop() if _free_slots else None
+
+
+def _interrupt_slot(slot: int, future) -> None:
+    with _slots_lock:
+        # once done, the slot may already belong to another query
+        if not future.done():
+            _flags[slot] = 1
+
+
+def _release_slot(slot: int) -> None:
+    with _slots_lock:
+        _flags[slot] = 0
+        _free_slots.append(slot)
+
+
+# ============================
+# Template pool
+# ============================
+class _Template:
+    def __init__(self, conn: sqlite3.Connection, size: int):
+        self.conn = conn
+        self.size = size
+        # backup() reads the source; serialize clones of one template
+        self.lock = threading.Lock()
+
+
+def _build_template(schema: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
     try:
-        for stmt in schema.split(";"):
-            if stmt.strip():
-                cur.execute(stmt)
+        cur = conn.cursor()
+        for stmt in split_statements(schema):
+            if stmt.kind in _TEMPLATE_KINDS:
+                cur.execute(stmt.text)
+            elif stmt.kind == "alter table":
+                # ADD COLUMN works in SQLite, ADD CONSTRAINT / OWNER TO do not
+                try:
+                    cur.execute(stmt.text)
+                except sqlite3.Error:
+                    pass
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _db_size(conn: sqlite3.Connection) -> int:
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+
+class TemplatePool:
+    """Pre-built in-memory databases, one per schema, cloned per query.
+
+    Bounded by template count and total bytes; least recently used
+    templates are evicted first.
+    """
+
+    def __init__(self, max_templates: int = EXEC_POOL_MAX_TEMPLATES, max_bytes: int = EXEC_POOL_MAX_BYTES):
+        self.max_templates = max_templates
+        self.max_bytes = max_bytes
+        self._templates: OrderedDict[str, _Template] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key: str, schema: str) -> _Template:
+        with self._lock:
+            tpl = self._templates.get(key)
+            if tpl is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return tpl
+            self.misses += 1
+
+        # build outside the pool lock; a concurrent duplicate build is harmless
+        conn = _build_template(schema)
+        tpl = _Template(conn, _db_size(conn))
 
+        with self._lock:
+            existing = self._templates.get(key)
+            if existing is not None:
+                conn.close()
+                return existing
+            self._templates[key] = tpl
+            self._bytes += tpl.size
+            self._evict()
+        return tpl
+
+    def _evict(self) -> None:
+        # keep the newest template even if it alone exceeds the byte budget
+        while len(self._templates) > 1 and (
+            len(self._templates) > self.max_templates or self._bytes > self.max_bytes
+        ):
+            _, old = self._templates.popitem(last=False)
+            self._bytes -= old.size
+            self.evictions += 1
+            with old.lock:
+                old.conn.close()
+
+    def connect(self, schema: str, key: str | None = None) -> sqlite3.Connection:
+        """Return a private copy of the schema's template database."""
+        key = key or hashlib.sha256(schema.encode("utf-8")).hexdigest()
+        dst = sqlite3.connect(":memory:")
+        while True:
+            tpl = self._get(key, schema)
+            with tpl.lock:
+                try:
+                    tpl.conn.backup(dst)
+                    return dst
+                except sqlite3.ProgrammingError:
+                    # evicted (closed) between lookup and clone; rebuild
+                    continue
+
+    def stats(self) -> dict:
+        return {
+            "templates": len(self._templates),
+            "max_templates": self.max_templates,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+template_pool = TemplatePool()
+
+
+def execute_sql(
+    schema: str,
+    sql: str,
+    schema_hash: str | None = None,
+    timeout: float = EXEC_TIMEOUT,
+    max_rows: int = EXEC_MAX_ROWS,
+    interrupt_slot: int | None = None,
+):
+    conn = template_pool.connect(schema, schema_hash)
+    deadline = time.monotonic() + timeout
+    # in a worker the interrupt is a shared flag, in-process the caller's event
+    if interrupt_slot is not None:
+        flags = _flags
+        stopped = lambda: flags[interrupt_slot] != 0
+    else:
+        event = _interrupt.get()
+        stopped = event.is_set if event is not None else None
+    # a non-zero return makes SQLite abort the statement ("interrupted")
+    if stopped is None:
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, _PROGRESS_STEPS)
+    else:
+        conn.set_progress_handler(lambda: stopped() or time.monotonic() > deadline, _PROGRESS_STEPS)
+    cur = conn.cursor()
+
+    try:
         cur.execute(sql)
-        rows = cur.fetchall()
+        columns = [d[0] for d in cur.description]
+
+        # count rows without materializing the result set
+        row_count = 0
+        truncated = False
+        for _ in cur:
+            row_count += 1
+            if row_count >= max_rows:
+                truncated = True
+                break
 
         return {
-            "row_count": len(rows),
-            "columns": [d[0] for d in cur.description]
+            "row_count": row_count,
+            "truncated": truncated,
+            "columns": columns
         }
+
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e) and stopped is not None and stopped():
+            raise _interrupted() from None
+        if "interrupted" in str(e) and time.monotonic() > deadline:
+            raise ExecutionError(
+                "timeout",
+                f"Query did not finish within {timeout:g}s. It is probably a "
+                "cartesian product (a JOIN without an ON condition) or an "
+                "unbounded recursive CTE; add the missing join conditions."
+            ) from None
+        if "out of memory" in str(e):
+            raise _memory_error() from None
+        raise
+
+    except MemoryError:
+        raise _memory_error() from None
+
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+def _memory_error() -> ExecutionError:
+    return ExecutionError(
+        "memory",
+        "Query exceeded the execution memory limit. Avoid large "
+        "intermediate results (cross joins, unfiltered self-joins)."
+    )
+
+
+# ============================
+# Worker processes
+# ============================
+_workers: ProcessPoolExecutor | None = None
+_workers_lock = threading.Lock()
+
+
+def _init_worker(max_memory: int, flags) -> None:
+    global _flags
+    _flags = flags
+    # process-wide in each worker, so one query cannot exhaust the host
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"PRAGMA hard_heap_limit = {int(max_memory)}")
+    conn.close()
+
+
+def _get_workers() -> ProcessPoolExecutor:
+    global _workers, _flags
+    with _workers_lock:
+        if _workers is None:
+            context = multiprocessing.get_context("spawn")
+            if _flags is None:
+                _flags = context.RawArray("b", _INTERRUPT_SLOTS)
+                _free_slots.extend(range(_INTERRUPT_SLOTS))
+            _workers = ProcessPoolExecutor(
+                max_workers=EXEC_WORKERS,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(EXEC_MAX_MEMORY, _flags),
+            )
+        return _workers
+
+
+def run_query(
+    schema: str,
+    sql: str,
+    schema_hash: str | None = None,
+    timeout: float = EXEC_TIMEOUT,
+    max_rows: int = EXEC_MAX_ROWS,
+):
+    """execute_sql with limits, in a worker process when EXEC_WORKERS > 0.
+
+    An interrupt stops the query in the worker through a shared flag.
+    """
+    if EXEC_WORKERS <= 0:
+        return execute_sql(schema, sql, schema_hash, timeout, max_rows)
+
+    workers = _get_workers()
+    stop = _interrupt.get()
+    slot = _acquire_slot() if stop is not None else None
+    future = workers.submit(execute_sql, schema, sql, schema_hash, timeout, max_rows, slot)
+    if slot is not None:
+        # freed once the worker is done with it, so the flag cannot reach another query
+        future.add_done_callback(lambda _: _release_slot(slot))
+    # the worker enforces the deadline itself; the margin covers a cold
+    # worker building its template
+    end = time.monotonic() + timeout + 10
+    while True:
+        left = max(0.0, end - time.monotonic())
+        try:
+            return future.result(timeout=left if stop is None else min(left, _INTERRUPT_POLL))
+        except FutureTimeout:
+            if stop is not None and stop.is_set():
+                if slot is not None:
+                    _interrupt_slot(slot, future)
+                future.cancel()
+                raise _interrupted() from None
+            if time.monotonic() >= end:
+                future.cancel()
+                raise ExecutionError(
+                    "timeout",
+                    f"Query did not finish within {timeout:g}s."
+                ) from None
+
+
+def _worker_stats() -> dict:
+    return {"pid": os.getpid(), **template_pool.stats()}
+
+
+def pool_stats(timeout: float = 2.0) -> dict:
+    """Template pool stats of the process that runs queries.
+
+    With worker processes each has its own pool: one stats call per
+    worker is queued and those answering within `timeout` are reported
+    (a worker busy with a long query may be missing).
+    """
+    if EXEC_WORKERS <= 0:
+        return {"workers": 0, "in_process": template_pool.stats()}
+    workers = _get_workers()
+    # extra calls so that every idle worker picks up at least one
+    futures = [workers.submit(_worker_stats) for _ in range(EXEC_WORKERS * 4)]
+    end = time.monotonic() + timeout
+    by_pid = {}
+    for future in futures:
+        try:
+            stats = future.result(timeout=max(0.0, end - time.monotonic()))
+        except Exception:
+            future.cancel()
+            continue
+        by_pid[stats["pid"]] = stats
+    per_worker = sorted(by_pid.values(), key=lambda s: s["pid"])
+    total = {
+        k: sum(s[k] for s in per_worker)
+        for k in ("templates", "bytes", "hits", "misses", "evictions")
+    }
+    return {"workers": EXEC_WORKERS, "reporting": len(per_worker), "total": total, "per_worker": per_worker}
+
+
+def warm_workers() -> int:
+    """Start every worker process and load its imports; returns how many ran."""
+    if EXEC_WORKERS <= 0:
+        return 0
+    # no worker is idle yet, so each submit spawns one
+    workers = _get_workers()
+    futures = [workers.submit(execute_sql, "", "SELECT 1") for _ in range(EXEC_WORKERS)]
+    for future in futures:
+        future.result()
+    return len(futures)
+
+
+def shutdown_workers() -> None:
+    global _workers
+    with _workers_lock:
+        if _workers is not None:
+            _workers.shutdown(wait=False, cancel_futures=True)
+            _workers = None
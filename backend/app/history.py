@@ -0,0 +1,418 @@
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from app.metrics import Counter, Gauge, Histogram, stage_timings
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# Config
+# ============================
+# SQLite log of every generation; empty disables the history
+HISTORY_PATH = os.getenv("HISTORY_PATH", "")
+# records written per transaction, and the longest a record waits for its batch
+HISTORY_BATCH = int(os.getenv("HISTORY_BATCH", "256"))
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "1"))
+# records waiting for the writer; past this new ones are dropped instead of slowing requests
+HISTORY_QUEUE = int(os.getenv("HISTORY_QUEUE", "10000"))
+# written as numbered files (history.db: history-000001.db, ...); past this size the
+# next one is started and only the newest HISTORY_BACKUPS older ones are kept
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))
+HISTORY_BACKUPS = int(os.getenv("HISTORY_BACKUPS", "3"))
+# how long shutdown waits for the writer to flush what is queued
+HISTORY_CLOSE_SECONDS = float(os.getenv("HISTORY_CLOSE_SECONDS", "10"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    endpoint TEXT NOT NULL,
+    request_id TEXT,
+    lane TEXT NOT NULL,
+    database TEXT NOT NULL,
+    criteria TEXT NOT NULL,
+    patterns TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    source TEXT,
+    failed_check TEXT,
+    error TEXT,
+    repair TEXT,
+    sql TEXT,
+    prompt_chars INTEGER,
+    seconds REAL NOT NULL,
+    timings TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_ok ON generations (ok);
+-- failed generations by Pattern, newest last
+CREATE TABLE IF NOT EXISTS failure_patterns (
+    pattern TEXT NOT NULL,
+    generation_id INTEGER NOT NULL,
+    PRIMARY KEY (pattern, generation_id)
+) WITHOUT ROWID;
+"""
+
+_COLUMNS = (
+    "created_at", "endpoint", "request_id", "lane", "database", "criteria", "patterns", "ok",
+    "source", "failed_check", "error", "repair", "sql", "prompt_chars", "seconds", "timings",
+)
+
+
+# ============================
+# Metrics
+# ============================
+HISTORY_RECORDS = Counter(
+    "sqlgen_history_records_total",
+    "Generation records, by outcome (written, dropped).",
+    ("outcome",),
+)
+HISTORY_WRITE_SECONDS = Histogram(
+    "sqlgen_history_write_seconds",
+    "Time the history writer took to commit one batch.",
+)
+
+
+# ============================
+# Records
+# ============================
+@dataclass
+class Generation:
+    """One finished generation, as logged."""
+
+    endpoint: str
+    lane: str
+    database: str
+    criteria: str
+    patterns: tuple[str, ...]
+    ok: bool
+    seconds: float
+    request_id: str | None = None
+    # result "cache" field: miss, hit, similar, coalesced
+    source: str | None = None
+    failed_check: str | None = None
+    error: str | None = None
+    repair: str | None = None
+    # the answer, or the last SQL checked when the generation failed
+    sql: str | None = None
+    prompt_chars: int | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+
+    def row(self) -> tuple:
+        values = {
+            **self.__dict__,
+            "patterns": json.dumps(sorted(self.patterns)),
+            "ok": int(self.ok),
+            "timings": json.dumps({k: round(v, 4) for k, v in self.timings.items()}),
+        }
+        return tuple(values[c] for c in _COLUMNS)
+
+
+# details noted by the pipeline for the record of the generation in progress
+_notes: ContextVar[dict | None] = ContextVar("sqlgen_history", default=None)
+
+
+def note_generation(**fields) -> None:
+    current = _notes.get()
+    if current is not None:
+        current.update(fields)
+
+
+def generation_notes() -> dict:
+    return _notes.get() or {}
+
+
+@contextmanager
+def track_generation() -> Iterator[dict]:
+    """Collect notes and stage timings for one generation's record."""
+    with stage_timings() as timings:
+        current = {"timings": timings, "started": time.perf_counter()}
+        token = _notes.set(current)
+        try:
+            yield current
+        finally:
+            _notes.reset(token)
+
+
+def _row_dict(row: sqlite3.Row) -> dict:
+    record = dict(row)
+    record["ok"] = bool(record["ok"])
+    record["patterns"] = json.loads(record["patterns"])
+    record["timings"] = json.loads(record["timings"])
+    return record
+
+
+# ============================
+# History log
+# ============================
+class HistoryLog:
+    """Append-only log of generations, written in batches by a background thread.
+
+    record() only puts the record on a bounded queue, so a request never
+    waits for the disk however much is logged; when the writer falls
+    behind, new records are dropped and counted. The writer commits up to
+    `batch` records per transaction to SQLite in WAL mode and starts a new
+    numbered file once the current one passes `max_bytes`, keeping
+    `backups` older files.
+    """
+
+    def __init__(
+        self,
+        path: str = HISTORY_PATH,
+        batch: int = HISTORY_BATCH,
+        flush_seconds: float = HISTORY_FLUSH_SECONDS,
+        queue_size: int = HISTORY_QUEUE,
+        max_bytes: int = HISTORY_MAX_BYTES,
+        backups: int = HISTORY_BACKUPS,
+    ):
+        self.path = path
+        self.batch = batch
+        self.flush_seconds = flush_seconds
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: queue.Queue[Generation | None] = queue.Queue(queue_size)
+        self._thread: threading.Thread | None = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self) -> None:
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = HISTORY_CLOSE_SECONDS) -> None:
+        """Write what is queued and stop the writer, waiting at most `timeout` seconds."""
+        thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            # the writer never opened its file: nothing will drain the queue
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("History close timed out: %d records not written", self._queue.qsize())
+            return
+        thread.join(timeout)
+
+    def record(self, generation: Generation) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait(generation)
+        except queue.Full:
+            self.dropped += 1
+            HISTORY_RECORDS.inc(outcome="dropped")
+
+    # -------- files --------
+    def _file(self, number: int) -> str:
+        root, ext = os.path.splitext(self.path)
+        return f"{root}-{number:06d}{ext}"
+
+    def _numbered(self) -> list[tuple[int, str]]:
+        """(number, path) of the log files on disk, newest first."""
+        directory, name = os.path.split(self.path)
+        root, ext = os.path.splitext(name)
+        pattern = re.compile(re.escape(root) + r"-(\d+)" + re.escape(ext))
+        try:
+            names = os.listdir(directory or ".")
+        except OSError:
+            return []
+        found = [(int(m.group(1)), os.path.join(directory, n)) for n in names if (m := pattern.fullmatch(n))]
+        return sorted(found, reverse=True)
+
+    def files(self) -> list[str]:
+        """The file being written, then the rotated ones, newest first."""
+        return [path for _, path in self._numbered()] if self.enabled else []
+
+    # -------- writer thread --------
+    def _open(self, number: int) -> sqlite3.Connection:
+        db = sqlite3.connect(self._file(number))
+        db.execute("PRAGMA journal_mode=WAL")
+        # a power loss may lose the last batches, never corrupt the file
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        return db
+
+    def _collect(self) -> list[Generation | None]:
+        # wait for one record, then up to flush_seconds for the rest of its batch
+        batch = [self._queue.get()]
+        flush_at = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch and batch[-1] is not None:
+            timeout = flush_at - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, db: sqlite3.Connection, batch: list[Generation]) -> None:
+        start = time.perf_counter()
+        insert = f"INSERT INTO generations ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+        with db:
+            for generation in batch:
+                row_id = db.execute(insert, generation.row()).lastrowid
+                if not generation.ok:
+                    db.executemany(
+                        "INSERT OR IGNORE INTO failure_patterns (pattern, generation_id) VALUES (?, ?)",
+                        [(p, row_id) for p in generation.patterns],
+                    )
+        HISTORY_WRITE_SECONDS.observe(time.perf_counter() - start)
+        HISTORY_RECORDS.inc(len(batch), outcome="written")
+        self.written += len(batch)
+        self.batches += 1
+
+    @staticmethod
+    def _size(db: sqlite3.Connection) -> int:
+        pages = db.execute("PRAGMA page_count").fetchone()[0]
+        return pages * db.execute("PRAGMA page_size").fetchone()[0]
+
+    def _rotate(self, db: sqlite3.Connection, number: int) -> sqlite3.Connection:
+        # a new numbered file rather than a rename: readers may hold the old one open
+        db.close()
+        db = self._open(number + 1)
+        self.rotations += 1
+        for _, path in self._numbered()[self.backups + 1:]:
+            for leftover in (path, f"{path}-wal", f"{path}-shm"):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+        return db
+
+    def _run(self) -> None:
+        numbered = self._numbered()
+        number = numbered[0][0] if numbered else 1
+        try:
+            db = self._open(number)
+        except (sqlite3.Error, OSError) as e:
+            # records queue up, then are dropped and counted
+            logger.warning("History disabled: %s", e)
+            return
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            records = [g for g in batch if g is not None]
+            if records:
+                try:
+                    self._write(db, records)
+                except sqlite3.Error as e:
+                    # losing a batch beats stopping the writer
+                    self.errors += 1
+                    self.dropped += len(records)
+                    HISTORY_RECORDS.inc(len(records), outcome="dropped")
+                    logger.warning("History write failed: %s", e)
+                try:
+                    if self._size(db) >= self.max_bytes:
+                        db = self._rotate(db, number)
+                        number += 1
+                except (sqlite3.Error, OSError) as e:
+                    self.errors += 1
+                    logger.warning("History rotation failed: %s", e)
+            if stop:
+                break
+        db.close()
+
+    @staticmethod
+    def _read(path: str) -> sqlite3.Connection:
+        # read-only: WAL lets it run alongside the writer
+        db = sqlite3.connect(Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def failures(self, pattern: str | None = None, since: float = 0.0, limit: int = 50) -> list[dict]:
+        """Failed generations since `since` (epoch seconds), newest first; with `pattern` only those detected with it.
+
+        Records still waiting for the writer (at most flush_seconds old) are not included.
+        """
+        found: list[dict] = []
+        for path in self.files():
+            if len(found) >= limit:
+                break
+            if pattern is None:
+                sql = (
+                    "SELECT * FROM generations WHERE ok = 0 AND created_at >= ? "
+                    "ORDER BY id DESC LIMIT ?"
+                )
+                args: tuple = (since, limit - len(found))
+            else:
+                sql = (
+                    "SELECT g.* FROM failure_patterns f JOIN generations g ON g.id = f.generation_id "
+                    "WHERE f.pattern = ? AND g.created_at >= ? ORDER BY f.generation_id DESC LIMIT ?"
+                )
+                args = (pattern, since, limit - len(found))
+            try:
+                with closing(self._read(path)) as db:
+                    found.extend(_row_dict(r) for r in db.execute(sql, args))
+            except sqlite3.Error:
+                # rotated away or not created yet
+                continue
+        return found
+
+    def failure_counts(self, since: float = 0.0) -> dict:
+        """Failed generations since `since` by Pattern and by failed check."""
+        by_pattern: Tally[str] = Tally()
+        by_check: Tally[str] = Tally()
+        for path in self.files():
+            try:
+                with closing(self._read(path)) as db:
+                    by_pattern.update(dict(db.execute(
+                        "SELECT f.pattern, COUNT(*) FROM failure_patterns f "
+                        "JOIN generations g ON g.id = f.generation_id "
+                        "WHERE g.created_at >= ? GROUP BY f.pattern",
+                        (since,),
+                    ).fetchall()))
+                    by_check.update(dict(db.execute(
+                        "SELECT COALESCE(failed_check, 'other'), COUNT(*) FROM generations "
+                        "WHERE ok = 0 AND created_at >= ? GROUP BY 1",
+                        (since,),
+                    ).fetchall()))
+            except sqlite3.Error:
+                continue
+        return {"by_pattern": dict(by_pattern.most_common()), "by_check": dict(by_check.most_common())}
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "errors": self.errors,
+            "files": self._sizes(),
+        }
+
+    def _sizes(self) -> dict[str, int]:
+        sizes = {}
+        for path in self.files():
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                # removed by a rotation since it was listed
+                continue
+        return sizes
+
+
+history = HistoryLog()
+
+Gauge("sqlgen_history_queue_depth", "Generation records waiting for the history writer.", callback=history._queue.qsize)
@@ -1,4 +1,8 @@
+import json
+import os
+import re
 from enum import Enum
+from pathlib import Path
 
 
 class Pattern(str, Enum):
@@ -12,47 +16,116 @@ class Pattern(str, Enum):
     ALL_USERS = "ALL_USERS"
 
 
+INTENT_RULES_PATH = os.getenv(
+    "INTENT_RULES_PATH", str(Path(__file__).with_name("intent_rules.json"))
+)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _is_word(ch: str) -> bool:
+    # ASCII letters/digits form words; CJK text has no word boundaries
+    return ch.isascii() and (ch.isalnum() or ch == "_")
+
+
+_NOT_AFTER_WORD = r"(?<![a-z0-9_])"
+_NOT_BEFORE_WORD = r"(?![a-z0-9_])"
+
+
+def _trie_regex(phrases: list[str]) -> str:
+    """One alternation with shared prefixes factored out, longest match first."""
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict, last: str) -> str:
+        alts = [re.escape(ch) + build(child, ch) for ch, child in sorted(node.items()) if ch]
+        if "" in node:
+            alts.append(_NOT_BEFORE_WORD if _is_word(last) else "")
+        if len(alts) == 1:
+            return alts[0]
+        return "(?:" + "|".join(alts) + ")"
+
+    return build(trie, "")
+
+
+# ============================
+# Compiled rules
+# ============================
+class IntentEngine:
+    """All rule phrases compiled into one regex, scanned in a single pass.
+
+    ASCII phrases only match on word boundaries ("max" does not match
+    "maximize"); CJK phrases match anywhere. The scan is a zero-width
+    lookahead, so overlapping phrases are all found.
+    """
+
+    def __init__(self, rules: list[dict]):
+        phrases: dict[str, set[Pattern]] = {}
+        for rule in rules:
+            for phrase in rule["phrases"]:
+                phrase = _normalize(phrase).strip()
+                if phrase:
+                    phrases.setdefault(phrase, set()).update(Pattern(p) for p in rule["patterns"])
+        self.rule_count = len(rules)
+        self.phrase_count = len(phrases)
+
+        # the regex reports only the longest phrase at each position, so a
+        # phrase also carries the patterns of shorter phrases it starts with
+        self._patterns: dict[str, frozenset[Pattern]] = {}
+        for phrase, patterns in phrases.items():
+            merged = set(patterns)
+            for i in range(1, len(phrase)):
+                head = phrase[:i]
+                if head in phrases and not (_is_word(phrase[i - 1]) and _is_word(phrase[i])):
+                    merged |= phrases[head]
+            self._patterns[phrase] = frozenset(merged)
+
+        bounded = [p for p in phrases if _is_word(p[0])]
+        free = [p for p in phrases if not _is_word(p[0])]
+        alts = []
+        if bounded:
+            alts.append(_NOT_AFTER_WORD + _trie_regex(bounded))
+        if free:
+            alts.append(_trie_regex(free))
+        self._regex = re.compile("(?=(" + "|".join(alts) + "))") if alts else None
+
+    @classmethod
+    def from_file(cls, path: str = INTENT_RULES_PATH) -> "IntentEngine":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["rules"])
+
+    def matches(self, criteria: str) -> set[Pattern]:
+        found: set[Pattern] = set()
+        if self._regex is None:
+            return found
+        for m in self._regex.finditer(_normalize(criteria)):
+            found |= self._patterns[m.group(1)]
+        return found
+
+    def detect(self, criteria: str) -> set[Pattern]:
+        patterns = self.matches(criteria)
+        # ---- Default ----
+        if not patterns:
+            patterns.add(Pattern.SIMPLE_SELECT)
+        return patterns
+
+    def detect_many(self, criteria: list[str]) -> list[set[Pattern]]:
+        return [self.detect(c) for c in criteria]
+
+
+# compiled once at import time
+_engine = IntentEngine.from_file()
+
+
 def detect_patterns(criteria: str) -> set[Pattern]:
-    c = criteria.lower()
-    patterns: set[Pattern] = set()
-
-    # ---- TOP / MOST ----
-    if any(w in c for w in [
-        "highest", "maximum", "max", "top",
-        "most", "largest", "best", "spent the most"
-    ]):
-        patterns.add(Pattern.TOP_PER_GROUP)
-        patterns.add(Pattern.REQUIRE_ALL_TIES)
-
-    # ---- Anti join / missing rows ----
-    if any(w in c for w in [
-        "never", "no record", "missing",
-        "without", "did not", "not placed",
-        "no orders", "no purchases"
-    ]):
-        patterns.add(Pattern.ANTI_JOIN)
-        patterns.add(Pattern.ZERO_ROW)
-
-    # ---- Distinct date ----
-    if any(w in c for w in [
-        "distinct day", "different day",
-        "more than one day"
-    ]):
-        patterns.add(Pattern.DISTINCT_DATE)
-
-    # ---- All users ----
-    if "all users" in c:
-        patterns.add(Pattern.ALL_USERS)
-        patterns.add(Pattern.ZERO_ROW)
-
-    # ---- Deduplication ----
-    if any(w in c for w in [
-        "duplicate", "duplicates", "unique"
-    ]):
-        patterns.add(Pattern.DEDUP)
-
-    # ---- Default ----
-    if not patterns:
-        patterns.add(Pattern.SIMPLE_SELECT)
-
-    return patterns
+    return _engine.detect(criteria)
+
+
+def detect_patterns_batch(criteria: list[str]) -> list[set[Pattern]]:
+    return _engine.detect_many(criteria)
@@ -0,0 +1,642 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable
+
+import httpx
+
+from app.metrics import Counter, Gauge, observe_ollama
+
+
+# ============================
+# Config
+# ============================
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+LLM_MODEL = os.getenv("LLM_MODEL", "qwen2.5:3b")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "40"))
+# upper bound on open sockets to Ollama (kept alive between calls)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "8"))
+# upper bound on generations in flight per node; extra callers wait their turn
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Ollama nodes serving LLM_MODEL, comma separated, each optionally followed
+# by weight=N and max=N, e.g. "http://gpu1:11434 weight=2 max=8, http://gpu2:11434".
+# Defaults to the single OLLAMA_URL node.
+LLM_NODES = os.getenv("LLM_NODES", "")
+# "least_outstanding" (fewest in-flight per unit of weight) or "weighted" (random by weight)
+LLM_ROUTING = os.getenv("LLM_ROUTING", "least_outstanding")
+# consecutive failures before a node is ejected, and for how long
+LLM_NODE_MAX_FAILURES = int(os.getenv("LLM_NODE_MAX_FAILURES", "3"))
+LLM_NODE_EJECT_SECONDS = float(os.getenv("LLM_NODE_EJECT_SECONDS", "30"))
+# seconds between active health checks; 0 disables them
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "15"))
+LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", "2"))
+
+# how long Ollama keeps the model (and its KV cache) loaded after a call
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+# prefixes remembered for hit-rate accounting
+LLM_PREFIX_TRACK_SIZE = int(os.getenv("LLM_PREFIX_TRACK_SIZE", "256"))
+
+# generation ends once the statement is complete, at a ";" ending its line.
+# A bare ";" would also stop inside a literal ('a;b'), and "\n```" at the
+# opening fence after a lead-in line ("Here is the query:"); text after a
+# closing fence is dropped by strip_markdown, a second statement rejected
+LLM_STOP = [";\n"]
+
+LLM_OPTIONS = {
+    "temperature": 0,
+    "top_p": 0.05,
+    "num_predict": 250,
+    "stop": LLM_STOP,
+}
+
+# num_predict learned per budget key (a Pattern): headroom over the p95 of
+# recent output lengths, within [MIN, MAX]; LLM_OPTIONS until enough samples
+LLM_BUDGET_HEADROOM = float(os.getenv("LLM_BUDGET_HEADROOM", "1.5"))
+LLM_BUDGET_MIN = int(os.getenv("LLM_BUDGET_MIN", "64"))
+LLM_BUDGET_MAX = int(os.getenv("LLM_BUDGET_MAX", "512"))
+LLM_BUDGET_MIN_SAMPLES = int(os.getenv("LLM_BUDGET_MIN_SAMPLES", "20"))
+LLM_BUDGET_WINDOW = 200
+
+
+# ============================
+# Output cleanup
+# ============================
+_FENCED = re.compile(r"```[a-zA-Z]*\n(.*?)```", flags=re.DOTALL)
+_LANG_TOKENS = ("sql\n", "postgresql\n", "mysql\n", "sqlite\n", "sqlserver\n")
+
+
+def strip_markdown(raw: str) -> str:
+    raw = raw.strip()
+
+    # strip markdown if model adds it
+    if "```" in raw:
+        m = _FENCED.search(raw)
+        if m:
+            raw = m.group(1).strip()
+        else:
+            parts = raw.split("```")
+            if len(parts) >= 2:
+                raw = parts[1].strip()
+        # drop leading language token like 'sql'
+        if raw.lower().startswith(_LANG_TOKENS):
+            raw = "\n".join(raw.splitlines()[1:]).strip()
+
+    return raw.rstrip(";")
+
+
+# ============================
+# Prompt
+# ============================
+@dataclass(frozen=True)
+class Prompt:
+    """A stable per-(schema, dialect) prefix plus a small per-question part.
+
+    Sent through Ollama's chat API as system + user messages; identical
+    system messages let Ollama reuse the KV cache it already evaluated.
+    """
+    system: str
+    user: str
+
+
+def _keep_alive_seconds(value: str) -> float:
+    m = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*([smh]?)\s*", value or "")
+    if not m:
+        return 0.0
+    n = float(m.group(1))
+    if n < 0:
+        return float("inf")
+    return n * {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+
+
+class PrefixTracker:
+    """Estimates prefix (KV cache) reuse from the prefixes we have sent.
+
+    A prefix counts as a hit when it was sent before and the model has
+    not been idle longer than keep_alive since. Ollama's prompt_eval_count
+    is recorded per outcome so the estimate can be checked.
+    """
+
+    def __init__(self, keep_alive: str = LLM_KEEP_ALIVE, size: int = LLM_PREFIX_TRACK_SIZE):
+        self.ttl = _keep_alive_seconds(keep_alive)
+        self.size = size
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.eval_tokens = {"hit": 0, "miss": 0}
+
+    def lookup(self, system: str) -> bool:
+        key = hashlib.sha1(system.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        last = self._seen.get(key)
+        hit = last is not None and now - last <= self.ttl
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def record(self, hit: bool, prompt_eval_count: int | None) -> None:
+        if prompt_eval_count:
+            self.eval_tokens["hit" if hit else "miss"] += prompt_eval_count
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_prompt_eval_hit": self.eval_tokens["hit"] / self.hits if self.hits else 0.0,
+            "avg_prompt_eval_miss": self.eval_tokens["miss"] / self.misses if self.misses else 0.0,
+        }
+
+
+# ============================
+# Generation budgets
+# ============================
+class GenerationBudgets:
+    """num_predict per key, learned from the eval_count Ollama reports.
+
+    An output cut off at num_predict is recorded as twice that long, so
+    a budget that turns out too tight grows quickly. A call with several
+    keys gets the largest of their budgets.
+    """
+
+    def __init__(self, default: int = LLM_OPTIONS["num_predict"]):
+        self.default = default
+        self._samples: dict[str, deque[int]] = {}
+        self.truncated = 0
+
+    def _budget(self, key: str) -> int:
+        samples = self._samples.get(key)
+        if samples is None or len(samples) < LLM_BUDGET_MIN_SAMPLES:
+            return self.default
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return max(LLM_BUDGET_MIN, min(LLM_BUDGET_MAX, int(p95 * LLM_BUDGET_HEADROOM)))
+
+    def num_predict(self, keys: Iterable[str]) -> int:
+        return max((self._budget(k) for k in keys), default=self.default)
+
+    def observe(self, keys: Iterable[str], num_predict: int, chunk: dict) -> None:
+        tokens = chunk.get("eval_count")
+        if not tokens:
+            return
+        if chunk.get("done_reason") == "length" or tokens >= num_predict:
+            self.truncated += 1
+            tokens = min(2 * num_predict, LLM_BUDGET_MAX)
+        for k in keys:
+            self._samples.setdefault(k, deque(maxlen=LLM_BUDGET_WINDOW)).append(tokens)
+
+    def stats(self) -> dict:
+        return {
+            "truncated": self.truncated,
+            "num_predict": {k: {"samples": len(v), "budget": self._budget(k)} for k, v in sorted(self._samples.items())},
+        }
+
+
+# ============================
+# Nodes
+# ============================
+LLM_RETRIES = Counter(
+    "sqlgen_llm_retries_total",
+    "LLM calls retried on another node after a connection error.",
+)
+LLM_EJECTIONS = Counter(
+    "sqlgen_llm_node_ejections_total",
+    "Times a node was taken out of rotation.",
+    ("node",),
+)
+
+# errors where the request never produced output, so another node may take it
+_RETRYABLE = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (502, 503)
+    return isinstance(error, _RETRYABLE)
+
+
+class OllamaNode:
+    """One Ollama server with its own keep-alive pool and concurrency limit."""
+
+    def __init__(
+        self,
+        url: str,
+        weight: float = 1.0,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        timeout: float = LLM_TIMEOUT,
+    ):
+        self.url = url.rstrip("/")
+        self.weight = max(weight, 0.001)
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=self.timeout,
+            )
+        return self._client
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / self.weight
+
+    def succeeded(self) -> None:
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def failed(self) -> None:
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= LLM_NODE_MAX_FAILURES and self.healthy:
+            self.ejected_until = time.monotonic() + LLM_NODE_EJECT_SECONDS
+            LLM_EJECTIONS.inc(node=self.url)
+
+    async def check(self) -> bool:
+        try:
+            response = await self.http().get("/api/version", timeout=LLM_HEALTH_TIMEOUT)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.failures = max(self.failures, LLM_NODE_MAX_FAILURES - 1)
+            self.failed()
+            return False
+        self.succeeded()
+        return True
+
+    async def warm_up(self, model: str) -> None:
+        """Load the model with a one-token generation; keep_alive keeps it loaded."""
+        response = await self.http().post("/api/generate", json={
+            "model": model,
+            "prompt": "SELECT",
+            "stream": False,
+            "keep_alive": LLM_KEEP_ALIVE,
+            "options": {"num_predict": 1},
+        })
+        response.raise_for_status()
+        self.succeeded()
+
+    def stats(self) -> dict:
+        open_conns = idle_conns = 0
+        if self._client is not None:
+            pool = getattr(self._client._transport, "_pool", None)
+            conns = list(getattr(pool, "connections", []))
+            open_conns = len(conns)
+            idle_conns = sum(1 for c in conns if c.is_idle())
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "open_connections": open_conns,
+            "idle_connections": idle_conns,
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def parse_nodes(spec: str) -> list[OllamaNode]:
+    nodes = []
+    for item in spec.split(","):
+        parts = item.split()
+        if not parts:
+            continue
+        opts = dict(p.split("=", 1) for p in parts[1:] if "=" in p)
+        nodes.append(OllamaNode(
+            parts[0],
+            weight=float(opts.get("weight", 1)),
+            max_concurrency=int(opts.get("max", LLM_MAX_CONCURRENCY)),
+        ))
+    return nodes
+
+
+# ============================
+# Client
+# ============================
+class LLMClient:
+    """Async Ollama client routing generations over a pool of nodes.
+
+    Each call takes a slot on one healthy node (least outstanding
+    requests or weighted random), waiting when every node is at its
+    limit. Nodes that keep failing are ejected for a while; when all
+    are ejected they are all tried anyway. A call that fails to connect
+    is retried on a node it has not tried yet.
+    """
+
+    def __init__(
+        self,
+        nodes: list[OllamaNode] | None = None,
+        model: str = LLM_MODEL,
+        routing: str = LLM_ROUTING,
+    ):
+        self.nodes = nodes or parse_nodes(LLM_NODES) or [OllamaNode(OLLAMA_URL)]
+        self.model = model
+        self.routing = routing
+        self._changed: asyncio.Condition | None = None
+        self._health_task: asyncio.Task | None = None
+        self._in_flight = 0
+        self._waiting = 0
+        self._requests = 0
+        self._errors = 0
+        self._retries = 0
+        # which node last evaluated a prefix, to keep its KV cache warm
+        self._affinity: OrderedDict[str, OllamaNode] = OrderedDict()
+        self.prefixes = PrefixTracker()
+        self.budgets = GenerationBudgets()
+        # moving average of a non-streamed call, slot wait included
+        self._call_seconds: float | None = None
+
+    def _payload(
+        self, prompt: Prompt | str, options: dict | None, stream: bool, budget: tuple[str, ...] = ()
+    ) -> tuple[str, dict]:
+        options = options or {}
+        if budget and "num_predict" not in options:
+            options = {**options, "num_predict": self.budgets.num_predict(budget)}
+        payload = {
+            "model": self.model,
+            "stream": stream,
+            "keep_alive": LLM_KEEP_ALIVE,
+            "options": {**LLM_OPTIONS, **options},
+        }
+        if isinstance(prompt, Prompt):
+            payload["messages"] = [
+                {"role": "system", "content": prompt.system},
+                {"role": "user", "content": prompt.user},
+            ]
+            return "/api/chat", payload
+        payload["prompt"] = prompt
+        return "/api/generate", payload
+
+    @staticmethod
+    def _text(chunk: dict) -> str:
+        if "message" in chunk:
+            return chunk["message"].get("content", "")
+        return chunk.get("response", "")
+
+    # -------- routing --------
+    def _candidates(self, tried: set[OllamaNode]) -> list[OllamaNode]:
+        untried = [n for n in self.nodes if n not in tried]
+        healthy = [n for n in untried if n.healthy]
+        # all ejected: better to try them than to fail outright
+        return healthy or untried
+
+    def _pick(self, tried: set[OllamaNode], prefix: str | None) -> OllamaNode | None:
+        free = [n for n in self._candidates(tried) if n.in_flight < n.max_concurrency]
+        if not free:
+            return None
+        if self.routing == "weighted":
+            return random.choices(free, weights=[n.weight for n in free])[0]
+        lowest = min(n.load for n in free)
+        best = [n for n in free if n.load == lowest]
+        preferred = self._affinity.get(prefix) if prefix else None
+        return preferred if preferred in best else best[0]
+
+    def _remember(self, prefix: str | None, node: OllamaNode) -> None:
+        if prefix:
+            self._affinity[prefix] = node
+            self._affinity.move_to_end(prefix)
+            while len(self._affinity) > LLM_PREFIX_TRACK_SIZE:
+                self._affinity.popitem(last=False)
+
+    @asynccontextmanager
+    async def _slot(self, tried: set[OllamaNode], prefix: str | None = None):
+        if not self._candidates(tried):
+            raise httpx.ConnectError("No LLM node left to try")
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+
+        self._waiting += 1
+        try:
+            async with self._changed:
+                node = self._pick(tried, prefix)
+                while node is None:
+                    await self._changed.wait()
+                    node = self._pick(tried, prefix)
+                node.in_flight += 1
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        self._requests += 1
+        node.requests += 1
+        self._remember(prefix, node)
+        try:
+            yield node
+        except Exception:
+            self._errors += 1
+            raise
+        finally:
+            node.in_flight -= 1
+            self._in_flight -= 1
+            async with self._changed:
+                self._changed.notify()
+
+    def _failed(self, node: OllamaNode, error: Exception, tried: set[OllamaNode]) -> bool:
+        """Record a failed call; True when it should be retried elsewhere."""
+        if isinstance(error, httpx.TransportError) or _retryable(error):
+            node.failed()
+        tried.add(node)
+        if not _retryable(error) or not self._candidates(tried):
+            return False
+        self._retries += 1
+        LLM_RETRIES.inc()
+        return True
+
+    # -------- calls --------
+    async def generate(
+        self, prompt: Prompt | str, options: dict | None = None, budget: tuple[str, ...] = ()
+    ) -> str:
+        """One completion. `budget` names the keys (Patterns) whose learned num_predict applies."""
+        path, payload = self._payload(prompt, options, stream=False, budget=budget)
+        prefix = prompt.system if isinstance(prompt, Prompt) else None
+        tried: set[OllamaNode] = set()
+        start = time.monotonic()
+
+        while True:
+            async with self._slot(tried, prefix) as node:
+                hit = prefix is not None and self.prefixes.lookup(node.url + "\n" + prefix)
+                try:
+                    response = await node.http().post(path, json=payload)
+                    response.raise_for_status()
+                except httpx.HTTPError as e:
+                    if self._failed(node, e, tried):
+                        continue
+                    raise
+                node.succeeded()
+            break
+
+        data = response.json()
+        observe_ollama(data)
+        if prefix is not None:
+            self.prefixes.record(hit, data.get("prompt_eval_count"))
+        if budget:
+            self.budgets.observe(budget, payload["options"]["num_predict"], data)
+        self._observe_seconds(time.monotonic() - start)
+        return strip_markdown(self._text(data))
+
+    def _observe_seconds(self, seconds: float) -> None:
+        if self._call_seconds is None:
+            self._call_seconds = seconds
+        else:
+            self._call_seconds += 0.2 * (seconds - self._call_seconds)
+
+    @property
+    def expected_seconds(self) -> float:
+        """Typical duration of one call, 0 before the first one."""
+        return self._call_seconds or 0.0
+
+    async def stream(
+        self, prompt: Prompt | str, options: dict | None = None, budget: tuple[str, ...] = ()
+    ) -> AsyncIterator[str]:
+        """Yield raw response tokens as Ollama produces them.
+
+        Closing the generator early closes the HTTP response, which makes
+        Ollama stop generating. Only calls that have not produced a token
+        yet are retried on another node.
+        """
+        path, payload = self._payload(prompt, options, stream=True, budget=budget)
+        prefix = prompt.system if isinstance(prompt, Prompt) else None
+        tried: set[OllamaNode] = set()
+
+        while True:
+            started = False
+            async with self._slot(tried, prefix) as node:
+                hit = prefix is not None and self.prefixes.lookup(node.url + "\n" + prefix)
+                try:
+                    async with node.http().stream("POST", path, json=payload) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            text = self._text(chunk)
+                            if text:
+                                started = True
+                                yield text
+                            if chunk.get("done"):
+                                observe_ollama(chunk)
+                                if prefix is not None:
+                                    self.prefixes.record(hit, chunk.get("prompt_eval_count"))
+                                if budget:
+                                    self.budgets.observe(budget, payload["options"]["num_predict"], chunk)
+                                break
+                except httpx.HTTPError as e:
+                    if not started and self._failed(node, e, tried):
+                        continue
+                    if started:
+                        node.failed()
+                    raise
+                node.succeeded()
+            return
+
+    # -------- health --------
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(LLM_HEALTH_INTERVAL)
+            await asyncio.gather(*(n.check() for n in self.nodes))
+            if self._changed is not None:
+                async with self._changed:
+                    self._changed.notify_all()
+
+    async def warm_up(self) -> int:
+        """Load the model on every node in rotation; returns how many are warm.
+
+        Raises the last error when none could be warmed.
+        """
+        warmed = 0
+        error: Exception | None = None
+        for node in self._candidates(set()):
+            try:
+                await node.warm_up(self.model)
+                warmed += 1
+            except httpx.HTTPError as e:
+                node.failed()
+                error = e
+        if not warmed:
+            raise error or httpx.ConnectError("No LLM node to warm up")
+        return warmed
+
+    def start(self) -> None:
+        """Start active health checks (when there is more than one node)."""
+        if LLM_HEALTH_INTERVAL > 0 and len(self.nodes) > 1 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    @property
+    def available(self) -> int:
+        """Generation slots that are free right now."""
+        free = sum(max(0, n.max_concurrency - n.in_flight) for n in self._candidates(set()))
+        return max(0, free - self._waiting)
+
+    @property
+    def capacity(self) -> int:
+        """Generation slots of the nodes in rotation."""
+        return sum(n.max_concurrency for n in self._candidates(set()))
+
+    def stats(self) -> dict:
+        nodes = [n.stats() for n in self.nodes]
+        return {
+            "model": self.model,
+            "routing": self.routing,
+            "max_concurrency": sum(n.max_concurrency for n in self.nodes),
+            "open_connections": sum(n["open_connections"] for n in nodes),
+            "idle_connections": sum(n["idle_connections"] for n in nodes),
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "requests": self._requests,
+            "errors": self._errors,
+            "retries": self._retries,
+            "avg_call_seconds": self._call_seconds,
+            "nodes": nodes,
+            "prefix_cache": self.prefixes.stats(),
+            "budgets": self.budgets.stats(),
+        }
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for n in self.nodes:
+            await n.aclose()
+
+
+llm_client = LLMClient()
+
+Gauge("sqlgen_llm_in_flight", "Ollama generations in flight.", callback=lambda: llm_client._in_flight)
+Gauge("sqlgen_llm_waiting", "Callers waiting for a generation slot.", callback=lambda: llm_client._waiting)
@@ -1,16 +1,48 @@
-import requests
-from fastapi import FastAPI, HTTPException, Header
+import asyncio
+import codecs
+import json
+import os
+import threading
+import time
+from dataclasses import asdict
+from contextlib import aclosing, asynccontextmanager
+from typing import Callable
+
+import httpx
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from app.intent import detect_patterns, Pattern
+from app.intent import detect_patterns, detect_patterns_batch, Pattern
 from app.strategy import STRATEGY_RULES
-from app.validator import validate_sql, validate_schema_references, parse_schema
+from app.validator import validate_sql, validate_sql_prefix, validate_schema_references
 from app.verifier import verify_sql
+from app.analysis import sqlglot_dialect
 from app.dialects import DIALECT_RULES
 from app.rewriter import rewrite_criteria
-from app.executor import execute_sql
+from app.executor import EXEC_TIMEOUT, interrupt_on, pool_stats, run_query, shutdown_workers
 from app.requirements import REQUIREMENTS
+from app.llm import LLM_OPTIONS, Prompt, llm_client, strip_markdown
+from app.cache import cache_key, inflight, sql_cache
+from app.examples import Example, example_store
+from app.deadline import DeadlineExceeded, budget, deadline, iterate, remaining, within
+from app.admission import BATCH, INTERACTIVE, LANES, Overloaded, admission
+from app.cancellation import RequestCancelled, cancellations
+from app.warmup import warmup
+from app.history import Generation, generation_notes, history, note_generation, track_generation
+from app.ddl import DDLParser
+from app.schemas import SchemaIndex, schema_registry
+from app.pruning import SchemaView, prune_schema
+from app.metrics import (
+    COALESCED, EXAMPLE_REUSES, MetricsMiddleware, count_auto_repair, count_failure, count_first_attempt,
+    count_generation, count_repair, failed_check, registry, timed,
+)
+from app.autofix import auto_repair
+from app.transpile import (
+    TRANSPILE_CANONICAL, VERIFY_VIA_SQLITE, render_targets, run_transpiled, unknown_targets,
+)
 
 
 # ============================
@@ -19,21 +51,58 @@ from app.requirements import REQUIREMENTS
 class SQLRequest(BaseModel):
     language: str
     database: str
-    schema: str
+    # either the full DDL or the id returned by POST /schemas
+    schema: str | None = None
+    schema_id: str | None = None
     criteria: str
+    # opt-in: race this many candidate generations instead of repairing serially
+    candidates: int | None = None
+    # opt-in: generate once in TRANSPILE_CANONICAL and return every target
+    targets: list[str] | None = None
+
+
+class SchemaRequest(BaseModel):
+    schema: str
+
+
+class BatchRequest(BaseModel):
+    language: str
+    database: str
+    schema: str | None = None
+    schema_id: str | None = None
+    criteria: list[str]
+    # per-batch cap on parallel generations (bounded by BATCH_MAX_CONCURRENCY)
+    concurrency: int | None = None
+    targets: list[str] | None = None
 
 
 # ============================
 # App
 # ============================
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    llm_client.start()
+    history.start()
+    warmup.start()
+    yield
+    await warmup.stop()
+    await llm_client.aclose()
+    shutdown_workers()
+    await run_in_threadpool(sql_cache.close)
+    await run_in_threadpool(example_store.close)
+    await run_in_threadpool(history.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 # ============================
@@ -41,75 +110,82 @@ app.add_middleware(
 # ============================
 SECRET_KEY = "my-super-secret-key-123"
 
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+SPECULATIVE_MAX_CANDIDATES = int(os.getenv("SPECULATIVE_MAX_CANDIDATES", "4"))
+SCHEMA_UPLOAD_MAX_BYTES = int(os.getenv("SCHEMA_UPLOAD_MAX_BYTES", str(64 * 1024 * 1024)))
+
 def verify_api_key(x_api_key: str = Header(None)):
     if x_api_key != SECRET_KEY:
         raise HTTPException(status_code=403, detail="Access denied")
 
 
 # ============================
-# LLM call
+# Admission
 # ============================
-def call_llm(prompt: str) -> str:
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "qwen2.5:3b",
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0,
-                "top_p": 0.05,
-                "num_predict": 250
-            }
-        },
-        timeout=40
-    )
+def request_lane(x_priority: str | None) -> str:
+    """Lane of a single request: interactive unless the client asks for "X-Priority: batch"."""
+    lane = (x_priority or INTERACTIVE).lower()
+    if lane not in LANES:
+        raise HTTPException(status_code=422, detail=f"X-Priority must be one of: {', '.join(LANES)}")
+    return lane
 
-    response.raise_for_status()
 
-    raw = response.json().get("response", "").strip()
+def too_busy(error: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
 
-    # strip markdown if model adds it
-    if "```" in raw:
-        import re
-        m = re.search(r"```[a-zA-Z]*\n(.*?)```", raw, flags=re.DOTALL)
-        if m:
-            raw = m.group(1).strip()
-        else:
-            parts = raw.split("```")
-            if len(parts) >= 2:
-                raw = parts[1].strip()
-        # drop leading language token like 'sql'
-        if raw.lower().startswith(("sql\n", "postgresql\n", "mysql\n", "sqlite\n", "sqlserver\n")):
-            raw = "\n".join(raw.splitlines()[1:]).strip()
 
-    return raw.rstrip(";")
+# ============================
+# Schema resolution
+# ============================
+async def resolve_schema(req: SQLRequest | BatchRequest) -> SchemaIndex:
+    if req.schema_id:
+        schema = schema_registry.get(req.schema_id)
+        if schema is None:
+            raise HTTPException(status_code=404, detail=f"Unknown schema_id: {req.schema_id}")
+        return schema
+    if req.schema:
+        # hashing, and on a miss parsing, a large DDL would stall the event loop
+        return await run_in_threadpool(schema_registry.register, req.schema)
+    raise HTTPException(status_code=422, detail="Either schema or schema_id is required")
+
+
+def canonical_request(req: SQLRequest | BatchRequest) -> SQLRequest | BatchRequest:
+    """The request to generate for: itself, or the canonical one when targets are given."""
+    if not req.targets:
+        return req
+    unknown = unknown_targets(req.targets)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown target databases: {', '.join(unknown)}")
+    return req.model_copy(update={"database": TRANSPILE_CANONICAL, "targets": None})
 
 
 # ============================
-# Prompt builder
+# LLM call
 # ============================
-def build_prompt(req: SQLRequest) -> str:
-    patterns = detect_patterns(req.criteria)
+def pattern_keys(patterns: set[Pattern]) -> tuple[str, ...]:
+    """Keys of the learned num_predict budgets."""
+    return tuple(sorted(p.value for p in patterns))
 
-    # rewrite ambiguous questions
-    rewritten_criteria = rewrite_criteria(
-        req.criteria,
-        patterns,
-        req.language
-    )
 
-    strategy_text = "\n".join(
-        STRATEGY_RULES[p] for p in patterns if p in STRATEGY_RULES
-    )
+async def call_llm(prompt: Prompt | str, patterns: set[Pattern] = frozenset()) -> str:
+    with timed("llm"):
+        return await within("llm", llm_client.generate(prompt, budget=pattern_keys(patterns)))
 
-    dialect_rule = DIALECT_RULES.get(req.database, "")
-    simple = Pattern.SIMPLE_SELECT in patterns
-    # summarize schema in a compact form to reduce hallucinations
-    schema_map = parse_schema(req.schema)
-    tables_summary = "\n".join(
-        f"- {tbl}({', '.join(sorted(cols))})" for tbl, cols in schema_map.items()
-    )
+
+# ============================
+# Prompt builder
+# ============================
+def build_prompt_prefix(view: SchemaView, database: str) -> str:
+    """Everything that only depends on (schema, dialect).
+
+    Sent as the chat system message so Ollama can reuse its evaluated
+    KV cache across questions against the same schema. It carries the
+    whole schema, not the question's pruned tables, unless the schema is
+    over SCHEMA_PREFIX_MAX_TOKENS.
+    """
+    dialect_rule = DIALECT_RULES.get(database, "")
+    # compact schema summary (precompiled) to reduce hallucinations
+    tables_summary = view.prefix_summary
 
     return f"""
 You are an expert SQL problem solver.
@@ -124,72 +200,96 @@ ABSOLUTE RULES:
 - Use ONLY the following TABLES and COLUMNS:
 {tables_summary}
 
-{"DO NOT use JOIN unless required." if simple else ""}
-
-STRATEGY RULES:
-{strategy_text}
-
 DIALECT:
 {dialect_rule}
 
 SCHEMA:
-{req.schema}
+{view.prefix_ddl}
+"""
+
+
+def build_focus(view: SchemaView) -> str:
+    """The tables pruning picked for the question, when the prefix has the whole schema."""
+    if not view.focused:
+        return ""
+    return f"\nRELEVANT TABLES (most likely needed; the schema has the rest):\n{view.tables_summary}\n"
+
+
+def build_prompt(
+    req: SQLRequest, view: SchemaView, patterns: set[Pattern], examples: list[Example] = ()
+) -> Prompt:
+    # rewrite ambiguous questions
+    rewritten_criteria = rewrite_criteria(
+        req.criteria,
+        patterns,
+        req.language
+    )
+
+    strategy_text = "\n".join(
+        STRATEGY_RULES[p] for p in patterns if p in STRATEGY_RULES
+    )
+
+    simple = Pattern.SIMPLE_SELECT in patterns
+
+    # validated answers to similar questions; kept out of the system
+    # prefix so it stays identical across questions
+    examples_text = ""
+    if examples:
+        examples_text = "\nEXAMPLES (correct SQL for similar questions on this schema):\n" + "\n\n".join(
+            f"Q: {e.criteria}\nSQL: {e.sql}" for e in examples
+        ) + "\n"
 
+    prompt = Prompt(build_prompt_prefix(view, req.database), f"""
+{"DO NOT use JOIN unless required." if simple else ""}
+{build_focus(view)}
+STRATEGY RULES:
+{strategy_text}
+{examples_text}
 QUESTION:
 {rewritten_criteria}
-"""
+""")
+    note_generation(prompt_chars=len(prompt.system) + len(prompt.user))
+    return prompt
 
 
 # ============================
-# Endpoint
+# Repair prompt
 # ============================
-@app.post("/generate-sql")
-def generate_sql(req: SQLRequest, x_api_key: str = Header(None)):
-    verify_api_key(x_api_key)
-
-    patterns = detect_patterns(req.criteria)
+def build_fix_prompt(
+    req: SQLRequest,
+    view: SchemaView,
+    sql: str,
+    error: Exception,
+    patterns: set[Pattern],
+) -> Prompt:
+    # Build constraints text from requirements/patterns
+    must_use = set()
+    forbidden = set()
+    for p in patterns:
+        r = REQUIREMENTS.get(p)
+        if r:
+            must_use |= {x.lower() for x in r.must_use}
+            forbidden |= {x.lower() for x in r.forbidden}
 
-    # -------- first attempt --------
-    sql = call_llm(build_prompt(req))
+    constraints = []
+    if must_use:
+        constraints.append("Must use: " + ", ".join(sorted(must_use)))
+    if forbidden:
+        constraints.append("Forbidden: " + ", ".join(sorted(forbidden)))
+    dialect_rule = DIALECT_RULES.get(req.database, "")
 
-    try:
-        validate_sql(sql)
-        validate_schema_references(req.schema, sql)
-        verify_sql(sql, patterns)
-        if req.database.lower() == "sqlite":
-            if parse_schema(req.schema):
-                execute_sql(req.schema, sql)
-        return {"sql": sql}
+    # include schema table names to avoid hallucinations
+    constraints.append("Use ONLY tables and columns from the schema.")
+    constraints.append(f"Dialect: {dialect_rule}")
 
-    except Exception as e:
-        # -------- one controlled repair --------
-        # Build constraints text from requirements/patterns
-        must_use = set()
-        forbidden = set()
-        for p in patterns:
-            r = REQUIREMENTS.get(p)
-            if r:
-                must_use |= {x.lower() for x in r.must_use}
-                forbidden |= {x.lower() for x in r.forbidden}
-
-        constraints = []
-        if must_use:
-            constraints.append("Must use: " + ", ".join(sorted(must_use)))
-        if forbidden:
-            constraints.append("Forbidden: " + ", ".join(sorted(forbidden)))
-        dialect_rule = DIALECT_RULES.get(req.database, "")
-
-        # include schema table names to avoid hallucinations
-        constraints.append("Use ONLY tables and columns from the schema.")
-        constraints.append(f"Dialect: {dialect_rule}")
-
-        fix_prompt = f"""
+    # same system prefix as the first attempt, so the schema stays cached
+    return Prompt(build_prompt_prefix(view, req.database), f"""
 The following SQL is INVALID:
 
 {sql}
 
 ERROR:
-{str(e)}
+{str(error)}
 
 Fix the SQL.
 
@@ -202,22 +302,800 @@ Rules:
 
 Additional constraints:
 {chr(10).join(constraints)}
+""")
+
+
+# ============================
+# Checks
+# ============================
+def check_sql(req: SQLRequest, schema: SchemaIndex, sql: str, patterns: set[Pattern]) -> None:
+    """Run every check in order; the raised error carries .check naming the one that failed."""
+    dialect = sqlglot_dialect(req.database)
+    checks = [
+        ("statement", lambda: validate_sql(sql, dialect)),
+        ("references", lambda: validate_schema_references(schema.tables, sql, schema.ambiguous, dialect)),
+        ("patterns", lambda: verify_sql(sql, patterns, dialect)),
+    ]
+    if schema.tables:
+        # the query gets what is left of the request deadline, at most EXEC_TIMEOUT
+        if req.database.lower() == "sqlite":
+            checks.append(("execution", lambda: run_query(
+                schema.ddl, sql, schema.content_hash, budget("execution", EXEC_TIMEOUT)
+            )))
+        elif VERIFY_VIA_SQLITE:
+            checks.append(("execution", lambda: run_transpiled(
+                schema, sql, req.database, budget("execution", EXEC_TIMEOUT)
+            )))
+
+    for name, check in checks:
+        with timed(f"check_{name}"):
+            try:
+                check()
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                e.check = name
+                raise
+
+
+async def run_check(req: SQLRequest, schema: SchemaIndex, sql: str, patterns: set[Pattern]) -> None:
+    """check_sql in the threadpool; cancelling the caller interrupts its query."""
+    note_generation(sql=sql)
+    stop = threading.Event()
+    with interrupt_on(stop):
+        work = asyncio.ensure_future(run_in_threadpool(check_sql, req, schema, sql, patterns))
+    try:
+        await asyncio.shield(work)
+    except asyncio.CancelledError:
+        stop.set()
+        # the thread finishes on its own; nobody needs its outcome
+        work.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise
+
+
+def request_cache_key(req: SQLRequest, schema: SchemaIndex) -> str:
+    return cache_key(
+        schema.content_hash, req.criteria, req.database, req.language,
+        llm_client.model, LLM_OPTIONS
+    )
+
+
+# ============================
+# Validated examples
+# ============================
+def remember(key: str, req: SQLRequest, schema: SchemaIndex, patterns: set[Pattern], sql: str) -> None:
+    """Cache SQL that passed every check and keep it as an example for similar questions."""
+    sql_cache.put(key, sql)
+    example_store.add(schema.content_hash, req.criteria, patterns, req.database, sql)
 
-Schema:
-{req.schema}
-"""
 
-        sql = call_llm(fix_prompt)
+async def consult_examples(
+    req: SQLRequest, schema: SchemaIndex, patterns: set[Pattern]
+) -> tuple[dict | None, list[Example]]:
+    """(result reusing a near-duplicate question's SQL or None, few-shot examples for the prompt).
 
+    A reused answer is re-checked first; one that fails is forgotten.
+    """
+    with timed("examples"):
+        similar = await example_store.search(schema.content_hash, req.criteria, req.database)
+    match = example_store.near_duplicate(similar, req.criteria, patterns)
+    if match is not None:
+        similarity, example = match
         try:
-            validate_sql(sql)
-            validate_schema_references(req.schema, sql)
-            verify_sql(sql, patterns)
-            if req.database.lower() == "sqlite":
-                if parse_schema(req.schema):
-                    execute_sql(req.schema, sql)
-            return {"sql": sql}
-
-        except Exception as final_error:
-            print("FINAL ERROR:", final_error)
-            raise HTTPException(status_code=500, detail=str(final_error))
+            await run_check(req, schema, example.sql, patterns)
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            example_store.discard(schema.content_hash, example)
+            similar = similar[1:]
+        else:
+            example_store.record_reuse()
+            EXAMPLE_REUSES.inc()
+            return {"sql": example.sql, "cache": "similar", "similarity": round(similarity, 3)}, []
+    return None, example_store.few_shot(similar)
+
+
+def record_first_attempt(examples: list[Example], passed: bool) -> None:
+    example_store.record_first_attempt(bool(examples), passed)
+    count_first_attempt(bool(examples), passed)
+
+
+# ============================
+# Speculative candidates
+# ============================
+def candidate_options(i: int) -> dict:
+    # candidate 0 is the regular greedy decode; the others sample around it
+    if i == 0:
+        return {}
+    return {"temperature": round(0.2 * i, 2), "top_p": 0.9, "seed": i}
+
+
+class CandidateFailed(Exception):
+    def __init__(self, sql: str, error: Exception):
+        super().__init__(str(error))
+        self.sql = sql
+        self.error = error
+
+
+async def speculate(
+    req: SQLRequest,
+    schema: SchemaIndex,
+    patterns: set[Pattern],
+    prompt: Prompt,
+    n: int,
+) -> tuple[int | None, str, Exception | None]:
+    """Race n candidates and return (index, sql, None) for the first that passes.
+
+    The remaining candidates are cancelled, which closes their Ollama
+    requests. When all fail, returns (None, sql, error) of the lowest-numbered
+    candidate that produced SQL, so the caller can still repair it.
+    """
+
+    async def candidate(i: int) -> str:
+        with timed("llm"):
+            sql = await within("llm", llm_client.generate(prompt, candidate_options(i), pattern_keys(patterns)))
+        try:
+            await run_check(req, schema, sql, patterns)
+        except Exception as e:
+            raise CandidateFailed(sql, e) from e
+        return sql
+
+    tasks = {asyncio.create_task(candidate(i)): i for i in range(n)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return tasks[t], t.result(), None
+    finally:
+        for t in pending:
+            t.cancel()
+
+    errors = [t.exception() for t in sorted(tasks, key=tasks.get)]
+    failed = [e for e in errors if isinstance(e, CandidateFailed)]
+    if not failed:
+        raise errors[0]
+    return None, failed[0].sql, failed[0].error
+
+
+# ============================
+# Pipeline
+# ============================
+async def repair_check(req: SQLRequest, schema: SchemaIndex, sql: str, patterns: set[Pattern]) -> None:
+    try:
+        await run_check(req, schema, sql, patterns)
+    except Exception as e:
+        count_failure(patterns, e)
+        raise
+
+
+async def try_auto_repair(
+    req: SQLRequest, schema: SchemaIndex, sql: str, patterns: set[Pattern]
+) -> tuple[str, list[str]] | None:
+    """Deterministic fixes; None when none applies or the result still fails a check."""
+    with timed("auto_repair"):
+        fixed = auto_repair(sql, patterns, sqlglot_dialect(req.database))
+        if fixed is None:
+            return None
+        try:
+            await run_check(req, schema, fixed[0], patterns)
+        except Exception:
+            return None
+    count_auto_repair(fixed[1])
+    return fixed
+
+
+def check_repair_time(patterns: set[Pattern], error: Exception) -> None:
+    """Fail fast when an LLM repair could not finish before the request deadline."""
+    left = remaining()
+    if left is not None and left < llm_client.expected_seconds:
+        count_failure(patterns, error)
+        raise DeadlineExceeded(
+            f"Not enough time left for a repair ({left:.1f}s, a call takes about "
+            f"{llm_client.expected_seconds:.1f}s). Last error: {error}"
+        ) from error
+
+
+async def repair(
+    req: SQLRequest,
+    schema: SchemaIndex,
+    view: SchemaView,
+    sql: str,
+    error: Exception,
+    patterns: set[Pattern],
+) -> tuple[str, dict]:
+    """Fix a failed attempt: mechanically when possible, else one LLM round."""
+    count_repair(patterns, error)
+    fixed = await try_auto_repair(req, schema, sql, patterns)
+    if fixed is not None:
+        note_generation(repair="auto")
+        return fixed[0], {"repair": "auto", "fixes": fixed[1]}
+
+    check_repair_time(patterns, error)
+    note_generation(repair="llm")
+    with timed("repair"):
+        sql = await call_llm(build_fix_prompt(req, view, sql, error, patterns), patterns)
+        await repair_check(req, schema, sql, patterns)
+    return sql, {"repair": "llm"}
+
+
+async def generate(
+    req: SQLRequest,
+    schema: SchemaIndex,
+    patterns: set[Pattern] | None = None,
+    api_key: str = "",
+    lane: str = INTERACTIVE,
+) -> dict:
+    """Cache lookup, then one shared pipeline run per identical request.
+
+    Concurrent requests with the same cache key attach to the run already
+    in flight and get its result ("cache": "coalesced") or its error.
+    Only that run takes an admission slot.
+    """
+    key = request_cache_key(req, schema)
+    with timed("cache"):
+        cached = await sql_cache.get(key)
+    if cached is not None:
+        return {"sql": cached, "cache": "hit"}
+
+    result, shared = await inflight.do(key, lambda: run_pipeline(req, schema, key, patterns, api_key, lane))
+    if shared:
+        COALESCED.inc()
+        return {**result, "cache": "coalesced"}
+    return result
+
+
+async def run_pipeline(
+    req: SQLRequest,
+    schema: SchemaIndex,
+    key: str,
+    patterns: set[Pattern] | None,
+    api_key: str = "",
+    lane: str = INTERACTIVE,
+) -> dict:
+    """Near-duplicate reuse, else an LLM generation once admitted.
+
+    Raises Overloaded when admission refuses the request.
+    """
+    if patterns is None:
+        with timed("prompt"):
+            patterns = detect_patterns(req.criteria)
+    reused, examples = await consult_examples(req, schema, patterns)
+    if reused is not None:
+        sql_cache.put(key, reused["sql"])
+        return reused
+
+    async with admission.slot(api_key, lane):
+        return await run_generation(req, schema, key, patterns, examples)
+
+
+async def run_generation(
+    req: SQLRequest, schema: SchemaIndex, key: str, patterns: set[Pattern], examples: list[Example]
+) -> dict:
+    """First attempt, one controlled repair.
+
+    Raises the last validation error when the repaired SQL still fails.
+    """
+    with timed("prompt"):
+        view = await run_in_threadpool(prune_schema, schema, req.criteria)
+        prompt = build_prompt(req, view, patterns, examples)
+    pruning = view.report()
+    count_generation(patterns)
+
+    # -------- speculative candidates (opt-in) --------
+    # never queue more candidates than there are free LLM slots
+    n = min(req.candidates or 1, SPECULATIVE_MAX_CANDIDATES, max(1, llm_client.available))
+    if n > 1:
+        winner, sql, error = await speculate(req, schema, patterns, prompt, n)
+        if winner is not None:
+            remember(key, req, schema, patterns, sql)
+            return {"sql": sql, "cache": "miss", "schema_pruning": pruning, "candidates": n, "winner": winner}
+        sql, repaired = await repair(req, schema, view, sql, error, patterns)
+        remember(key, req, schema, patterns, sql)
+        return {"sql": sql, "cache": "miss", "schema_pruning": pruning, "candidates": n, "winner": None, **repaired}
+
+    # -------- first attempt --------
+    sql = await call_llm(prompt, patterns)
+
+    try:
+        await run_check(req, schema, sql, patterns)
+        record_first_attempt(examples, True)
+        remember(key, req, schema, patterns, sql)
+        return {"sql": sql, "cache": "miss", "schema_pruning": pruning}
+
+    except DeadlineExceeded:
+        raise
+
+    except Exception as e:
+        record_first_attempt(examples, False)
+        # -------- one controlled repair --------
+        sql, repaired = await repair(req, schema, view, sql, e, patterns)
+        remember(key, req, schema, patterns, sql)
+        return {"sql": sql, "cache": "miss", "schema_pruning": pruning, **repaired}
+
+
+# ============================
+# History
+# ============================
+def log_generation(
+    endpoint: str,
+    req: SQLRequest,
+    patterns: set[Pattern],
+    lane: str,
+    request_id: str | None = None,
+    result: dict | None = None,
+    error: Exception | None = None,
+) -> None:
+    """Queue the record of a finished generation; call inside track_generation(). Never waits for the disk."""
+    notes = generation_notes()
+    if notes.get("logged"):
+        return
+    notes["logged"] = True
+    history.record(Generation(
+        endpoint=endpoint,
+        lane=lane,
+        database=req.database,
+        criteria=req.criteria,
+        patterns=pattern_keys(patterns),
+        ok=error is None,
+        seconds=time.perf_counter() - notes.get("started", time.perf_counter()),
+        request_id=request_id,
+        source=result.get("cache") if result else None,
+        failed_check=failed_check(error) if error is not None else None,
+        error=str(error) if error is not None else None,
+        repair=notes.get("repair"),
+        sql=result["sql"] if result else notes.get("sql"),
+        prompt_chars=notes.get("prompt_chars"),
+        timings=dict(notes.get("timings", {})),
+    ))
+
+
+# ============================
+# Endpoint
+# ============================
+@app.post("/generate-sql")
+async def generate_sql(
+    req: SQLRequest,
+    request: Request,
+    x_api_key: str = Header(None),
+    x_priority: str | None = Header(None),
+    x_request_id: str | None = Header(None),
+):
+    """Generate SQL for one question.
+
+    Stops when the client disconnects or cancels its X-Request-ID.
+    """
+    verify_api_key(x_api_key)
+    lane = request_lane(x_priority)
+
+    schema = await resolve_schema(req)
+    canonical = canonical_request(req)
+    patterns = detect_patterns(req.criteria)
+
+    try:
+        with deadline(), track_generation():
+            try:
+                result = await cancellations.run(
+                    request, x_request_id, x_api_key, generate(canonical, schema, patterns, x_api_key, lane)
+                )
+            except Exception as e:
+                log_generation("generate", canonical, patterns, lane, x_request_id, error=e)
+                raise
+            log_generation("generate", canonical, patterns, lane, x_request_id, result=result)
+    except httpx.HTTPError:
+        raise
+    except RequestCancelled as e:
+        raise HTTPException(status_code=499, detail=str(e))
+    except Overloaded as e:
+        raise too_busy(e)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as final_error:
+        raise HTTPException(status_code=500, detail=str(final_error))
+
+    if req.targets:
+        result = {**result, **render_targets(result["sql"], canonical.database, req.targets, patterns)}
+    return result
+
+
+# ============================
+# Streaming endpoint (SSE)
+# ============================
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/generate-sql/stream")
+async def generate_sql_stream(
+    req: SQLRequest,
+    request: Request,
+    x_api_key: str = Header(None),
+    x_priority: str | None = Header(None),
+    x_request_id: str | None = Header(None),
+):
+    """Same pipeline as /generate-sql, but tokens are forwarded as they arrive.
+
+    Events: token, repair, result, error. An attempt is aborted as soon as
+    its partial output can no longer be valid SQL. With targets, tokens are
+    the canonical SQL and the result carries every target dialect.
+    A request admission would refuse gets 429 before the stream starts.
+    Generation stops when the client disconnects or cancels its X-Request-ID.
+    """
+    verify_api_key(x_api_key)
+    lane = request_lane(x_priority)
+
+    schema = await resolve_schema(req)
+    targets = req.targets
+    req = canonical_request(req)
+    key = request_cache_key(req, schema)
+    patterns = detect_patterns(req.criteria)
+
+    def result(data: dict) -> str:
+        log_generation("stream", req, patterns, lane, x_request_id, result=data)
+        if targets:
+            # a copy: the result may be shared with coalesced callers
+            data = {**data, **render_targets(data["sql"], req.database, targets, patterns)}
+        return sse("result", data)
+
+    def failed(error: Exception, detail: str | None = None) -> str:
+        log_generation("stream", req, patterns, lane, x_request_id, error=error)
+        return sse("error", {"detail": detail or str(error)})
+
+    # cache hits never queue; a refusal is sent while the status can still be 429
+    cached = await sql_cache.get(key)
+    if cached is None and not inflight.pending(key):
+        try:
+            with deadline():
+                admission.check(x_api_key, lane)
+        except Overloaded as e:
+            raise too_busy(e)
+
+    async def stream_pipeline(emit: Callable[[str], None]) -> dict:
+        # the run_pipeline of /generate-sql, emitting token and repair events;
+        # runs in the inflight task, so identical requests share it
+        reused, examples = await consult_examples(req, schema, patterns)
+        if reused is not None:
+            sql_cache.put(key, reused["sql"])
+            return reused
+
+        async with admission.slot(x_api_key, lane):
+            with timed("prompt"):
+                view = await run_in_threadpool(prune_schema, schema, req.criteria)
+                prompt = build_prompt(req, view, patterns, examples)
+            pruning = view.report()
+            count_generation(patterns)
+
+            for attempt in ("first", "repair"):
+                text = ""
+                try:
+                    with timed("llm"):
+                        async with aclosing(llm_client.stream(prompt, budget=pattern_keys(patterns))) as tokens:
+                            async for token in iterate("llm", tokens):
+                                text += token
+                                emit(sse("token", {"attempt": attempt, "text": token}))
+                                # raising here closes the stream and stops Ollama
+                                try:
+                                    validate_sql_prefix(text)
+                                except Exception as e:
+                                    e.check = "prefix"
+                                    raise
+
+                    sql = strip_markdown(text)
+                    await run_check(req, schema, sql, patterns)
+                    if attempt == "first":
+                        record_first_attempt(examples, True)
+                    remember(key, req, schema, patterns, sql)
+                    return {"sql": sql, "cache": "miss", "schema_pruning": pruning}
+
+                except (httpx.HTTPError, DeadlineExceeded):
+                    raise
+
+                except Exception as e:
+                    error = e
+
+                if attempt == "first":
+                    record_first_attempt(examples, False)
+                    count_repair(patterns, error)
+                    fixed = await try_auto_repair(req, schema, strip_markdown(text), patterns)
+                    if fixed is not None:
+                        note_generation(repair="auto")
+                        remember(key, req, schema, patterns, fixed[0])
+                        return {
+                            "sql": fixed[0], "cache": "miss", "schema_pruning": pruning,
+                            "repair": "auto", "fixes": fixed[1],
+                        }
+                    check_repair_time(patterns, error)
+                    note_generation(repair="llm")
+                    emit(sse("repair", {"error": str(error)}))
+                    prompt = build_fix_prompt(req, view, strip_markdown(text), error, patterns)
+
+            count_failure(patterns, error)
+            raise error
+
+    async def events():
+        with deadline():
+            if cached is not None:
+                yield result({"sql": cached, "cache": "hit"})
+                return
+
+            # tokens reach only the caller that started the run; a caller joining
+            # it (here or from /generate-sql) gets the final result
+            queue: asyncio.Queue[str | None] = asyncio.Queue()
+            run = asyncio.ensure_future(inflight.do(key, lambda: stream_pipeline(queue.put_nowait)))
+            run.add_done_callback(lambda _: queue.put_nowait(None))
+            try:
+                while (event := await queue.get()) is not None:
+                    yield event
+                data, shared = await run
+            except httpx.HTTPError as e:
+                yield failed(e, f"LLM request failed: {e}")
+                return
+            except Exception as e:
+                yield failed(e)
+                return
+            finally:
+                # a leaving client stops the run unless others wait for it
+                run.cancel()
+            if shared:
+                COALESCED.inc()
+                data = {**data, "cache": "coalesced"}
+            yield result(data)
+
+    async def tracked_events():
+        # runs in the task cancellations.stream starts, which also closes it
+        with track_generation():
+            try:
+                async with aclosing(events()) as it:
+                    async for event in it:
+                        yield event
+            except (asyncio.CancelledError, GeneratorExit):
+                log_generation("stream", req, patterns, lane, x_request_id, error=RequestCancelled("Request cancelled"))
+                raise
+
+    async def body():
+        try:
+            async for event in cancellations.stream(request, x_request_id, x_api_key, tracked_events()):
+                yield event
+        except RequestCancelled as e:
+            yield sse("error", {"detail": str(e)})
+
+    return StreamingResponse(body(), media_type="text/event-stream")
+
+
+# ============================
+# Batch endpoint (NDJSON)
+# ============================
+@app.post("/generate-sql/batch")
+async def generate_sql_batch(
+    req: BatchRequest,
+    request: Request,
+    x_api_key: str = Header(None),
+    x_request_id: str | None = Header(None),
+):
+    """Generate SQL for many questions against one schema.
+
+    The schema is resolved once and identical questions are generated
+    once. With targets, each question is generated once in the canonical
+    database and returned in every target dialect. Items queue in the
+    batch admission lane, behind interactive requests. One JSON line is streamed per input item as soon as it is done:
+    {"index", "criteria", "ok", "sql", "cache"} or {"index", "criteria", "ok", "error"}.
+    Cancelling its X-Request-ID stops the remaining items.
+    """
+    verify_api_key(x_api_key)
+
+    schema = await resolve_schema(req)
+    database = canonical_request(req).database
+    try:
+        with deadline():
+            admission.check(x_api_key, BATCH)
+    except Overloaded as e:
+        raise too_busy(e)
+    limit = max(1, min(req.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+
+    # dedupe on normalized criteria; remember every index asking it
+    unique: dict[str, list[int]] = {}
+    for i, c in enumerate(req.criteria):
+        unique.setdefault(" ".join(c.split()).lower(), []).append(i)
+    groups = list(unique.values())
+    intents = detect_patterns_batch([req.criteria[idx[0]] for idx in groups])
+
+    async def run_one(indexes: list[int], patterns: set[Pattern]) -> tuple[list[int], dict]:
+        item = SQLRequest(
+            language=req.language,
+            database=database,
+            schema_id=schema.schema_id,
+            criteria=req.criteria[indexes[0]],
+        )
+        async with semaphore:
+            with track_generation():
+                try:
+                    with deadline():
+                        result = await generate(item, schema, patterns, x_api_key, BATCH)
+                    log_generation("batch", item, patterns, BATCH, x_request_id, result=result)
+                    if req.targets:
+                        result = {**result, **render_targets(result["sql"], database, req.targets, patterns)}
+                    return indexes, {"ok": True, **result}
+                except Overloaded as e:
+                    log_generation("batch", item, patterns, BATCH, x_request_id, error=e)
+                    return indexes, {"ok": False, "error": str(e), "retry_after": e.retry_after}
+                except Exception as e:
+                    log_generation("batch", item, patterns, BATCH, x_request_id, error=e)
+                    return indexes, {"ok": False, "error": str(e)}
+
+    async def lines():
+        tasks = [asyncio.create_task(run_one(idx, p)) for idx, p in zip(groups, intents)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                indexes, result = await done
+                for i in indexes:
+                    yield json.dumps({"index": i, "criteria": req.criteria[i], **result}) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def body():
+        try:
+            async for line in cancellations.stream(request, x_request_id, x_api_key, lines()):
+                yield line
+        except RequestCancelled:
+            return
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+# ============================
+# Cancellation
+# ============================
+@app.post("/generate-sql/{request_id}/cancel")
+async def cancel_generation(request_id: str, x_api_key: str = Header(None)):
+    """Stop the request sent with this X-Request-ID, e.g. when the user edits the question."""
+    verify_api_key(x_api_key)
+    if not cancellations.cancel(request_id, x_api_key):
+        raise HTTPException(status_code=404, detail=f"No request in flight with id: {request_id}")
+    return {"request_id": request_id, "cancelled": True}
+
+
+# ============================
+# Schema registry
+# ============================
+@app.post("/schemas")
+async def register_schema(body: SchemaRequest, x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    schema = await run_in_threadpool(schema_registry.register, body.schema)
+    return {
+        "schema_id": schema.schema_id,
+        "content_hash": schema.content_hash,
+        "tables": sorted(schema.tables),
+    }
+
+
+@app.post("/schemas/upload")
+async def upload_schema(request: Request, x_api_key: str = Header(None)):
+    """Register a schema sent as the raw request body (e.g. a pg_dump or mysqldump file).
+
+    The body is parsed chunk by chunk while it arrives, so a multi-MB
+    dump is never buffered twice or sent through JSON decoding.
+    """
+    verify_api_key(x_api_key)
+    parser = DDLParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > SCHEMA_UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Schema larger than {SCHEMA_UPLOAD_MAX_BYTES} bytes")
+        text = decoder.decode(chunk)
+        if text:
+            await run_in_threadpool(parser.feed, text)
+    parser.feed(decoder.decode(b"", final=True))
+    parsed = await run_in_threadpool(parser.close)
+    if not parsed.tables:
+        raise HTTPException(status_code=422, detail="No CREATE TABLE statements found")
+
+    schema = await run_in_threadpool(schema_registry.register, parsed.text, parsed)
+    return {
+        "schema_id": schema.schema_id,
+        "content_hash": schema.content_hash,
+        "tables": sorted(schema.tables),
+    }
+
+
+@app.get("/schemas/{schema_id}")
+def get_schema(schema_id: str, x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    schema = schema_registry.get(schema_id)
+    if schema is None:
+        raise HTTPException(status_code=404, detail=f"Unknown schema_id: {schema_id}")
+    return {
+        "schema_id": schema.schema_id,
+        "content_hash": schema.content_hash,
+        "tables": {t: sorted(cols) for t, cols in schema.tables.items()},
+        "ambiguous_columns": sorted(schema.ambiguous),
+        "foreign_keys": {t: [asdict(fk) for fk in fks] for t, fks in schema.foreign_keys.items() if fks},
+        "indexes": {t: [asdict(ix) for ix in ixs] for t, ixs in schema.indexes.items() if ixs},
+    }
+
+
+@app.get("/llm-stats")
+def llm_stats(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return llm_client.stats()
+
+
+@app.get("/cache-stats")
+def cache_stats(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return {**sql_cache.stats(), "inflight": inflight.stats()}
+
+
+@app.get("/example-stats")
+def example_stats(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return example_store.stats()
+
+
+@app.get("/admission-stats")
+def admission_stats(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return admission.stats()
+
+
+@app.get("/executor-stats")
+def executor_stats(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return pool_stats()
+
+
+@app.get("/history-stats")
+def history_stats(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return history.stats()
+
+
+@app.get("/history/failures")
+def history_failures(
+    pattern: str | None = None,
+    since: float = 24 * 3600,
+    limit: int = 50,
+    x_api_key: str = Header(None),
+):
+    """Most recent failed generations, newest first, with failure counts over the same window.
+
+    pattern: only generations detected with this Pattern (e.g. ANTI_JOIN).
+    since: window in seconds before now. limit: at most 500 records.
+    """
+    verify_api_key(x_api_key)
+    if not history.enabled:
+        raise HTTPException(status_code=404, detail="History is disabled; set HISTORY_PATH")
+    if pattern is not None:
+        try:
+            pattern = Pattern(pattern.upper()).value
+        except ValueError:
+            raise HTTPException(status_code=422, detail=f"pattern must be one of: {', '.join(p.value for p in Pattern)}")
+    cutoff = time.time() - max(0.0, since)
+    return {
+        "pattern": pattern,
+        "since": cutoff,
+        **history.failure_counts(cutoff),
+        "failures": history.failures(pattern, cutoff, max(1, min(limit, 500))),
+    }
+
+
+# liveness and readiness probes: no API key, load balancers call them
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    # 503 until warm-up is done, so no traffic reaches a cold model
+    return JSONResponse(warmup.stats(), status_code=200 if warmup.ready else 503)
+
+
+@app.get("/metrics")
+def metrics(x_api_key: str = Header(None)):
+    verify_api_key(x_api_key)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,369 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# ============================
+# Config
+# ============================
+# add a Server-Timing header with per-stage durations to every response
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+# ============================
+# Metric types (Prometheus text format)
+# ============================
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Set directly, or read from callback() at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), callback=None):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        if self._callback is not None:
+            return [f"{self.name} {_number(self._callback())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., sum, count]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        inf = 'le="+Inf"'
+        lines = []
+        for key, row in items:
+            for bound, n in zip(self.buckets, row):
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {n}")
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, inf)} {row[-1]}')
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "".join(m.render() for m in self._metrics)
+
+
+registry = Registry()
+
+
+# ============================
+# Metrics
+# ============================
+HTTP_SECONDS = Histogram(
+    "sqlgen_http_request_duration_seconds",
+    "Time from request start to the end of the response body.",
+    ("route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "sqlgen_http_requests_in_flight",
+    "HTTP requests currently being served.",
+)
+STAGE_SECONDS = Histogram(
+    "sqlgen_stage_duration_seconds",
+    "Time spent per pipeline stage.",
+    ("stage",),
+)
+GENERATIONS = Counter(
+    "sqlgen_generations_total",
+    "Generations that reached the LLM, by detected Pattern.",
+    ("pattern",),
+)
+REPAIRS = Counter(
+    "sqlgen_repairs_total",
+    "First attempts that needed a repair, by Pattern and failing check.",
+    ("pattern", "check"),
+)
+FAILURES = Counter(
+    "sqlgen_failures_total",
+    "Generations still failing after the repair, by Pattern and failing check.",
+    ("pattern", "check"),
+)
+AUTO_REPAIRS = Counter(
+    "sqlgen_auto_repairs_total",
+    "Deterministic fixes applied in repairs that passed without the LLM.",
+    ("fix",),
+)
+LLM_REPAIRS_AVOIDED = Counter(
+    "sqlgen_llm_repairs_avoided_total",
+    "Repairs completed by deterministic fixes instead of an LLM call.",
+)
+COALESCED = Counter(
+    "sqlgen_coalesced_requests_total",
+    "Requests answered by an identical generation already in flight.",
+)
+TRANSPILED_EXECUTIONS = Counter(
+    "sqlgen_transpiled_executions_total",
+    "Execution checks of non-SQLite SQL run through a SQLite translation, by outcome.",
+    ("outcome",),
+)
+EXAMPLE_REUSES = Counter(
+    "sqlgen_example_reuses_total",
+    "Requests answered by a validated near-duplicate question without the LLM.",
+)
+FIRST_ATTEMPTS = Counter(
+    "sqlgen_first_attempts_total",
+    "First LLM attempts by outcome, with or without few-shot examples in the prompt.",
+    ("few_shot", "outcome"),
+)
+OLLAMA_PROMPT_EVAL_SECONDS = Histogram(
+    "sqlgen_ollama_prompt_eval_duration_seconds",
+    "Ollama prompt_eval_duration per call.",
+)
+OLLAMA_EVAL_SECONDS = Histogram(
+    "sqlgen_ollama_eval_duration_seconds",
+    "Ollama eval_duration (generation) per call.",
+)
+OLLAMA_PROMPT_EVAL_TOKENS = Counter(
+    "sqlgen_ollama_prompt_eval_tokens_total",
+    "Ollama prompt_eval_count summed over calls.",
+)
+OLLAMA_EVAL_TOKENS = Counter(
+    "sqlgen_ollama_eval_tokens_total",
+    "Ollama eval_count summed over calls.",
+)
+
+
+# ============================
+# Stage timers
+# ============================
+# per-request stage durations (seconds), for the Server-Timing header
+_timings: ContextVar[dict[str, float] | None] = ContextVar("sqlgen_timings", default=None)
+
+
+def record_timing(stage: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        record_timing(stage, elapsed)
+
+
+@contextmanager
+def stage_timings():
+    """Collect the stage durations of the enclosed work apart; they still add up in the request's."""
+    outer = _timings.get()
+    timings: dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+        if outer is not None:
+            for stage, seconds in timings.items():
+                outer[stage] = outer.get(stage, 0.0) + seconds
+
+
+def observe_ollama(chunk: dict) -> None:
+    """Record the counters Ollama returns with a finished response."""
+    if chunk.get("prompt_eval_duration") is not None:
+        seconds = chunk["prompt_eval_duration"] / 1e9
+        OLLAMA_PROMPT_EVAL_SECONDS.observe(seconds)
+        record_timing("ollama_prompt_eval", seconds)
+    if chunk.get("eval_duration") is not None:
+        seconds = chunk["eval_duration"] / 1e9
+        OLLAMA_EVAL_SECONDS.observe(seconds)
+        record_timing("ollama_eval", seconds)
+    if chunk.get("prompt_eval_count"):
+        OLLAMA_PROMPT_EVAL_TOKENS.inc(chunk["prompt_eval_count"])
+    if chunk.get("eval_count"):
+        OLLAMA_EVAL_TOKENS.inc(chunk["eval_count"])
+
+
+def failed_check(error: Exception) -> str:
+    return getattr(error, "check", "other")
+
+
+def count_generation(patterns) -> None:
+    for p in patterns:
+        GENERATIONS.inc(pattern=p.value)
+
+
+def count_repair(patterns, error: Exception) -> None:
+    for p in patterns:
+        REPAIRS.inc(pattern=p.value, check=failed_check(error))
+
+
+def count_auto_repair(fixes: list[str]) -> None:
+    LLM_REPAIRS_AVOIDED.inc()
+    for fix in fixes:
+        AUTO_REPAIRS.inc(fix=fix)
+
+
+def count_first_attempt(few_shot: bool, passed: bool) -> None:
+    FIRST_ATTEMPTS.inc(few_shot=str(few_shot).lower(), outcome="pass" if passed else "fail")
+
+
+def count_failure(patterns, error: Exception) -> None:
+    for p in patterns:
+        FAILURES.inc(pattern=p.value, check=failed_check(error))
+
+
+# ============================
+# ASGI middleware
+# ============================
+def server_timing(timings: dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={seconds * 1e3:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1e3:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Request latency, in-flight gauge and the optional Server-Timing header.
+
+    Streaming responses send headers first, so their Server-Timing only
+    covers the work done before the first byte.
+    """
+
+    def __init__(self, app, server_timing: bool = METRICS_SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    value = server_timing(timings, time.perf_counter() - start)
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # route template, not the raw path, to keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, route=route, status=str(status))
+            _timings.reset(token)
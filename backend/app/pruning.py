@@ -0,0 +1,281 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+from app.schemas import SchemaIndex
+
+
+# ============================
+# Config
+# ============================
+# schemas with at most this many tables are sent whole
+SCHEMA_PRUNE_MIN_TABLES = int(os.getenv("SCHEMA_PRUNE_MIN_TABLES", "8"))
+# approximate prompt tokens allowed for the SCHEMA block
+SCHEMA_PRUNE_TOKEN_BUDGET = int(os.getenv("SCHEMA_PRUNE_TOKEN_BUDGET", "1500"))
+# matches scoring below this fraction of the best match are dropped
+SCHEMA_PRUNE_MIN_SCORE = float(os.getenv("SCHEMA_PRUNE_MIN_SCORE", "0.25"))
+# schemas up to this many tokens go whole into the cached system prefix, so every
+# question shares it and the pruned tables are only named in the question turn;
+# bigger ones put the pruned slice there, shared only by questions pruned alike
+SCHEMA_PREFIX_MAX_TOKENS = int(os.getenv("SCHEMA_PREFIX_MAX_TOKENS", "2500"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# question words -> identifier words they usually mean
+SYNONYMS = {
+    "customer": ["user", "client", "account"],
+    "client": ["customer", "user"],
+    "user": ["customer", "account", "member"],
+    "employee": ["staff", "worker", "emp"],
+    "staff": ["employee"],
+    "department": ["dept"],
+    "dept": ["department"],
+    "salary": ["pay", "wage", "compensation"],
+    "purchase": ["order", "transaction", "sale"],
+    "buy": ["order", "purchase"],
+    "bought": ["order", "purchase"],
+    "spent": ["amount", "total", "price", "order"],
+    "order": ["purchase"],
+    "product": ["item", "sku"],
+    "item": ["product"],
+    "price": ["amount", "cost"],
+    "revenue": ["amount", "total", "price", "sale"],
+    "date": ["created", "time", "day"],
+    "day": ["date"],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English/code on common tokenizers
+    return (len(text) + 3) // 4
+
+
+# ============================
+# Tokenizing
+# ============================
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_COMMENT = re.compile(r"--([^\n]*)|comment\s+'([^']*)'", flags=re.IGNORECASE)
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ies", "es", "s"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            return word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    words = []
+    for part in re.split(r"[_\W]+", _CAMEL.sub(" ", text or "")):
+        for w in _WORD.findall(part):
+            words.append(_stem(w.lower()))
+    return words
+
+
+# ============================
+# Per-schema index
+# ============================
+@dataclass(frozen=True)
+class SchemaView:
+    """The part of a schema that goes into a prompt."""
+    ddl: str
+    tables_summary: str
+    tables: tuple[str, ...]
+    total_tables: int
+    full_tokens: int
+    tokens: int
+    # the schema in the system prefix: whole, or this view when too big
+    prefix_ddl: str
+    prefix_summary: str
+    whole_prefix: bool
+
+    @property
+    def focused(self) -> bool:
+        """The prefix has the whole schema but only some tables are relevant."""
+        return self.whole_prefix and len(self.tables) < self.total_tables
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Schema tokens the prompt carries: the prefix, plus the focus list when focused."""
+        tokens = estimate_tokens(self.prefix_ddl) + estimate_tokens(self.prefix_summary)
+        if self.focused:
+            tokens += estimate_tokens(self.tables_summary)
+        return tokens
+
+    def report(self) -> dict:
+        # from what is sent, so a whole prefix plus focus list shows as growth
+        sent = self.prompt_tokens
+        return {
+            "tables": len(self.tables),
+            "total_tables": self.total_tables,
+            "schema_tokens": self.full_tokens,
+            "pruned_tokens": self.tokens,
+            "prompt_tokens": sent,
+            "reduction": round(1 - sent / self.full_tokens, 3) if self.full_tokens else 0.0,
+            "prefix": "whole" if self.whole_prefix else "pruned",
+        }
+
+
+class _TableIndex:
+    def __init__(self, schema: SchemaIndex):
+        self.docs: dict[str, Counter] = {}
+        self.neighbours: dict[str, set[str]] = {t: set() for t in schema.tables}
+        self.cost: dict[str, int] = {}
+        # stem -> tables, so each <table>_id column is one lookup
+        by_stem: dict[str, list[str]] = {}
+        for table in schema.tables:
+            by_stem.setdefault(_stem(table), []).append(table)
+
+        for table, cols in schema.tables.items():
+            ddl = schema.table_ddl.get(table, "")
+            terms = tokenize(table) * 3
+            for c in cols:
+                terms += tokenize(c)
+            for m in _COMMENT.finditer(ddl):
+                terms += tokenize(m.group(1) or m.group(2) or "")
+            self.docs[table] = Counter(terms)
+            self.cost[table] = estimate_tokens(ddl) + estimate_tokens(table) + 4
+
+            # explicit foreign keys
+            for fk in schema.foreign_keys.get(table, ()):
+                ref = fk.table.lower()
+                if ref in self.neighbours and ref != table:
+                    self.neighbours[table].add(ref)
+                    self.neighbours[ref].add(table)
+            # conventional <table>_id columns
+            for c in cols:
+                if c.endswith("_id"):
+                    for other in by_stem.get(_stem(c[:-3]), ()):
+                        if other != table:
+                            self.neighbours[table].add(other)
+                            self.neighbours[other].add(table)
+
+        n = len(self.docs) or 1
+        self.avg_len = sum(sum(d.values()) for d in self.docs.values()) / n
+        df: Counter = Counter()
+        for d in self.docs.values():
+            df.update(d.keys())
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def score(self, query: list[str]) -> dict[str, float]:
+        scores = {}
+        for table, doc in self.docs.items():
+            length = sum(doc.values())
+            s = 0.0
+            for term in query:
+                tf = doc.get(term)
+                if not tf:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_len or 1))
+                s += self.idf.get(term, 0.0) * tf * (BM25_K1 + 1) / norm
+            if s > 0:
+                scores[table] = s
+        return scores
+
+
+_indexes: OrderedDict[str, _TableIndex] = OrderedDict()
+_indexes_lock = threading.Lock()
+_INDEX_CACHE_SIZE = 64
+
+
+def _index_for(schema: SchemaIndex) -> _TableIndex:
+    with _indexes_lock:
+        idx = _indexes.get(schema.content_hash)
+        if idx is not None:
+            _indexes.move_to_end(schema.content_hash)
+            return idx
+    idx = _TableIndex(schema)
+    with _indexes_lock:
+        _indexes[schema.content_hash] = idx
+        while len(_indexes) > _INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return idx
+
+
+# ============================
+# Pruning
+# ============================
+def _query_terms(criteria: str) -> list[str]:
+    terms = tokenize(criteria)
+    expanded = list(terms)
+    for t in terms:
+        for syn in SYNONYMS.get(t, []):
+            expanded += tokenize(syn)
+    return expanded
+
+
+def _view(schema: SchemaIndex, tables: list[str], full_tokens: int) -> SchemaView:
+    if len(tables) == len(schema.tables):
+        ddl = schema.ddl
+        summary = schema.tables_summary
+    else:
+        ddl = "\n".join(schema.table_ddl[t] for t in tables if t in schema.table_ddl)
+        summary = "\n".join(
+            f"- {t}({', '.join(sorted(schema.tables[t]))})" for t in tables
+        )
+    whole_prefix = full_tokens <= SCHEMA_PREFIX_MAX_TOKENS
+    return SchemaView(
+        ddl=ddl,
+        tables_summary=summary,
+        tables=tuple(tables),
+        total_tables=len(schema.tables),
+        full_tokens=full_tokens,
+        tokens=estimate_tokens(ddl) + estimate_tokens(summary),
+        prefix_ddl=schema.ddl if whole_prefix else ddl,
+        prefix_summary=schema.tables_summary if whole_prefix else summary,
+        whole_prefix=whole_prefix,
+    )
+
+
+def prune_schema(
+    schema: SchemaIndex,
+    criteria: str,
+    token_budget: int = SCHEMA_PRUNE_TOKEN_BUDGET,
+) -> SchemaView:
+    """Keep only the tables relevant to the question, plus their FK neighbours.
+
+    Falls back to the whole schema when it is small, when nothing matches,
+    or when per-table DDL could not be sliced.
+    """
+    full_tokens = estimate_tokens(schema.ddl) + estimate_tokens(schema.tables_summary)
+    everything = list(schema.tables)
+    if len(everything) <= SCHEMA_PRUNE_MIN_TABLES or not schema.table_ddl:
+        return _view(schema, everything, full_tokens)
+
+    idx = _index_for(schema)
+    scores = idx.score(_query_terms(criteria))
+    if not scores:
+        return _view(schema, everything, full_tokens)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    floor = scores[ranked[0]] * SCHEMA_PRUNE_MIN_SCORE
+    ranked = [t for t in ranked if scores[t] >= floor]
+    selected: list[str] = []
+    used = 0
+
+    def add(table: str) -> bool:
+        nonlocal used
+        if table in selected:
+            return True
+        if selected and used + idx.cost[table] > token_budget:
+            return False
+        selected.append(table)
+        used += idx.cost[table]
+        return True
+
+    # best match always goes in; then neighbours of each pick before the next match
+    for table in ranked:
+        if not add(table):
+            break
+        for n in sorted(idx.neighbours[table], key=lambda t: -scores.get(t, 0.0)):
+            add(n)
+
+    # keep DDL order so the prompt reads like the original schema
+    order = {t: i for i, t in enumerate(everything)}
+    selected.sort(key=order.get)
+    return _view(schema, selected, full_tokens)
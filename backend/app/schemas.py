@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.ddl import ForeignKey, Index, ParsedSchema, parse_ddl
+
+
+SCHEMA_REGISTRY_SIZE = int(os.getenv("SCHEMA_REGISTRY_SIZE", "256"))
+
+
+# ============================
+# Precompiled schema
+# ============================
+@dataclass(frozen=True)
+class SchemaIndex:
+    schema_id: str
+    content_hash: str
+    ddl: str
+    tables: dict[str, set[str]]
+    # columns present in more than one table
+    ambiguous: frozenset[str]
+    # compact "- table(col, ...)" listing used in prompts
+    tables_summary: str
+    # table -> its own CREATE TABLE text (comments included)
+    table_ddl: dict[str, str]
+    # declared in CREATE TABLE or added by ALTER TABLE / CREATE INDEX
+    foreign_keys: dict[str, tuple[ForeignKey, ...]]
+    indexes: dict[str, tuple[Index, ...]]
+
+
+def content_hash(ddl: str) -> str:
+    normalized = re.sub(r"\s+", " ", ddl or "").strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def compile_schema(ddl: str, parsed: ParsedSchema | None = None) -> SchemaIndex:
+    """Index the DDL; pass `parsed` when it was already parsed while streaming in."""
+    digest = content_hash(ddl)
+    parsed = parsed or parse_ddl(ddl)
+    tables = {key: {c.lower() for c in t.columns} for key, t in parsed.tables.items()}
+
+    counts: dict[str, int] = {}
+    for cols in tables.values():
+        for c in cols:
+            counts[c] = counts.get(c, 0) + 1
+
+    tables_summary = "\n".join(
+        f"- {tbl}({', '.join(sorted(cols))})" for tbl, cols in tables.items()
+    )
+
+    return SchemaIndex(
+        schema_id=digest[:16],
+        content_hash=digest,
+        ddl=ddl,
+        tables=tables,
+        ambiguous=frozenset(c for c, n in counts.items() if n > 1),
+        tables_summary=tables_summary,
+        table_ddl={key: t.ddl for key, t in parsed.tables.items()},
+        foreign_keys={key: tuple(t.foreign_keys) for key, t in parsed.tables.items()},
+        indexes={key: tuple(t.indexes) for key, t in parsed.tables.items()},
+    )
+
+
+# ============================
+# Registry
+# ============================
+class SchemaRegistry:
+    """Bounded LRU of compiled schemas, addressed by schema_id."""
+
+    def __init__(self, max_size: int = SCHEMA_REGISTRY_SIZE):
+        self.max_size = max_size
+        self._schemas: OrderedDict[str, SchemaIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, ddl: str, parsed: ParsedSchema | None = None) -> SchemaIndex:
+        schema_id = content_hash(ddl)[:16]
+        with self._lock:
+            index = self._schemas.get(schema_id)
+            if index is not None:
+                self._schemas.move_to_end(schema_id)
+                return index
+
+        index = compile_schema(ddl, parsed)
+        with self._lock:
+            self._schemas[schema_id] = index
+            self._schemas.move_to_end(schema_id)
+            while len(self._schemas) > self.max_size:
+                self._schemas.popitem(last=False)
+        return index
+
+    def get(self, schema_id: str) -> SchemaIndex | None:
+        with self._lock:
+            index = self._schemas.get(schema_id)
+            if index is not None:
+                self._schemas.move_to_end(schema_id)
+            return index
+
+    def __len__(self) -> int:
+        return len(self._schemas)
+
+
+schema_registry = SchemaRegistry()
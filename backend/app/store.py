@@ -0,0 +1,126 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# Config
+# ============================
+# statements committed per transaction, and the longest one waits for its batch
+STORE_BATCH = int(os.getenv("STORE_BATCH", "256"))
+STORE_FLUSH_SECONDS = float(os.getenv("STORE_FLUSH_SECONDS", "0.5"))
+# writes waiting for the writer; past this new ones are dropped instead of slowing requests
+STORE_QUEUE = int(os.getenv("STORE_QUEUE", "10000"))
+# how long shutdown waits for the writer to flush what is queued
+STORE_CLOSE_SECONDS = float(os.getenv("STORE_CLOSE_SECONDS", "10"))
+
+
+# ============================
+# Store
+# ============================
+class SQLiteStore:
+    """A SQLite file written by a background thread in batched transactions.
+
+    write() only queues the statement, so callers on the event loop never
+    wait for a commit; when the writer falls behind, writes are dropped
+    and counted. read() blocks on a connection of its own (WAL lets it run
+    alongside the writer): call it through run_in_threadpool. Reads do
+    not see writes still queued, at most flush_seconds old.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: str,
+        batch: int = STORE_BATCH,
+        flush_seconds: float = STORE_FLUSH_SECONDS,
+        queue_size: int = STORE_QUEUE,
+    ):
+        self.path = path
+        self.batch = batch
+        self.flush_seconds = flush_seconds
+        self._queue: queue.Queue[tuple[str, tuple] | None] = queue.Queue(queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(schema)
+        db.close()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"store-writer:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def write(self, sql: str, params: tuple = ()) -> None:
+        try:
+            self._queue.put_nowait((sql, params))
+        except queue.Full:
+            self.dropped += 1
+
+    def read(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def close(self, timeout: float = STORE_CLOSE_SECONDS) -> None:
+        """Commit what is queued and stop the writer, waiting at most `timeout` seconds."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Store close timed out: %s, %d writes not committed", self.path, self._queue.qsize())
+            return
+        self._thread.join(timeout)
+
+    # -------- writer thread --------
+    def _collect(self) -> list[tuple[str, tuple] | None]:
+        # wait for one write, then up to flush_seconds for the rest of its batch
+        batch = [self._queue.get()]
+        flush_at = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch and batch[-1] is not None:
+            timeout = flush_at - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        db = sqlite3.connect(self.path)
+        # a power loss may lose the last batches, never corrupt the file
+        db.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            writes = [w for w in batch if w is not None]
+            if writes:
+                try:
+                    with db:
+                        for sql, params in writes:
+                            db.execute(sql, params)
+                    self.written += len(writes)
+                except sqlite3.Error as e:
+                    # losing a batch beats stopping the writer
+                    self.errors += 1
+                    self.dropped += len(writes)
+                    logger.warning("Store write failed: %s: %s", self.path, e)
+            if stop:
+                break
+        db.close()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+from functools import lru_cache
+
+import sqlglot
+from sqlglot.errors import ErrorLevel
+
+from app.analysis import SQLGLOT_DIALECTS, sqlglot_dialect
+from app.executor import EXEC_TIMEOUT, ExecutionError, run_query
+from app.intent import Pattern
+from app.metrics import TRANSPILED_EXECUTIONS
+from app.schemas import SchemaIndex
+from app.validator import validate_sql
+from app.verifier import verify_sql
+
+
+# ============================
+# Config
+# ============================
+# database the LLM writes in when a request asks for several targets
+TRANSPILE_CANONICAL = os.getenv("TRANSPILE_CANONICAL", "postgresql")
+# execute non-SQLite output too, by translating schema and query to SQLite
+VERIFY_VIA_SQLITE = os.getenv("VERIFY_VIA_SQLITE", "1") == "1"
+
+# SQLite errors that are about the query's tables and columns; any other is
+# more likely the translation's (syntax, types, functions) than the SQL's
+_SCHEMA_ERRORS = ("no such table", "no such column")
+
+
+class TranspileError(Exception):
+    pass
+
+
+# ============================
+# Statements
+# ============================
+@lru_cache(maxsize=1024)
+def transpile_sql(sql: str, source: str, target: str) -> str:
+    """Translate one statement between request database names."""
+    if source.lower() == target.lower():
+        return sql
+    try:
+        out = sqlglot.transpile(
+            sql,
+            read=sqlglot_dialect(source),
+            write=sqlglot_dialect(target),
+            unsupported_level=ErrorLevel.RAISE,
+        )
+    except Exception as e:
+        raise TranspileError(f"Cannot translate to {target}: {e}") from None
+    if len(out) != 1:
+        raise TranspileError(f"Cannot translate to {target}: expected one statement")
+    return out[0]
+
+
+def unknown_targets(targets: list[str]) -> list[str]:
+    return [t for t in targets if t.lower() not in SQLGLOT_DIALECTS]
+
+
+def render_targets(sql: str, source: str, targets: list[str], patterns: set[Pattern]) -> dict:
+    """The canonical SQL in every target database, each re-checked in its own dialect.
+
+    Targets that cannot be translated, or whose translation fails the
+    statement or pattern checks, are reported under "dialect_errors".
+    """
+    dialects = {}
+    errors = {}
+    for target in dict.fromkeys(t.lower() for t in targets):
+        dialect = sqlglot_dialect(target)
+        try:
+            out = transpile_sql(sql, source, target)
+            validate_sql(out, dialect)
+            verify_sql(out, patterns, dialect)
+        except Exception as e:
+            errors[target] = str(e)
+            continue
+        dialects[target] = out
+
+    result = {"database": source, "dialects": dialects}
+    if errors:
+        result["dialect_errors"] = errors
+    return result
+
+
+# ============================
+# Execution through SQLite
+# ============================
+@lru_cache(maxsize=64)
+def sqlite_ddl(ddl: str, database: str, key: str | None = None) -> str | None:
+    """The schema as SQLite can build it, or None when it cannot.
+
+    Portable DDL is used as is; otherwise it is translated from the
+    request database. Each candidate is tried where queries run, so the
+    one that builds is already the execution template under `key`.
+    """
+    candidates = [ddl]
+    try:
+        statements = sqlglot.transpile(
+            ddl, read=sqlglot_dialect(database), write="sqlite", unsupported_level=ErrorLevel.IGNORE
+        )
+        candidates.append(";\n".join(statements))
+    except Exception:
+        pass
+
+    for text in candidates:
+        try:
+            run_query(text, "SELECT 1", key)
+            return text
+        except (sqlite3.Error, ExecutionError):
+            # ExecutionError: the build ran out of time or memory
+            continue
+    return None
+
+
+def run_transpiled(schema: SchemaIndex, sql: str, database: str, timeout: float = EXEC_TIMEOUT):
+    """Execute non-SQLite SQL against the schema, both translated to SQLite.
+
+    Skipped (returns None) when the schema or the statement has no SQLite
+    equivalent, or SQLite rejects the translation for anything but a
+    missing table or column: a failure there would say nothing about the
+    original.
+    """
+    key = f"{schema.content_hash}:{database.lower()}"
+    ddl = sqlite_ddl(schema.ddl, database, key)
+    if ddl is None:
+        TRANSPILED_EXECUTIONS.inc(outcome="skipped_schema")
+        return None
+    try:
+        query = transpile_sql(sql, database, "sqlite")
+    except TranspileError:
+        TRANSPILED_EXECUTIONS.inc(outcome="skipped_query")
+        return None
+
+    try:
+        result = run_query(ddl, query, key, timeout)
+    except sqlite3.Error as e:
+        if not str(e).startswith(_SCHEMA_ERRORS):
+            TRANSPILED_EXECUTIONS.inc(outcome="skipped_query")
+            return None
+        TRANSPILED_EXECUTIONS.inc(outcome="failed")
+        raise
+    except Exception:
+        TRANSPILED_EXECUTIONS.inc(outcome="failed")
+        raise
+    TRANSPILED_EXECUTIONS.inc(outcome="executed")
+    return result
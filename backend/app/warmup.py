@@ -0,0 +1,141 @@
+import asyncio
+import glob
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.analysis import SQLGLOT_DIALECTS
+from app.autofix import auto_repair
+from app.executor import run_query, warm_workers
+from app.intent import Pattern, detect_patterns
+from app.llm import llm_client
+from app.pruning import prune_schema
+from app.schemas import compile_schema, schema_registry
+from app.transpile import sqlite_ddl, transpile_sql
+from app.validator import validate_schema_references, validate_sql, validate_sql_prefix
+from app.verifier import verify_sql
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# Config
+# ============================
+# warm up at startup before reporting ready; 0 is ready at once (local development)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+# DDL files registered at startup, comma separated; glob patterns allowed
+WARMUP_SCHEMAS = os.getenv("WARMUP_SCHEMAS", "")
+# seconds between attempts to load the model while Ollama is unreachable
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+_WARMUP_DDL = "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, created_at DATE);"
+_WARMUP_SQL = "SELECT name FROM users WHERE id NOT IN (SELECT id FROM users) LIMIT 1"
+
+
+# ============================
+# Steps
+# ============================
+def warm_pipeline() -> int:
+    """Run every check once per dialect so sqlglot loads its dialect modules now.
+
+    Returns the databases warmed.
+    """
+    detect_patterns("top 3 users per group")
+    validate_sql_prefix("SELECT")
+    schema = compile_schema(_WARMUP_DDL)
+    prune_schema(schema, "users")
+    for database, dialect in SQLGLOT_DIALECTS.items():
+        # findings are expected (NOT IN breaks ANTI_JOIN, LIMIT is not T-SQL):
+        # only the code paths they run matter here
+        for check in (
+            lambda: validate_sql(_WARMUP_SQL, dialect),
+            lambda: validate_schema_references(schema.tables, _WARMUP_SQL, schema.ambiguous, dialect),
+            lambda: verify_sql(_WARMUP_SQL, {Pattern.ANTI_JOIN}, dialect),
+            lambda: auto_repair(_WARMUP_SQL, {Pattern.ANTI_JOIN}, dialect),
+            *(lambda target=target: transpile_sql(_WARMUP_SQL, database, target) for target in SQLGLOT_DIALECTS),
+            lambda: sqlite_ddl(_WARMUP_DDL, database),
+        ):
+            try:
+                check()
+            except Exception:
+                pass
+    return len(SQLGLOT_DIALECTS)
+
+
+def register_schemas(patterns: str = WARMUP_SCHEMAS) -> int:
+    """Register the configured DDL files and build their execution templates."""
+    paths = sorted({p for pattern in patterns.split(",") if pattern.strip() for p in glob.glob(pattern.strip())})
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            schema = schema_registry.register(f.read())
+        if schema.tables:
+            run_query(schema.ddl, "SELECT 1", schema.content_hash)
+    return len(paths)
+
+
+# ============================
+# Warm-up
+# ============================
+class WarmUp:
+    """Startup phase run in the background; the app reports ready once it is done.
+
+    Steps: pipeline (sqlglot dialects, validators, intent rules), executor
+    (worker processes), schemas (WARMUP_SCHEMAS) and llm (the model loaded
+    on every node, retried until Ollama answers).
+    """
+
+    def __init__(self, enabled: bool = WARMUP):
+        self.enabled = enabled
+        self.ready = not enabled
+        self.steps: dict[str, dict] = {}
+        self.error: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _step(self, name: str, fn, *args) -> None:
+        start = time.monotonic()
+        try:
+            result = await fn(*args)
+        except Exception as e:
+            self.steps[name] = {"done": False, "error": str(e), "seconds": round(time.monotonic() - start, 3)}
+            raise
+        self.steps[name] = {"done": True, "result": result, "seconds": round(time.monotonic() - start, 3)}
+
+    async def _llm(self) -> int:
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return await llm_client.warm_up()
+            except Exception as e:
+                self.steps["llm"] = {"done": False, "attempts": attempts, "error": str(e)}
+                await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    async def run(self) -> None:
+        try:
+            await self._step("pipeline", run_in_threadpool, warm_pipeline)
+            await self._step("executor", run_in_threadpool, warm_workers)
+            await self._step("schemas", run_in_threadpool, register_schemas)
+            await self._step("llm", self._llm)
+        except Exception as e:
+            # a broken step keeps the app unready; the steps show which one
+            self.error = str(e)
+            logger.warning("Warm-up failed: %s", e)
+            return
+        self.ready = True
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "warmup": self.enabled, "steps": self.steps, "error": self.error}
+
+
+warmup = WarmUp()
@@ -0,0 +1,160 @@
+"""Synthetic schemas and a question/SQL corpus for the benchmarks."""
+from dataclasses import dataclass
+
+from app.intent import Pattern
+
+
+# ============================
+# Synthetic schemas
+# ============================
+CORE_DDL = """
+-- registered customers
+CREATE TABLE users (
+  id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  email TEXT,
+  created_at TEXT
+);
+
+CREATE TABLE orders (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER REFERENCES users(id),
+  amount DECIMAL(10, 2),
+  order_date TEXT
+);
+
+CREATE TABLE products (
+  id INTEGER PRIMARY KEY,
+  name TEXT,
+  price DECIMAL(10, 2)
+);
+
+CREATE TABLE departments (
+  id INTEGER PRIMARY KEY,
+  name TEXT
+);
+
+CREATE TABLE employees (
+  id INTEGER PRIMARY KEY,
+  name TEXT,
+  department_id INTEGER REFERENCES departments(id),
+  salary DECIMAL(10, 2)
+);
+
+CREATE TABLE "Order Items" (
+  "Order ID" INTEGER REFERENCES orders(id),
+  "Product ID" INTEGER REFERENCES products(id),
+  "Unit Price" DECIMAL(10, 2),
+  quantity INTEGER
+);
+"""
+
+CORE_TABLES = 6
+
+
+def synthetic_schema(
+    n_tables: int,
+    n_cols: int = 12,
+    wide_every: int = 10,
+    wide_cols: int = 120,
+    quoted_every: int = 5,
+) -> str:
+    """CREATE TABLE script with the core tables plus filler up to n_tables.
+
+    Every wide_every-th filler table has wide_cols columns; every
+    quoted_every-th uses quoted table and column names with spaces.
+    """
+    stmts = [CORE_DDL.strip()]
+    for t in range(max(0, n_tables - CORE_TABLES)):
+        width = wide_cols if wide_every and t % wide_every == 0 else n_cols
+        quoted = quoted_every and t % quoted_every == 0
+        if quoted:
+            name = f'"Archive Table {t}"'
+            cols = ['"Record Id" INTEGER PRIMARY KEY', '"User Id" INTEGER REFERENCES users(id)']
+            cols += [f'"Field {c} Of {t}" TEXT' for c in range(width)]
+        else:
+            name = f"tbl_{t}"
+            cols = ["id INTEGER PRIMARY KEY", "user_id INTEGER", "created_at TEXT"]
+            cols += [f"t{t}_c{c} VARCHAR(64) DEFAULT ''" for c in range(width)]
+        stmts.append(
+            f"-- synthetic table {t}\n"
+            f"CREATE TABLE {name} (\n  " + ",\n  ".join(cols) + "\n);"
+        )
+    return "\n\n".join(stmts) + "\n"
+
+
+# ============================
+# Questions and reference SQL
+# ============================
+@dataclass(frozen=True)
+class Case:
+    name: str
+    language: str
+    criteria: str
+    sql: str
+    patterns: frozenset[Pattern]
+
+
+CASES = [
+    Case(
+        "simple", "en",
+        "Show customer email addresses",
+        "SELECT name, email FROM users WHERE email IS NOT NULL",
+        frozenset({Pattern.SIMPLE_SELECT}),
+    ),
+    Case(
+        "top_per_group", "en",
+        "Employees with the highest salary in each department",
+        "SELECT name, department_id, salary FROM ("
+        "SELECT e.name, e.department_id, e.salary, DENSE_RANK() OVER "
+        "(PARTITION BY e.department_id ORDER BY e.salary DESC) AS rnk "
+        "FROM employees e) r WHERE rnk = 1",
+        frozenset({Pattern.TOP_PER_GROUP, Pattern.REQUIRE_ALL_TIES}),
+    ),
+    Case(
+        "anti_join", "en",
+        "Users who never placed an order",
+        "SELECT u.id, COALESCE(u.name, '') AS name FROM users u "
+        "LEFT JOIN orders o ON o.user_id = u.id WHERE o.id IS NULL",
+        frozenset({Pattern.ANTI_JOIN, Pattern.ZERO_ROW}),
+    ),
+    Case(
+        "all_users", "en",
+        "List all users with their number of orders",
+        "SELECT u.id, u.name, COALESCE(COUNT(o.id), 0) AS order_count "
+        "FROM users u LEFT JOIN orders o ON o.user_id = u.id "
+        "GROUP BY u.id, u.name",
+        frozenset({Pattern.ALL_USERS, Pattern.ZERO_ROW}),
+    ),
+    Case(
+        "dedup", "en",
+        "Products with duplicate names",
+        "SELECT p.name, COUNT(*) AS cnt FROM products p "
+        "GROUP BY p.name HAVING COUNT(*) > 1",
+        frozenset({Pattern.DEDUP}),
+    ),
+    Case(
+        "distinct_date", "en",
+        "Users who ordered on more than one day",
+        "SELECT o.user_id FROM orders o GROUP BY o.user_id "
+        "HAVING COUNT(DISTINCT DATE(o.order_date)) > 1",
+        frozenset({Pattern.DISTINCT_DATE}),
+    ),
+    Case(
+        "anti_join_ja", "ja",
+        "一度も注文していないユーザー",
+        "SELECT u.id, COALESCE(u.name, '') AS name FROM users u "
+        "LEFT JOIN orders o ON o.user_id = u.id "
+        "WHERE NOT EXISTS (SELECT 1 FROM orders x WHERE x.user_id = u.id)",
+        frozenset({Pattern.ANTI_JOIN, Pattern.ZERO_ROW}),
+    ),
+    Case(
+        "quoted", "en",
+        "Show the unit price of every order item",
+        'SELECT oi."Order ID", oi."Unit Price" FROM "Order Items" oi',
+        frozenset({Pattern.SIMPLE_SELECT}),
+    ),
+]
+
+# every Pattern has at least one case
+assert set(Pattern) <= {p for c in CASES for p in c.patterns}
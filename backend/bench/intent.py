@@ -0,0 +1,95 @@
+"""Microbenchmark: compiled intent engine vs the legacy substring scans.
+
+Run from backend/:  python -m bench.intent [--repeat N]
+
+Also times both approaches against synthetic rule sets of growing size,
+and lists questions where word-boundary matching changes the result.
+"""
+import argparse
+import random
+import time
+
+from app.intent import IntentEngine, detect_patterns, detect_patterns_batch
+from bench import legacy
+
+
+CRITERIA = [
+    "List all users and their total order amount",
+    "Which customer spent the most in 2023?",
+    "Find employees with the highest salary in each department",
+    "Customers who never placed an order",
+    "Users without any purchases",
+    "Products with duplicate names",
+    "Count unique visitors per day",
+    "Users who ordered on more than one day",
+    "Show orders placed on different days by the same user",
+    "Show the top 3 products by revenue",
+    "Find the maximum price per category",
+    "Customers with no records in the payments table",
+    "Show customer email addresses",
+    "Average order value per month",
+    "Optimize the stock list",            # "max" inside "maximize"-like words
+    "Employees who are almost done with onboarding",  # "most" inside "almost"
+    "Rows stopped at the stop sign",      # "top" inside "stopped"
+    "部署ごとに給与が最も高い社員",
+    "一度も注文していない顧客",
+    "重複している商品名",
+]
+
+
+def _time(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def synthetic_rules(n_phrases: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    phrases = {
+        "".join(rng.choice(letters) for _ in range(rng.randint(4, 12)))
+        for _ in range(n_phrases)
+    }
+    return [{"patterns": ["DEDUP"], "phrases": sorted(phrases)}]
+
+
+def substring_scan(phrases: list[str], criteria: str) -> bool:
+    c = criteria.lower()
+    return any(p in c for p in phrases)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    old = _time(lambda: [legacy.detect_patterns(c) for c in CRITERIA], args.repeat)
+    new = _time(lambda: [detect_patterns(c) for c in CRITERIA], args.repeat)
+    batch = _time(lambda: detect_patterns_batch(CRITERIA), args.repeat)
+    n = len(CRITERIA)
+    print(f"{'shipped rules':<18} {'legacy us':>10} {'engine us':>10} {'batch us':>10}")
+    print(f"{'per question':<18} {old / n * 1e6:>10.2f} {new / n * 1e6:>10.2f} {batch / n * 1e6:>10.2f}")
+
+    print()
+    print(f"{'phrases':>8} {'scan us':>10} {'engine us':>10} {'speedup':>8}")
+    repeat = max(1, args.repeat // 20)
+    for size in (10, 100, 1000, 10000):
+        rules = synthetic_rules(size)
+        phrases = rules[0]["phrases"]
+        engine = IntentEngine(rules)
+        scan = _time(lambda: [substring_scan(phrases, c) for c in CRITERIA], repeat)
+        new = _time(lambda: engine.detect_many(CRITERIA), repeat)
+        print(f"{size:>8} {scan / n * 1e6:>10.2f} {new / n * 1e6:>10.2f} {scan / new:>7.1f}x")
+
+    print()
+    print("changed by word-boundary / multilingual matching:")
+    for c in CRITERIA:
+        before = sorted(p.value for p in legacy.detect_patterns(c))
+        after = sorted(p.value for p in detect_patterns(c))
+        if before != after:
+            print(f"  {c!r}\n    legacy: {before}\n    engine: {after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Per-stage microbenchmarks of the CPU work done on every request.
+
+Run from backend/:
+  python -m bench.pipeline run [--sizes 5,50,500,2000] [--repeat N] [--out FILE]
+  python -m bench.pipeline compare BASE.json NEW.json [--threshold 0.15]
+
+`run` times each stage against synthetic schemas of growing size (see
+bench.corpus) and writes p50/p95/mean latency plus the tracemalloc peak
+per (stage, tables) as JSON. `compare` lines up two such files and exits
+non-zero when a stage got slower or hungrier than the threshold allows.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from app.analysis import analyze_sql
+from app.executor import _build_template, execute_sql
+from app.intent import detect_patterns
+from app.main import SQLRequest, build_prompt
+from app.pruning import prune_schema
+from app.rewriter import rewrite_criteria
+from app.schemas import compile_schema
+from app.validator import parse_schema, validate_schema_references, validate_sql
+from app.verifier import verify_sql
+from bench.corpus import CASES, synthetic_schema
+
+
+DATABASE = "sqlite"
+DEFAULT_SIZES = (5, 50, 500, 2000)
+
+
+class Context:
+    """One synthetic schema, compiled the way the app keeps it."""
+
+    def __init__(self, n_tables: int):
+        self.n_tables = n_tables
+        self.ddl = synthetic_schema(n_tables)
+        self.index = compile_schema(self.ddl)
+        self.views = {c.name: prune_schema(self.index, c.criteria) for c in CASES}
+
+
+def _close_template(ctx, case):
+    _build_template(ctx.ddl).close()
+
+
+def _validate_sql(ctx, case):
+    # first check of a request pays the parse; the next two reuse it
+    analyze_sql.cache_clear()
+    validate_sql(case.sql, DATABASE)
+
+
+def _build_prompt(ctx, case):
+    req = SQLRequest(
+        language=case.language,
+        database=DATABASE,
+        schema_id=ctx.index.schema_id,
+        criteria=case.criteria,
+    )
+    build_prompt(req, ctx.views[case.name], set(case.patterns))
+
+
+# stage name -> fn(ctx, case), in request order
+STAGES = {
+    "parse_schema": lambda ctx, case: parse_schema(ctx.ddl),
+    "compile_schema": lambda ctx, case: compile_schema(ctx.ddl),
+    "detect_patterns": lambda ctx, case: detect_patterns(case.criteria),
+    "rewrite_criteria": lambda ctx, case: rewrite_criteria(case.criteria, set(case.patterns), case.language),
+    "prune_schema": lambda ctx, case: prune_schema(ctx.index, case.criteria),
+    "build_prompt": _build_prompt,
+    "validate_sql": _validate_sql,
+    "validate_schema_references": lambda ctx, case: validate_schema_references(
+        ctx.index.tables, case.sql, ctx.index.ambiguous, DATABASE
+    ),
+    "verify_sql": lambda ctx, case: verify_sql(case.sql, set(case.patterns), DATABASE),
+    "build_template": _close_template,
+    "execute_sql": lambda ctx, case: execute_sql(ctx.ddl, case.sql, ctx.index.content_hash),
+}
+
+# stages that do not depend on the question run once per repeat
+SCHEMA_ONLY = {"parse_schema", "compile_schema", "build_template"}
+
+
+def _cases(stage: str):
+    return CASES[:1] if stage in SCHEMA_ONLY else CASES
+
+
+def _call(fn, ctx: Context, case) -> bool:
+    # a rejected reference SQL is a finding, not a reason to stop the run
+    try:
+        fn(ctx, case)
+        return True
+    except Exception:
+        return False
+
+
+def _measure(ctx: Context, stage: str, fn, repeat: int) -> dict:
+    samples = []
+    failed = set()
+    for _ in range(repeat):
+        for case in _cases(stage):
+            start = time.perf_counter()
+            ok = _call(fn, ctx, case)
+            samples.append(time.perf_counter() - start)
+            if not ok:
+                failed.add(case.name)
+
+    # separate pass: tracemalloc slows allocation-heavy code
+    peak = 0
+    for case in _cases(stage):
+        tracemalloc.start()
+        _call(fn, ctx, case)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "stage": stage,
+        "tables": ctx.n_tables,
+        "samples": len(samples),
+        "p50_ms": statistics.median(samples) * 1e3,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3,
+        "mean_ms": statistics.fmean(samples) * 1e3,
+        "peak_kb": peak / 1024,
+        # corpus cases the stage rejected (e.g. a column the parser missed)
+        "failed": sorted(failed),
+    }
+
+
+def run(sizes: list[int], repeat: int, stages: list[str]) -> dict:
+    results = []
+    for n in sizes:
+        ctx = Context(n)
+        # warm lazy imports and the template pool before timing
+        for case in CASES:
+            for stage in stages:
+                _call(STAGES[stage], ctx, case)
+        for stage in stages:
+            row = _measure(ctx, stage, STAGES[stage], repeat)
+            results.append(row)
+            print(
+                f"{row['tables']:>6} {stage:<28} {row['p50_ms']:>10.3f} "
+                f"{row['p95_ms']:>10.3f} {row['peak_kb']:>10.1f}  {' '.join(row['failed'])}",
+                file=sys.stderr,
+            )
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+
+
+# ============================
+# Comparison
+# ============================
+def compare(base: dict, new: dict, threshold: float, min_ms: float) -> list[dict]:
+    """Rows present in both runs, with regressions flagged.
+
+    A stage regresses when its p50 grows by more than threshold (and by
+    more than min_ms, to ignore timer noise on microsecond stages) or its
+    memory peak grows by more than threshold.
+    """
+    old = {(r["stage"], r["tables"]): r for r in base["results"]}
+    rows = []
+    for r in new["results"]:
+        b = old.get((r["stage"], r["tables"]))
+        if b is None:
+            continue
+        time_ratio = r["p50_ms"] / b["p50_ms"] if b["p50_ms"] else 1.0
+        mem_ratio = r["peak_kb"] / b["peak_kb"] if b["peak_kb"] else 1.0
+        slower = time_ratio > 1 + threshold and r["p50_ms"] - b["p50_ms"] > min_ms
+        hungrier = mem_ratio > 1 + threshold and r["peak_kb"] - b["peak_kb"] > 1
+        rows.append({
+            "stage": r["stage"],
+            "tables": r["tables"],
+            "base_ms": b["p50_ms"],
+            "new_ms": r["p50_ms"],
+            "time_ratio": time_ratio,
+            "base_kb": b["peak_kb"],
+            "new_kb": r["peak_kb"],
+            "mem_ratio": mem_ratio,
+            "regression": slower or hungrier,
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    p_run.add_argument("--repeat", type=int, default=5)
+    p_run.add_argument("--stages", default=",".join(STAGES))
+    p_run.add_argument("--out", default="-")
+
+    p_cmp = sub.add_parser("compare")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.15)
+    p_cmp.add_argument("--min-ms", type=float, default=0.05)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        stages = [s for s in args.stages.split(",") if s]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+        print(f"{'tables':>6} {'stage':<28} {'p50 ms':>10} {'p95 ms':>10} {'peak KiB':>10}  failed", file=sys.stderr)
+        report = run([int(s) for s in args.sizes.split(",")], args.repeat, stages)
+        text = json.dumps(report, indent=2)
+        if args.out == "-":
+            print(text)
+        else:
+            with open(args.out, "w") as f:
+                f.write(text + "\n")
+        return
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(base, new, args.threshold, args.min_ms)
+    print(f"{'tables':>6} {'stage':<28} {'base ms':>10} {'new ms':>10} {'time':>7} {'mem':>7}")
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ""
+        print(
+            f"{r['tables']:>6} {r['stage']:<28} {r['base_ms']:>10.3f} {r['new_ms']:>10.3f} "
+            f"{r['time_ratio']:>6.2f}x {r['mem_ratio']:>6.2f}x{flag}"
+        )
+    if any(r["regression"] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Microbenchmark: single-pass validation engine vs the legacy regex validators.
+
+Run from backend/:  python -m bench.validation [--repeat N]
+"""
+import argparse
+import time
+
+from app.analysis import analyze_sql
+from app.intent import Pattern
+from app.schemas import compile_schema
+from app.validator import validate_schema_references, validate_sql
+from app.verifier import verify_sql
+from bench import legacy
+
+
+def wide_schema(n_tables: int, n_cols: int) -> str:
+    stmts = []
+    for t in range(n_tables):
+        cols = ["id INTEGER PRIMARY KEY", "user_id INTEGER", "created_at TEXT"]
+        cols += [f"t{t}_c{c} TEXT" for c in range(n_cols)]
+        # a shared column name in every table keeps the ambiguous set large
+        cols += [f"shared_{c} TEXT" for c in range(n_cols // 4)]
+        stmts.append(f"CREATE TABLE tbl_{t} (\n  " + ",\n  ".join(cols) + "\n);")
+    return "\n".join(stmts)
+
+
+QUERIES = [
+    ("simple", "SELECT t0_c1, t0_c2 FROM tbl_0 WHERE t0_c3 = 'x'", {Pattern.SIMPLE_SELECT}),
+    (
+        "join",
+        "SELECT a.t0_c1, COALESCE(COUNT(b.id), 0) AS cnt FROM tbl_0 a "
+        "LEFT JOIN tbl_1 b ON b.user_id = a.id GROUP BY a.t0_c1",
+        {Pattern.ZERO_ROW},
+    ),
+    (
+        "window",
+        "SELECT t0_c1 FROM (SELECT t0_c1, DENSE_RANK() OVER "
+        "(PARTITION BY t0_c2 ORDER BY t0_c3 DESC) AS rnk FROM tbl_0) r WHERE rnk = 1",
+        {Pattern.TOP_PER_GROUP, Pattern.REQUIRE_ALL_TIES},
+    ),
+]
+
+
+def _run(fn) -> None:
+    try:
+        fn()
+    except Exception:
+        pass
+
+
+def _time(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench(n_tables: int, n_cols: int, repeat: int) -> list[tuple]:
+    schema = wide_schema(n_tables, n_cols)
+    # the app compiles a schema once per registry entry, not per request
+    index = compile_schema(schema)
+    rows = []
+
+    for name, sql, patterns in QUERIES:
+        def old():
+            _run(lambda: legacy.validate_sql(sql))
+            _run(lambda: legacy.validate_schema_references(schema, sql))
+            _run(lambda: legacy.verify_sql(sql, patterns))
+
+        def new():
+            # measure a cold parse every iteration
+            analyze_sql.cache_clear()
+            _run(lambda: validate_sql(sql))
+            _run(lambda: validate_schema_references(index.tables, sql, index.ambiguous))
+            _run(lambda: verify_sql(sql, patterns))
+
+        rows.append((n_tables, n_cols, name, _time(old, repeat), _time(new, repeat)))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'tables':>6} {'cols':>5} {'query':<8} {'legacy ms':>10} {'engine ms':>10} {'speedup':>8}")
+    for n_tables, n_cols in [(5, 10), (50, 40), (200, 80), (500, 120)]:
+        for t, c, name, old, new in bench(n_tables, n_cols, args.repeat):
+            print(f"{t:>6} {c:>5} {name:<8} {old * 1e3:>10.3f} {new * 1e3:>10.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
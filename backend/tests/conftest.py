@@ -0,0 +1,4 @@
+import os
+
+# queries run in-process, so tests need no worker processes
+os.environ.setdefault("EXEC_WORKERS", "0")
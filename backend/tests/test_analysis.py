@@ -0,0 +1,26 @@
+import logging
+
+import pytest
+
+from app.analysis import analyze_sql, check_statement
+from app.validator import validate_sql
+
+# valid PostgreSQL that sqlglot does not parse
+VENDOR_SQL = "SELECT name FROM users ORDER BY name USING <"
+
+
+def test_unparsed_select_passes_with_a_warning(caplog):
+    assert analyze_sql(VENDOR_SQL, "postgres").parse_error
+    with caplog.at_level(logging.WARNING, logger="app.validator"):
+        assert validate_sql(VENDOR_SQL, "postgres")
+    assert "passed unparsed" in caplog.text
+
+
+@pytest.mark.parametrize("sql,message", [
+    ("DELETE FROM users WHERE name USING <", "Only SELECT"),
+    ("SELECT name FROM users ORDER BY name USING <; DROP TABLE users", "Destructive"),
+    ("SELECT name FROM users ORDER BY name USING <; SELECT 1", "Multiple statements"),
+])
+def test_token_checks_still_apply_without_a_parse(sql, message):
+    findings = check_statement(analyze_sql(sql, "postgres"))
+    assert findings and message in findings[0].message
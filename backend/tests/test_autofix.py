@@ -0,0 +1,32 @@
+import pytest
+import sqlglot
+
+from app.autofix import drop_limit
+
+
+@pytest.mark.parametrize("sql,dialect,expected", [
+    ("SELECT a FROM t ORDER BY a LIMIT 5", "sqlite", "SELECT a FROM t ORDER BY a"),
+    ("SELECT a FROM t FETCH FIRST 5 ROWS ONLY", "postgres", "SELECT a FROM t"),
+    ("SELECT TOP 5 a FROM t", "tsql", "SELECT a FROM t"),
+    ("SELECT a FROM t UNION SELECT b FROM u LIMIT 3", "sqlite", "SELECT a FROM t UNION SELECT b FROM u"),
+])
+def test_drop_limit_removes_the_outer_limit(sql, dialect, expected):
+    tree = sqlglot.parse_one(sql, read=dialect)
+    assert drop_limit(tree)
+    assert tree.sql(dialect=dialect) == expected
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT u.id, (SELECT o.id FROM orders o WHERE o.user_id = u.id ORDER BY o.id DESC LIMIT 1) FROM users u",
+    "SELECT * FROM (SELECT id FROM orders ORDER BY amount DESC LIMIT 3) AS top3",
+])
+def test_drop_limit_keeps_subquery_limits(sql):
+    tree = sqlglot.parse_one(sql, read="sqlite")
+    assert not drop_limit(tree)
+    assert "LIMIT" in tree.sql(dialect="sqlite")
+
+
+def test_drop_limit_keeps_cte_limits():
+    tree = sqlglot.parse_one("WITH x AS (SELECT a FROM t LIMIT 1) SELECT * FROM x LIMIT 2", read="sqlite")
+    assert drop_limit(tree)
+    assert tree.sql(dialect="sqlite") == "WITH x AS (SELECT a FROM t LIMIT 1) SELECT * FROM x"
@@ -0,0 +1,24 @@
+import pytest
+
+from app.ddl import parse_ddl
+
+
+def columns(ddl: str) -> list[str]:
+    (table,) = parse_ddl(ddl).tables.values()
+    return table.columns
+
+
+@pytest.mark.parametrize("default", ["$$a, b)$$", "$fmt$it's, (x$fmt$", "$$ $x$, $$"])
+def test_dollar_quoted_literal_keeps_later_columns(default):
+    ddl = f"CREATE TABLE t (note text DEFAULT {default}, id int, name text);"
+    assert columns(ddl) == ["note", "id", "name"]
+
+
+def test_dollar_quote_nested_deeper_than_the_fast_path():
+    ddl = "CREATE TABLE t (a text CHECK ((((a <> $q$),($q$)))), b text DEFAULT $$x,y$$, c int);"
+    assert columns(ddl) == ["a", "b", "c"]
+
+
+def test_dollar_inside_identifiers_and_parameters_is_plain_text():
+    ddl = "CREATE TABLE t (a$b int, c int CHECK (c > $1), d int);"
+    assert columns(ddl) == ["a$b", "c", "d"]
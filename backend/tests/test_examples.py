@@ -0,0 +1,26 @@
+import pytest
+
+from app.examples import Example, ExampleStore, jaccard, shingles
+from app.intent import detect_patterns
+
+STORED = [
+    "List every order with its customer name sorted by order date descending",
+    "Total amount of orders placed last month for each customer",
+]
+
+
+@pytest.mark.parametrize("stored,asked", [
+    (STORED[0], "List every order with its customer name sorted by order date ascending"),
+    (STORED[1], "Total amount of orders placed this month for each customer"),
+])
+def test_near_duplicate_refuses_a_question_differing_in_one_word(stored, asked):
+    similarity = jaccard(shingles(stored), shingles(asked))
+    example = Example(stored, frozenset(detect_patterns(stored)), "postgresql", "SELECT 1")
+    assert ExampleStore.near_duplicate([(similarity, example)], asked, detect_patterns(asked)) is None
+
+
+def test_near_duplicate_reuses_a_rephrasing_of_the_same_question():
+    stored, asked = STORED[1], "total amount of orders placed last month, for each customer?"
+    similarity = jaccard(shingles(stored), shingles(asked))
+    example = Example(stored, frozenset(detect_patterns(stored)), "postgresql", "SELECT 1")
+    assert ExampleStore.near_duplicate([(similarity, example)], asked, detect_patterns(asked)) == (similarity, example)
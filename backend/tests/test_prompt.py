@@ -0,0 +1,34 @@
+from app.intent import detect_patterns
+from app.main import SQLRequest, build_prompt
+from app.pruning import prune_schema
+from app.schemas import compile_schema
+from bench.corpus import synthetic_schema
+
+# more tables than SCHEMA_PRUNE_MIN_TABLES, small enough for the whole-schema prefix
+SCHEMA = compile_schema(synthetic_schema(12, n_cols=4, wide_every=0, quoted_every=0))
+
+
+def prompt_for(criteria: str):
+    req = SQLRequest(language="en", database="postgresql", schema_id="s", criteria=criteria)
+    view = prune_schema(SCHEMA, criteria)
+    return view, build_prompt(req, view, detect_patterns(criteria))
+
+
+def test_prefix_is_identical_across_questions_on_a_large_schema():
+    orders_view, orders = prompt_for("total amount of orders per user")
+    staff_view, staff = prompt_for("employees with the highest salary in each department")
+
+    # pruning picked different tables, but the cached prefix does not follow it
+    assert orders_view.tables != staff_view.tables
+    assert orders.system == staff.system
+    assert "RELEVANT TABLES" in orders.user
+    assert orders.user != staff.user
+
+
+def test_report_counts_the_whole_prefix_and_the_focus_list():
+    view, _ = prompt_for("total amount of orders per user")
+    report = view.report()
+
+    assert view.focused
+    assert report["prompt_tokens"] > report["schema_tokens"]
+    assert report["reduction"] < 0
@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+import httpx
+
+from app import main
+
+HEADERS = {"X-API-Key": main.SECRET_KEY}
+REQUEST = {
+    "schema": "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT);",
+    "criteria": "names of the users in the stream coalescing test",
+    "database": "sqlite",
+    "language": "en",
+}
+
+
+def events(body: str) -> list[tuple[str, dict]]:
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def test_identical_concurrent_streams_share_one_llm_call(monkeypatch):
+    calls = 0
+
+    async def fake_stream(prompt, options=None, budget=()):
+        nonlocal calls
+        calls += 1
+        for token in ("SELECT name ", "FROM users"):
+            await asyncio.sleep(0.05)
+            yield token
+
+    monkeypatch.setattr(main.llm_client, "stream", fake_stream)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/generate-sql/stream", json=REQUEST, headers=HEADERS) for _ in range(2)
+            ))
+
+    responses = asyncio.run(run())
+
+    assert calls == 1
+    results = [events(r.text)[-1] for r in responses]
+    assert [event for event, _ in results] == ["result", "result"]
+    assert {data["sql"] for _, data in results} == {"SELECT name FROM users"}
+    assert sorted(data["cache"] for _, data in results) == ["coalesced", "miss"]
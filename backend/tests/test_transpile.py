@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+from app.schemas import compile_schema
+from app.transpile import run_transpiled
+
+SCHEMA = compile_schema("CREATE TABLE users (id SERIAL PRIMARY KEY, name VARCHAR(40), created_at TIMESTAMP);")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT name FROM users WHERE name SIMILAR TO 'a%'",
+    "SELECT name FROM users WHERE created_at > NOW() - INTERVAL '1 day'",
+    "SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY id) FROM users",
+])
+def test_sqlite_syntax_errors_skip_verification(sql):
+    assert run_transpiled(SCHEMA, sql, "postgresql") is None
+
+
+def test_missing_column_is_reported():
+    with pytest.raises(sqlite3.OperationalError, match="no such column"):
+        run_transpiled(SCHEMA, "SELECT email FROM users", "postgresql")
+
+
+def test_valid_query_runs():
+    assert run_transpiled(SCHEMA, "SELECT name FROM users ORDER BY id", "postgresql")["columns"] == ["name"]
@@ -0,0 +1,35 @@
+import pytest
+
+from app.llm import LLM_STOP, strip_markdown
+from app.validator import validate_sql_prefix
+
+
+@pytest.mark.parametrize("partial", [
+    "SELECT name FROM users WHERE note = 'a;",
+    "SELECT name FROM users WHERE note = 'a;b';",
+    "SELECT 1; -- the total",
+])
+def test_prefix_allows_semicolons_in_literals_and_a_trailing_comment(partial):
+    assert validate_sql_prefix(partial)
+
+
+def test_prefix_rejects_a_second_statement():
+    with pytest.raises(Exception, match="Multiple statements"):
+        validate_sql_prefix("SELECT 1; SELECT 2")
+
+
+LEAD_IN = "Here is the query:\n```sql\nSELECT name FROM users;\n```\nIt lists every user."
+
+
+def test_a_lead_in_line_before_the_fence_is_neither_stopped_nor_rejected():
+    # the first stop sequence is the one ending the statement
+    first_stop = min(i for stop in LLM_STOP if (i := LEAD_IN.find(stop)) != -1)
+    assert first_stop == LEAD_IN.index(";")
+    for n in range(1, len(LEAD_IN) + 1):
+        assert validate_sql_prefix(LEAD_IN[:n])
+    assert strip_markdown(LEAD_IN) == "SELECT name FROM users"
+
+
+def test_prose_without_a_fence_is_rejected():
+    with pytest.raises(Exception, match="Only SELECT"):
+        validate_sql_prefix("Sure, I can help.\nThe table you need is users")
@@ -47,6 +47,33 @@ const TEXT = {
   }
 };
 
+// Parse a text/event-stream body, calling onEvent(event, data) per message
+async function readEvents(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const message = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of message.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 function App() {
   const apiKey = getSecretKey();
   const [appLang, setAppLang] = useState("en");
@@ -58,6 +85,7 @@ function App() {
   const [copied, setCopied] = useState(false);
 
   const controllerRef = useRef(null);
+  const requestIdRef = useRef(null);
   const t = TEXT[appLang];
 
   if (!apiKey) {
@@ -75,11 +103,31 @@ function App() {
     setOutput("");
   };
 
-  const stopGenerating = () => {
+  // Abort the running request and tell the backend to stop generating for it
+  const cancelRequest = () => {
     controllerRef.current?.abort();
+    controllerRef.current = null;
+    const requestId = requestIdRef.current;
+    requestIdRef.current = null;
+    if (requestId) {
+      fetch(`http://localhost:8000/generate-sql/${requestId}/cancel`, {
+        method: "POST",
+        headers: { "X-API-Key": apiKey }
+      }).catch(() => {});
+    }
+  };
+
+  const stopGenerating = () => {
+    cancelRequest();
     setLoading(false);
   };
 
+  const editCriteria = value => {
+    setCriteria(value);
+    // the running answer is for the old criteria
+    if (loading) stopGenerating();
+  };
+
   const copyOutput = () => {
     navigator.clipboard.writeText(output);
     setCopied(true);
@@ -92,17 +140,21 @@ function App() {
       return;
     }
 
-    controllerRef.current = new AbortController();
+    cancelRequest();
+    const controller = new AbortController();
+    controllerRef.current = controller;
+    requestIdRef.current = crypto.randomUUID();
     setLoading(true);
     setOutput("");
 
     try {
-      const res = await fetch("http://localhost:8000/generate-sql", {
+      const res = await fetch("http://localhost:8000/generate-sql/stream", {
         method: "POST",
-        signal: controllerRef.current.signal,
+        signal: controller.signal,
         headers: {
           "Content-Type": "application/json",
-          "X-API-Key": apiKey
+          "X-API-Key": apiKey,
+          "X-Request-ID": requestIdRef.current
         },
         body: JSON.stringify({
           language: appLang,
@@ -127,8 +179,17 @@ function App() {
           setOutput("Failed to generate SQL");
         }
       } else {
-        const data = await res.json();
-        setOutput(data.sql || "");
+        await readEvents(res, (event, data) => {
+          if (event === "token") {
+            setOutput(prev => prev + data.text);
+          } else if (event === "repair") {
+            setOutput("");
+          } else if (event === "result") {
+            setOutput(data.sql || "");
+          } else if (event === "error") {
+            setOutput(data.detail || "Failed to generate SQL");
+          }
+        });
       }
     } catch (err) {
       if (err.name !== "AbortError") {
@@ -136,7 +197,12 @@ function App() {
       }
     }
 
-    setLoading(false);
+    // a newer request owns the loading state now
+    if (controllerRef.current === controller) {
+      controllerRef.current = null;
+      requestIdRef.current = null;
+      setLoading(false);
+    }
   };
 
   return (
@@ -173,7 +239,7 @@ function App() {
       <label>{t.criteriaInput}</label>
       <textarea rows={4} style={{ width: "100%" }}
         value={criteria}
-        onChange={e => setCriteria(e.target.value)}
+        onChange={e => editCriteria(e.target.value)}
         placeholder={t.criteriaPlaceholder}
       />
 